@@ -0,0 +1,126 @@
+"""
+\brief Checkpoints of a simulation.
+
+save() pickles the whole state of a simulation, between two slots: the
+engine with its event queue and timers, the motes and all their layers, the
+connectivity, the settings, the state of the random number generator and the
+size of the log file. restore() rebuilds the singletons from a checkpoint and
+truncates the log file back to that size; running the restored engine then
+writes the same log, byte for byte, as the original run did after the
+checkpoint.
+
+Everything reachable from the engine is pickled, including the scheduled
+callbacks: they have to be bound methods, or functools.partial objects of
+bound methods, rather than closures. Threads, locks and files are recreated
+on restoration; K7 traces are reopened at the position they were read up to.
+
+With the "exec_numSlotframesPerCheckpoint" setting, the engine takes a
+checkpoint periodically, next to the log file ("checkpoint.pkl" next to
+"output.dat"); a crash report gives the last one.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+import copyreg
+import os
+import pickle
+import random
+import tempfile
+import types
+
+from future.utils import PY2
+
+from . import SimSettings
+from . import SimLog
+from . import Connectivity
+
+# =========================== defines =========================================
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+# Python 2 has no os.replace(); os.rename() is atomic on POSIX
+replace_file = getattr(os, u'replace', os.rename)
+
+# Python 2 can't pickle bound methods, which the scheduled callbacks are;
+# pickle them as Python 3 does
+if PY2:
+    def _reduce_method(method):
+        return (getattr, (method.__self__, method.__func__.__name__))
+    copyreg.pickle(types.MethodType, _reduce_method)
+
+# =========================== helpers =========================================
+
+def get_checkpoint_file_path(log_file_path):
+    """ 'output_cpu0.dat' -> 'checkpoint_cpu0.pkl' """
+    (dirname, basename) = os.path.split(log_file_path)
+    basename = os.path.splitext(basename)[0].replace(u'output', u'checkpoint', 1)
+    return os.path.join(dirname, basename + u'.pkl')
+
+def save(engine, file_path):
+    """
+    Save the simulation run by engine to a file. The engine mustn't be in the
+    middle of a slot: call save() from a synchronous engine (e.g. after
+    run_until()) or let the engine take periodic checkpoints.
+    """
+    assert not engine.slotEvents
+
+    simlog = SimLog.SimLog()
+    simlog.flush()
+    checkpoint = {
+        u'version':      CHECKPOINT_FORMAT_VERSION,
+        u'engine':       engine,
+        u'settings':     engine.settings,
+        u'connectivity': engine.connectivity,
+        u'log':          simlog,
+        u'log_offset':   simlog.log_output_file.tell(),
+        u'random_state': random.getstate(),
+    }
+
+    # replace the previous checkpoint only once the new one is complete
+    (fd, tmp_file_path) = tempfile.mkstemp(
+        dir=os.path.dirname(file_path) or u'.'
+    )
+    with os.fdopen(fd, u'wb') as f:
+        pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+    replace_file(tmp_file_path, file_path)
+
+def restore(file_path):
+    """
+    Restore a simulation saved by save(); return its engine, which is
+    started, or run, like a new one.
+    """
+
+    # unpickling a singleton would update the live instance, if any
+    for cls in [
+            SimSettings.SimSettings,
+            SimLog.SimLog,
+            Connectivity.Connectivity
+        ]:
+        if cls._instance is not None:
+            raise EnvironmentError(
+                u'{0} singleton still alive'.format(cls.__name__)
+            )
+
+    with open(file_path, u'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint[u'version'] != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError(
+            u'{0} has version {1}, expected {2}'.format(
+                file_path,
+                checkpoint[u'version'],
+                CHECKPOINT_FORMAT_VERSION
+            )
+        )
+
+    # the unpickled objects are the new singletons
+    for key in [u'settings', u'log', u'connectivity', u'engine']:
+        cls = type(checkpoint[key])
+        assert cls._init is False
+        cls._instance = checkpoint[key]
+        cls._init     = True
+
+    random.setstate(checkpoint[u'random_state'])
+    checkpoint[u'log'].reopen(checkpoint[u'log_offset'])
+
+    return checkpoint[u'engine']
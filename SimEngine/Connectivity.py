@@ -4,14 +4,29 @@ Creates a connectivity matrix and provide methods to get the connectivity
 between two motes.
 
 The connectivity matrix is indexed by source id, destination id and channel.
-Each cell of the matrix is a dict with the fields `pdr` and `rssi`
+Each cell of the matrix has a `pdr` and an `rssi` value; how they are stored
+is selected with the `conn_storage` setting (see ConnectivityStorage.py).
 
 The connectivity matrix can be filled statically at startup or be updated along
-time if a connectivity trace is given.
-
-The propagate() method is called at every slot. It loops through the
-transmissions occurring during that slot and checks if the transmission fails or
-succeeds.
+time if a connectivity trace is given. With the `conn_trace_cache` setting,
+a trace is compiled once into memory-mapped arrays (see K7Trace.py) and the
+rows of each ASN are applied to the matrix at once.
+
+The propagate() method is called at every slot where at least one radio is
+active; radios register themselves with register_active_radio(). It loops
+through the transmissions occurring during that slot and checks if the
+transmission fails or succeeds. With the `conn_propagate` setting set to
+`vectorized`, the receptions on a channel are resolved for all the listeners
+at once with NumPy instead of listener by listener. The two don't draw the
+same random numbers, in the same order, and don't treat the interferers the
+same way: with the same seed, they give different logs, each reproducible.
+
+With the `conn_scanning_pool` setting, the unsynchronized motes listening for
+EBs don't turn their radio on at every slot: they join a scanning pool (see
+start_scanning()). At a slot where EBs are sent, propagate() draws the
+channel of all the motes of the pool at once and adds the ones which can
+receive an EB on their channel to the listeners. The radios of the others
+account for their idle listening later, at once.
 """
 from __future__ import print_function
 from __future__ import absolute_import
@@ -23,17 +38,20 @@ from builtins import zip
 from builtins import str
 from builtins import object
 from past.utils import old_div
-import copy
 import sys
 import random
 import math
-import gzip
-import datetime as dt
-import json
 import itertools
 
+import numpy as np
+from future.utils import with_metaclass
+
+from . import SimContext
 from . import SimSettings
 from . import SimLog
+from . import ConnectivityStorage
+from . import RssiPdrCurve
+from . import K7Trace
 from .Mote.Mote import Mote
 from .Mote import MoteDefines as d
 
@@ -41,14 +59,19 @@ from .Mote import MoteDefines as d
 
 CONN_TYPE_TRACE         = u'trace'
 
+CONN_PROPAGATE_LOOP       = u'loop'
+CONN_PROPAGATE_VECTORIZED = u'vectorized'
+
+# scanning_since of a mote which isn't in the scanning pool
+NOT_SCANNING            = -1
+
 # =========================== helpers =========================================
 
 # =========================== classes =========================================
 
-class Connectivity(object):
+class Connectivity(with_metaclass(SimContext.Singleton, object)):
     # ===== start singleton
-    _instance = None
-    _init = False
+    CONTEXT_ATTRIBUTE = u'connectivity'
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -72,9 +95,20 @@ class Connectivity(object):
         self.settings = SimSettings.SimSettings()
         self.engine   = sim_engine
         self.log      = SimLog.SimLog().log
+        self.rng      = self.engine.random_streams.get(u'propagation')
 
         # short-hands and local variables
         self.num_channels = self.settings.phy_numChans
+        self.active_radios = {} # motes whose radio is on, indexed by mote id
+        assert self.settings.conn_propagate in [
+            CONN_PROPAGATE_LOOP,
+            CONN_PROPAGATE_VECTORIZED
+        ]
+
+        # compile the RSSI-PDR curve
+        self.rssi_pdr_curve = RssiPdrCurve.load_rssi_pdr_curve(
+            self.settings.conn_rssi_pdr_curve
+        )
 
         # instantiate a connectivity matrix
         conn_class_name = self.settings.conn_class
@@ -82,8 +116,13 @@ class Connectivity(object):
         matrix_class = getattr(sys.modules[__name__], matrix_class_name)
         self.matrix = matrix_class(self)
 
-        # schedule propagation task
-        self._schedule_propagate()
+        # the scanning pool: the ASN from which each mote listens for EBs,
+        # NOT_SCANNING if it doesn't
+        self.scanning_since = np.full(
+            len(self.engine.motes),
+            NOT_SCANNING,
+            dtype = np.int64
+        )
 
     def destroy(self):
         cls           = type(self)
@@ -104,6 +143,26 @@ class Connectivity(object):
 
         return self.matrix.get_rssi(src_id, dst_id, channel)
 
+    def start_scanning(self, mote):
+        """
+        Called by TSCH, with conn_scanning_pool, instead of listening at every
+        slot: mote listens for EBs from the next slot on, until
+        stop_scanning().
+        """
+        self.scanning_since[mote.id] = self.engine.getAsn() + 1
+        mote.radio.startScanning()
+
+    def stop_scanning(self, mote):
+        self.scanning_since[mote.id] = NOT_SCANNING
+        mote.radio.stopScanning()
+
+    def register_active_radio(self, mote):
+        """ Called by Radio when it starts TX or RX in the current slot. """
+        if not self.active_radios:
+            # first active radio in this slot
+            self._schedule_propagate()
+        self.active_radios[mote.id] = mote
+
     def propagate(self):
         """ Simulate the propagation of frames in a slot. """
 
@@ -115,8 +174,15 @@ class Connectivity(object):
         transmissions_by_channel = {}
         receivers_by_channel = {}
 
+        # take the registered radios in the order of mote id
+        active_motes = [
+            self.active_radios[mote_id]
+            for mote_id in sorted(self.active_radios.keys())
+        ]
+        self.active_radios = {}
+
         # organize all transmissions and receptions by channel
-        for mote in self.engine.motes:
+        for mote in active_motes:
             # get all transmissions
             if mote.radio.state == d.RADIO_STATE_TX:
                 assert mote.radio.onGoingTransmission
@@ -148,6 +214,13 @@ class Connectivity(object):
                 # mote is idle, do nothing
                 pass
 
+        # add the scanning motes which can receive an EB
+        if self.settings.conn_scanning_pool:
+            self._add_scanning_listeners(
+                transmissions_by_channel,
+                receivers_by_channel
+            )
+
         # remove all motes that are listening to channels without any transmission
         for channel in set(receivers_by_channel.keys()) - set(transmissions_by_channel.keys()):
             assert channel not in transmissions_by_channel
@@ -171,150 +244,19 @@ class Connectivity(object):
         for channel in set(transmissions_by_channel.keys()) & set(receivers_by_channel.keys()):
             assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
 
-            for listener_id in receivers_by_channel[channel]:
-                # list the transmissions that listener can hear and lock to the earliest one
-                lockon_transmission = None
-                lockon_random_value = None
-                interfering_transmissions = []
-                detected_transmissions = 0
-
-                # deal with collisions
-                if len(transmissions_by_channel[channel]) > 1:
-                    for t in transmissions_by_channel[channel]:
-                        # random_value will be used for comparison against PDR
-                        random_value = random.random()
-
-                        peamble_pdr = self.get_pdr(
-                            src_id=t[u'tx_mote_id'],
-                            dst_id=listener_id,
-                            channel=channel,
-                        )
-
-                        # you can interpret the following line as decision for
-                        # reception of the preamble of 't'
-                        if random_value > peamble_pdr:
-                            # reception failed, continue to the next transmission
-                            continue
-
-                        # update counter
-                        detected_transmissions += 1
-
-                        # begin locking to the first heard transmission
-                        if lockon_transmission is None:
-                            lockon_transmission = t
-                            lockon_random_value = random_value
-                            continue
-
-                        # then update the locked transmission if it's earlier than the previous earliest
-                        if t[u'txTime'] < lockon_transmission[u'txTime']:
-                            # add previous locked on tranmission to the interference list
-                            interfering_transmissions += [t]
-                            # and lock to the new earliest transmission
-                            lockon_transmission = t
-                            lockon_random_value = random_value
-                        else:
-                            interfering_transmissions += [t]
-
-                    # check if it received anything
-                    if lockon_transmission is None:
-                        # nope, set the receiver to idle listen and cotinue to next one
-                        sentAck = self.engine.motes[listener_id].radio.rxDone(
-                            packet=None,
-                        )
-                        continue
-
-                    # something was received, continue execution
-                    self.log(
-                        SimLog.LOG_PROP_INTERFERENCE,
-                        {
-                            u'_mote_id': listener_id,
-                            u'channel': lockon_transmission[u'channel'],
-                            u'lockon_transmission': (
-                                lockon_transmission[u'packet']
-                            ),
-                            u'interfering_transmissions': [
-                                t[u'packet']
-                                for t in interfering_transmissions
-                            ]
-                        }
-                    )
-
-                    # calculate the resulting pdr when taking
-                    # interferers into account
-                    packet_pdr = self._compute_pdr_with_interference(
-                        listener_id=listener_id,
-                        lockon_transmission=lockon_transmission,
-                        interfering_transmissions=interfering_transmissions
-                    )
-
-                # no collision, easy peasy
-                elif len(transmissions_by_channel[channel]) == 1:
-                    # there's no point in testing the preamble here, so we'll skip it
-                    detected_transmissions = 1
-
-                    lockon_random_value = random.random()
-                    lockon_transmission = transmissions_by_channel[channel][0]
-                    packet_pdr = self.get_pdr(
-                        src_id  = lockon_transmission[u'tx_mote_id'],
-                        dst_id  = listener_id,
-                        channel = channel
-                    )
-
-                # this souldn't really happen
-                else:
-                    assert False
-
-                # lockon transmission selected
-                # all other transmissions are now intereferers
-                assert (
-                        detected_transmissions ==
-                        (len(interfering_transmissions) + 1)
+            # decide what each listener receives
+            if self.settings.conn_propagate == CONN_PROPAGATE_VECTORIZED:
+                self._receive_vectorized(
+                    channel,
+                    transmissions_by_channel[channel],
+                    receivers_by_channel[channel]
+                )
+            else:
+                self._receive(
+                    channel,
+                    transmissions_by_channel[channel],
+                    receivers_by_channel[channel]
                 )
-
-                # decide whether listener receives
-                # lockon_transmission or not
-                if lockon_random_value < packet_pdr:
-                    # listener receives!
-
-                    # lockon_transmission received correctly
-                    receivedAck = self.engine.motes[listener_id].radio.rxDone(
-                        packet=lockon_transmission[u'packet'],
-                    )
-
-                    if receivedAck and self.settings.conn_simulate_ack_drop:
-                        pdr_of_return_link = self.get_pdr(
-                            src_id=listener_id,
-                            dst_id=lockon_transmission[u'tx_mote_id'],
-                            channel=channel
-                        )
-                        receivedAck = random.random() < pdr_of_return_link
-
-                    if receivedAck:
-                        # keep track of the number of ACKs received by
-                        # that transmission
-                        lockon_transmission[u'numACKs'] += 1
-                    else:
-                        # ACK is lost in the air
-                        pass
-                else:
-                    # lockon_transmission NOT received correctly
-                    # (interference)
-                    receivedAck = self.engine.motes[listener_id].radio.rxDone(
-                        packet=None,
-                    )
-                    self.log(
-                        SimLog.LOG_PROP_DROP_LOCKON,
-                        {
-                            u'_mote_id': listener_id,
-                            u'channel': lockon_transmission[u'channel'],
-                            u'lockon_transmission': (
-                                lockon_transmission[u'packet']
-                            )
-                        }
-                    )
-                    assert receivedAck is False
-
-                # done processing this listener
 
             # after processing all listeners send back ACK to transmitter if possible
             for t in transmissions_by_channel[channel]:
@@ -332,24 +274,395 @@ class Connectivity(object):
                 self.engine.motes[t[u'tx_mote_id']].radio.txDone(isACKed)
 
         # verify all radios off
-        for mote in self.engine.motes:
+        for mote in active_motes:
             assert mote.radio.state == d.RADIO_STATE_OFF
             assert mote.radio.channel is None
 
-        # schedule next propagation
-        self._schedule_propagate()
+    def _add_scanning_listeners(
+            self,
+            transmissions_by_channel,
+            receivers_by_channel
+        ):
+        """
+        Add the motes of the scanning pool which listen on a channel where an
+        EB is sent, and which have a link from the sender of that EB, to the
+        listeners of the channel.
+        """
+        asn = self.engine.getAsn()
+
+        # senders of EBs, by channel
+        eb_tx_mote_ids_by_channel = {}
+        for (channel, transmissions) in transmissions_by_channel.items():
+            eb_tx_mote_ids = [
+                t[u'tx_mote_id'] for t in transmissions
+                if t[u'packet'][u'type'] == d.PKT_TYPE_EB
+            ]
+            if eb_tx_mote_ids:
+                eb_tx_mote_ids_by_channel[channel] = eb_tx_mote_ids
+        if not eb_tx_mote_ids_by_channel:
+            return
+
+        scanning_mote_ids = np.flatnonzero(
+            (self.scanning_since != NOT_SCANNING)
+            &
+            (self.scanning_since <= asn)
+        )
+        if len(scanning_mote_ids) == 0:
+            return
+
+        # each scanning mote listens on a random channel; draw them at once
+        channels = np.array(
+            self.rng.choices(
+                d.TSCH_HOPPING_SEQUENCE[:self.num_channels],
+                k = len(scanning_mote_ids)
+            )
+        )
+
+        for channel in sorted(eb_tx_mote_ids_by_channel):
+            listener_ids = scanning_mote_ids[channels == channel]
+            if len(listener_ids) == 0:
+                continue
+            pdr = self.matrix.get_pdr_submatrix(
+                eb_tx_mote_ids_by_channel[channel],
+                listener_ids.tolist(),
+                channel
+            )
+            listener_ids = listener_ids[(pdr > 0).any(axis=0)].tolist()
+            if not listener_ids:
+                continue
+
+            for listener_id in listener_ids:
+                self.engine.motes[listener_id].tsch.listen_for_EB(channel)
+            receivers_by_channel[channel] = sorted(
+                receivers_by_channel.get(channel, []) + listener_ids
+            )
+
+    def _receive(self, channel, transmissions, listener_ids):
+        """
+        Decide, listener by listener, which transmission each listener
+        receives. The numACKs counters of the transmissions are updated.
+        """
+        for listener_id in listener_ids:
+            # list the transmissions that listener can hear and lock to the earliest one
+            lockon_transmission = None
+            lockon_random_value = None
+            interfering_transmissions = []
+            detected_transmissions = 0
+
+            # deal with collisions
+            if len(transmissions) > 1:
+                for t in transmissions:
+                    # random_value will be used for comparison against PDR
+                    random_value = self.rng.random()
+
+                    peamble_pdr = self.get_pdr(
+                        src_id=t[u'tx_mote_id'],
+                        dst_id=listener_id,
+                        channel=channel,
+                    )
+
+                    # you can interpret the following line as decision for
+                    # reception of the preamble of 't'
+                    if random_value > peamble_pdr:
+                        # reception failed, continue to the next transmission
+                        continue
+
+                    # update counter
+                    detected_transmissions += 1
+
+                    # begin locking to the first heard transmission
+                    if lockon_transmission is None:
+                        lockon_transmission = t
+                        lockon_random_value = random_value
+                        continue
+
+                    # then update the locked transmission if it's earlier than the previous earliest
+                    if t[u'txTime'] < lockon_transmission[u'txTime']:
+                        # add previous locked on tranmission to the interference list
+                        interfering_transmissions += [t]
+                        # and lock to the new earliest transmission
+                        lockon_transmission = t
+                        lockon_random_value = random_value
+                    else:
+                        interfering_transmissions += [t]
+
+                # check if it received anything
+                if lockon_transmission is None:
+                    # nope, set the receiver to idle listen and cotinue to next one
+                    sentAck = self.engine.motes[listener_id].radio.rxDone(
+                        packet=None,
+                    )
+                    continue
+
+                # something was received, continue execution
+                self.log(
+                    SimLog.LOG_PROP_INTERFERENCE,
+                    {
+                        u'_mote_id': listener_id,
+                        u'channel': lockon_transmission[u'channel'],
+                        u'lockon_transmission': (
+                            lockon_transmission[u'packet']
+                        ),
+                        u'interfering_transmissions': [
+                            t[u'packet']
+                            for t in interfering_transmissions
+                        ]
+                    }
+                )
+
+                # calculate the resulting pdr when taking
+                # interferers into account
+                packet_pdr = self._compute_pdr_with_interference(
+                    listener_id=listener_id,
+                    lockon_transmission=lockon_transmission,
+                    interfering_transmissions=interfering_transmissions
+                )
+
+            # no collision, easy peasy
+            elif len(transmissions) == 1:
+                # there's no point in testing the preamble here, so we'll skip it
+                detected_transmissions = 1
+
+                lockon_random_value = self.rng.random()
+                lockon_transmission = transmissions[0]
+                packet_pdr = self.get_pdr(
+                    src_id  = lockon_transmission[u'tx_mote_id'],
+                    dst_id  = listener_id,
+                    channel = channel
+                )
+
+            # this souldn't really happen
+            else:
+                assert False
+
+            # lockon transmission selected
+            # all other transmissions are now intereferers
+            assert (
+                    detected_transmissions ==
+                    (len(interfering_transmissions) + 1)
+            )
+
+            # decide whether listener receives
+            # lockon_transmission or not
+            if lockon_random_value < packet_pdr:
+                # listener receives!
+
+                # lockon_transmission received correctly
+                receivedAck = self.engine.motes[listener_id].radio.rxDone(
+                    packet=lockon_transmission[u'packet'],
+                )
+
+                if receivedAck and self.settings.conn_simulate_ack_drop:
+                    pdr_of_return_link = self.get_pdr(
+                        src_id=listener_id,
+                        dst_id=lockon_transmission[u'tx_mote_id'],
+                        channel=channel
+                    )
+                    receivedAck = self.rng.random() < pdr_of_return_link
+
+                if receivedAck:
+                    # keep track of the number of ACKs received by
+                    # that transmission
+                    lockon_transmission[u'numACKs'] += 1
+                else:
+                    # ACK is lost in the air
+                    pass
+            else:
+                # lockon_transmission NOT received correctly
+                # (interference)
+                receivedAck = self.engine.motes[listener_id].radio.rxDone(
+                    packet=None,
+                )
+                self.log(
+                    SimLog.LOG_PROP_DROP_LOCKON,
+                    {
+                        u'_mote_id': listener_id,
+                        u'channel': lockon_transmission[u'channel'],
+                        u'lockon_transmission': (
+                            lockon_transmission[u'packet']
+                        )
+                    }
+                )
+                assert receivedAck is False
+
+            # done processing this listener
+
+    def _receive_vectorized(self, channel, transmissions, listener_ids):
+        """
+        Same as _receive(), with the preamble detection, the lock-on and the
+        SINR of all the listeners computed at once with NumPy.
+
+        The random values are drawn in one batch, before any rxDone() call.
+        An interfering transmission is any detected transmission other than
+        the lock-on one.
+        """
+
+        num_transmissions = len(transmissions)
+        num_listeners     = len(listener_ids)
+        tx_mote_ids       = [t[u'tx_mote_id'] for t in transmissions]
+
+        # PDR and RSSI of the links, indexed by [transmission, listener]
+        pdr = self.matrix.get_pdr_submatrix(tx_mote_ids, listener_ids, channel)
+
+        if num_transmissions == 1:
+            # no collision, no need to test the preamble
+            random_values = self.rng.random_array(num_listeners)
+            lockon_index  = np.zeros(num_listeners, dtype=int)
+            detected      = np.ones((1, num_listeners), dtype=bool)
+            packet_pdr    = pdr[0]
+            lockon_random_values = random_values
+        else:
+            # one random value per transmission and listener, drawn listener
+            # by listener as _receive() does
+            random_values = self.rng.random_array(
+                num_listeners * num_transmissions
+            ).reshape(num_listeners, num_transmissions).T
+
+            # preamble detection
+            detected = random_values <= pdr
+
+            # lock on the earliest detected transmission
+            tx_time = np.array([t[u'txTime'] for t in transmissions])
+            lockon_index = np.argmin(
+                np.where(detected, tx_time[:, np.newaxis], np.inf),
+                axis = 0
+            )
+            listener_index = np.arange(num_listeners)
+            lockon_random_values = random_values[lockon_index, listener_index]
+
+            # the other detected transmissions are interfering
+            interfering = detected.copy()
+            interfering[lockon_index, listener_index] = False
+
+            # compute the SINR; RSSI values below the noise level give no
+            # signal and no interference
+            rssi = self.matrix.get_rssi_submatrix(
+                tx_mote_ids,
+                listener_ids,
+                channel
+            )
+            noise_dBm = np.array(
+                [
+                    self.engine.motes[listener_id].radio.noisepower
+                    for listener_id in listener_ids
+                ],
+                dtype = float
+            )
+            noise_mW  = np.power(10.0, noise_dBm / 10.0)
+            rx_mW     = np.power(10.0, rssi / 10.0) - noise_mW
+            signal_mW = rx_mW[lockon_index, listener_index]
+            interference_mW = np.where(
+                interfering,
+                np.maximum(rx_mW, 0.0),
+                0.0
+            ).sum(axis=0)
+            with np.errstate(divide=u'ignore', invalid=u'ignore'):
+                sinr_dB = 10 * np.log10(
+                    signal_mW / (interference_mW + noise_mW)
+                )
+                interference_rssi = 10 * np.log10(
+                    np.power(10.0, (sinr_dB + noise_dBm) / 10.0) + noise_mW
+                )
+
+            # compute the resulting PDR; a signal below the noise level is
+            # never received
+            packet_pdr = np.where(
+                signal_mW < 0.0,
+                0.0,
+                (
+                    pdr[lockon_index, listener_index] *
+                    self.rssi_pdr_curve.to_pdr_array(
+                        np.where(signal_mW < 0.0, 0.0, interference_rssi)
+                    )
+                )
+            )
+
+        received = lockon_random_values < packet_pdr
+        is_detected = detected.any(axis=0)
+
+        # hand the outcomes to the radios, in the order of the listeners
+        for (i, listener_id) in enumerate(listener_ids):
+            radio = self.engine.motes[listener_id].radio
+
+            if not is_detected[i]:
+                # nothing heard, the listener idle listened
+                radio.rxDone(packet=None)
+                continue
+
+            lockon_transmission = transmissions[lockon_index[i]]
+
+            if num_transmissions > 1:
+                self.log(
+                    SimLog.LOG_PROP_INTERFERENCE,
+                    {
+                        u'_mote_id': listener_id,
+                        u'channel': lockon_transmission[u'channel'],
+                        u'lockon_transmission': (
+                            lockon_transmission[u'packet']
+                        ),
+                        u'interfering_transmissions': [
+                            t[u'packet']
+                            for (j, t) in enumerate(transmissions)
+                            if interfering[j, i]
+                        ]
+                    }
+                )
+
+            if received[i]:
+                # listener receives!
+                receivedAck = radio.rxDone(
+                    packet=lockon_transmission[u'packet'],
+                )
+
+                if receivedAck and self.settings.conn_simulate_ack_drop:
+                    pdr_of_return_link = self.get_pdr(
+                        src_id=listener_id,
+                        dst_id=lockon_transmission[u'tx_mote_id'],
+                        channel=channel
+                    )
+                    receivedAck = self.rng.random() < pdr_of_return_link
+
+                if receivedAck:
+                    lockon_transmission[u'numACKs'] += 1
+            else:
+                # lockon_transmission NOT received correctly
+                receivedAck = radio.rxDone(
+                    packet=None,
+                )
+                self.log(
+                    SimLog.LOG_PROP_DROP_LOCKON,
+                    {
+                        u'_mote_id': listener_id,
+                        u'channel': lockon_transmission[u'channel'],
+                        u'lockon_transmission': (
+                            lockon_transmission[u'packet']
+                        )
+                    }
+                )
+                assert receivedAck is False
 
     def _schedule_propagate(self):
         '''
-        schedule a propagation task in the middle of the next slot.
-        FIXME: only schedule for next active slot.
+        schedule a propagation task in the middle of the current slot, or of
+        the next slot if the middle of the current slot has passed (e.g. the
+        radio is started outside of a slot).
         '''
-        self.engine.scheduleAtAsn(
-            asn              = self.engine.getAsn() + 1,
-            cb               = self.propagate,
-            uniqueTag        = (None, u'Connectivity.propagate'),
-            intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
-        )
+        if (
+                (self.engine.intraSlotOrder is not None)
+                and
+                (self.engine.intraSlotOrder < d.INTRASLOTORDER_PROPAGATE)
+            ):
+            self.engine.scheduleAtCurrentAsn(
+                cb               = self.propagate,
+                intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
+            )
+        else:
+            self.engine.scheduleAtAsn(
+                asn              = self.engine.getAsn() + 1,
+                cb               = self.propagate,
+                uniqueTag        = (None, u'Connectivity.propagate'),
+                intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
+            )
 
     def _get_listener_id_list(self, channel):
         returnVal = []
@@ -421,7 +734,7 @@ class Connectivity(object):
         )
 
         # PDR of the interfering transmissions
-        interference_pdr = self._rssi_to_pdr(interference_rssi)
+        interference_pdr = self.rssi_pdr_curve.to_pdr(interference_rssi)
 
         # === compute the resulting PDR
 
@@ -443,54 +756,6 @@ class Connectivity(object):
     def _mW_to_dBm(mW):
         return 10 * math.log10(mW)
 
-    @staticmethod
-    def _rssi_to_pdr(rssi):
-        """
-        rssi and pdr relationship obtained by experiment below
-        http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
-        """
-
-        rssi_pdr_table = {
-            -97:    0.0000,  # this value is not from experiment
-            -96:    0.1494,
-            -95:    0.2340,
-            -94:    0.4071,
-            # <-- 50% PDR is here, at RSSI=-93.6
-            -93:    0.6359,
-            -92:    0.6866,
-            -91:    0.7476,
-            -90:    0.8603,
-            -89:    0.8702,
-            -88:    0.9324,
-            -87:    0.9427,
-            -86:    0.9562,
-            -85:    0.9611,
-            -84:    0.9739,
-            -83:    0.9745,
-            -82:    0.9844,
-            -81:    0.9854,
-            -80:    0.9903,
-            -79:    1.0000,  # this value is not from experiment
-        }
-
-        minRssi = min(rssi_pdr_table.keys())
-        maxRssi = max(rssi_pdr_table.keys())
-
-        floorRssi = int(math.floor(rssi))
-        if  floorRssi < minRssi:
-            pdr = 0.0
-        elif floorRssi >= maxRssi:
-            pdr = 1.0
-        else:
-            pdrLow  = rssi_pdr_table[floorRssi]
-            pdrHigh = rssi_pdr_table[floorRssi+1]
-            # linear interpolation
-            pdr = (pdrHigh - pdrLow) * (rssi - float(floorRssi)) + pdrLow
-
-        assert 0 <= pdr <= 1.0
-
-        return pdr
-
 
 class ConnectivityMatrixBase(object):
     LINK_PERFECT = {u'pdr' : 1.00, u'rssi':  -10}
@@ -499,23 +764,24 @@ class ConnectivityMatrixBase(object):
     def __init__(self, connectivity):
         # local variables
         self.mote_id_list = [mote.id for mote in connectivity.engine.motes]
+        self.connectivity = connectivity
         self.engine = connectivity.engine
         self.settings = connectivity.settings
         self.log = connectivity.log
-        self._matrix = {}
 
         # short hands
         self.num_channels = self.settings.phy_numChans
 
         # at the beginning, connectivity matrix indicates no connectivity at all
-        for src_id in self.mote_id_list:
-            self._matrix[src_id] = {}
-            for dst_id in self.mote_id_list:
-                self._matrix[src_id][dst_id] = {}
-                for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-                    self._matrix[src_id][dst_id][channel] = copy.copy(
-                        self.LINK_NONE
-                    )
+        storage_class = ConnectivityStorage.get_storage_class(
+            self.settings.conn_storage
+        )
+        self._storage = storage_class(
+            self.mote_id_list,
+            d.TSCH_HOPPING_SEQUENCE[:self.num_channels],
+            self.LINK_NONE,
+            self.settings
+        )
 
         self._additional_initialization()
 
@@ -525,24 +791,57 @@ class ConnectivityMatrixBase(object):
         pass
 
     def set_pdr(self, src_id, dst_id, channel, pdr):
-        self._matrix[src_id][dst_id][channel][u'pdr'] = pdr
+        self._storage.set_pdr(src_id, dst_id, channel, pdr)
 
     def set_pdr_both_directions(self, mote_id_1, mote_id_2, channel, pdr):
-        self._matrix[mote_id_1][mote_id_2][channel][u'pdr'] = pdr
-        self._matrix[mote_id_2][mote_id_1][channel][u'pdr'] = pdr
+        self._storage.set_pdr(mote_id_1, mote_id_2, channel, pdr)
+        self._storage.set_pdr(mote_id_2, mote_id_1, channel, pdr)
 
     def get_pdr(self, src_id, dst_id, channel):
-        return self._matrix[src_id][dst_id][channel][u'pdr']
+        return self._storage.get_pdr(src_id, dst_id, channel)
 
     def set_rssi(self, src_id, dst_id, channel, rssi):
-        self._matrix[src_id][dst_id][channel][u'rssi'] = rssi
+        self._storage.set_rssi(src_id, dst_id, channel, rssi)
 
     def set_rssi_both_directions(self, mote_id_1, mote_id_2, channel, rssi):
-        self._matrix[mote_id_1][mote_id_2][channel][u'rssi'] = rssi
-        self._matrix[mote_id_2][mote_id_1][channel][u'rssi'] = rssi
+        self._storage.set_rssi(mote_id_1, mote_id_2, channel, rssi)
+        self._storage.set_rssi(mote_id_2, mote_id_1, channel, rssi)
 
     def get_rssi(self, src_id, dst_id, channel):
-        return self._matrix[src_id][dst_id][channel][u'rssi']
+        return self._storage.get_rssi(src_id, dst_id, channel)
+
+    def set_link_both_directions(self, mote_id_1, mote_id_2, pdr, rssi):
+        # same PDR and RSSI on every channel
+        self._storage.set_link(mote_id_1, mote_id_2, pdr, rssi)
+        self._storage.set_link(mote_id_2, mote_id_1, pdr, rssi)
+
+    def set_links(self, src_ids, dst_ids, channels, pdr, rssi):
+        # many entries at once, from arrays; the last one wins
+        self._storage.set_links(src_ids, dst_ids, channels, pdr, rssi)
+
+    # bulk getters, returning NumPy arrays indexed by mote id; see
+    # ConnectivityStorage.py
+
+    def get_pdr_row(self, src_id, channel):
+        return self._storage.get_pdr_row(src_id, channel)
+
+    def get_rssi_row(self, src_id, channel):
+        return self._storage.get_rssi_row(src_id, channel)
+
+    def get_pdr_submatrix(self, src_ids, dst_ids, channel):
+        return self._storage.get_pdr_submatrix(src_ids, dst_ids, channel)
+
+    def get_rssi_submatrix(self, src_ids, dst_ids, channel):
+        return self._storage.get_rssi_submatrix(src_ids, dst_ids, channel)
+
+    def get_neighbors(self, src_id, channel):
+        return self._storage.get_neighbors(src_id, channel)
+
+    def get_pdr_matrix(self, channel):
+        return self._storage.get_pdr_matrix(channel)
+
+    def get_rssi_matrix(self, channel):
+        return self._storage.get_rssi_matrix(channel)
 
     def dump(self):
         output = []
@@ -550,21 +849,21 @@ class ConnectivityMatrixBase(object):
 
         # header
         line = []
-        for src_id in self._matrix:
+        for src_id in self.mote_id_list:
             line += [str(src_id)]
         line = '\t|'.join(line)
         output  += [u'\t|'+line]
 
         # body
         channel = d.TSCH_HOPPING_SEQUENCE[0]
-        for src_id in self._matrix:
+        for src_id in self.mote_id_list:
             line = []
             line += [str(src_id)]
-            for dst_id in self._matrix[src_id]:
+            for dst_id in self.mote_id_list:
                 if src_id == dst_id:
                     line += [u'N/A']
                 else:
-                    line += [str(self._matrix[src_id][dst_id][channel][u'pdr'])]
+                    line += [str(self.get_pdr(src_id, dst_id, channel))]
             line = u'\t|'.join(line)
             output += [line]
 
@@ -623,99 +922,81 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
     def _additional_initialization(self):
         """Fill the matrix using the connectivity trace file.  The
         connectivity matrix is initialized with values representing
-        the absence of a link.  The connectivity trace file is then
-        loaded into memory (connectivity values and trace meta
-        information).
+        the absence of a link.  The trace meta information is then
+        loaded; the connectivity values are read from the trace file
+        as the simulation advances.
         """
 
         # additional local variables
-        self.trace = []
-        self.start_date = None
-        # the offset at which we stopped reading the trace
-        self.trace_position = 0
+        if self.settings.conn_trace_cache:
+            trace_class = K7Trace.K7TraceCache
+        else:
+            trace_class = K7Trace.K7TraceReader
+        self.trace = trace_class(
+            self.settings.conn_trace,
+            self.settings.tsch_slotDuration,
+            self.LINK_NONE[u'rssi']
+        )
+        self.trace_header = self.trace.header
+        self.start_date = self.trace.start_date
         self.asn_of_next_update = 0
 
-        # load trace into memory and save metas (headers)
-        with gzip.open(self.settings.conn_trace, u'r') as tracefile:
-            self.trace_header = json.loads(tracefile.readline().decode('utf-8'))
-            self.csv_header = tracefile.readline().decode('utf-8').strip().split(u',')
-            self.start_date = dt.datetime.strptime(
-                self.trace_header[u'start_date'],
-                u'%Y-%m-%dT%H:%M:%S.%f'
-            )
-            stop_date = dt.datetime.strptime(
-                self.trace_header[u'stop_date'],
-                u'%Y-%m-%dT%H:%M:%S.%f'
-            )
-
-            # check if the simulation settings match the trace file
+        # check if the simulation settings match the trace file
 
-            if self.settings.exec_numMotes != self.trace_header[u'node_count']:
-                print(
-                    u'Wrong configuration. exec_numMotes is {0}, should be {1}'.format(
-                        self.settings.exec_numMotes,
-                        self.trace_header[u'node_count']
-                    )
-                )
-                assert (
-                    self.settings.exec_numMotes ==
+        if self.settings.exec_numMotes != self.trace_header[u'node_count']:
+            print(
+                u'Wrong configuration. exec_numMotes is {0}, should be {1}'.format(
+                    self.settings.exec_numMotes,
                     self.trace_header[u'node_count']
                 )
+            )
+            self.trace.close()
+            assert (
+                self.settings.exec_numMotes ==
+                self.trace_header[u'node_count']
+            )
 
-            # check if all the channels in the hopping sequence are
-            # covered by ones listed in the header
-            if set(d.TSCH_HOPPING_SEQUENCE).issubset(
-                    set(self.trace_header[u'channels'])
-                ):
-                # the channels listed in the trace file are valid
-                pass
-            else:
-                raise ValueError(
-                    u'All the channels in TSCH_HOPPING_SEQUENCE ' +
-                    u'must be covered by the trace file\n' +
-                    u'TSCH_HOPPING_SEQUENCE: {0}\n'.format(
-                        sorted(d.TSCH_HOPPING_SEQUENCE)
-                    ) +
-                    u'Channels in the trace: {0}\n'.format(
-                        sorted(self.trace_header[u'channels'])
-                    ) +
-                    u'Check SimEngine/Mote/MoteDefines.py'
-                )
-
-            numSlotframes = (
-                old_div((stop_date - self.start_date).total_seconds(),
-                self.settings.tsch_slotDuration)
+        # check if all the channels in the hopping sequence are
+        # covered by ones listed in the header
+        if set(d.TSCH_HOPPING_SEQUENCE).issubset(
+                set(self.trace_header[u'channels'])
+            ):
+            # the channels listed in the trace file are valid
+            pass
+        else:
+            self.trace.close()
+            raise ValueError(
+                u'All the channels in TSCH_HOPPING_SEQUENCE ' +
+                u'must be covered by the trace file\n' +
+                u'TSCH_HOPPING_SEQUENCE: {0}\n'.format(
+                    sorted(d.TSCH_HOPPING_SEQUENCE)
+                ) +
+                u'Channels in the trace: {0}\n'.format(
+                    sorted(self.trace_header[u'channels'])
+                ) +
+                u'Check SimEngine/Mote/MoteDefines.py'
             )
-            if self.settings.exec_numSlotframesPerRun > numSlotframes:
-                raise ValueError(u'exec_numSlotframesPerRun is too long')
-
-            initialization_is_done = False
-            initialized_links = set([])
-
-            for line in tracefile:
-                row = self._parse_line(line.decode('utf-8'))
-                # make sure that PDR is a float
-                row[u'pdr'] = float(row[u'pdr'])
-                if not initialization_is_done:
-                    link = (row[u'src_id'], row[u'dst_id'], row[u'channel'])
-                    if link in initialized_links:
-                        # we've already initlized this link
-                        initialization_is_done = True
-                        # we don't need to keep the links any more
-                        initialized_links = None
-                    else:
-                        # this link has not been initialized. for this
-                        # purpose, set ASN 0 to this row so that this
-                        # row will be used to in the first _update()
-                        # call
-                        row[u'asn'] = 0
-                        # add the link to the list
-                        initialized_links.add(link)
-                self.trace.append(row)
-
-            # initialize the matrix with the first part of the trace
-            # file
-            self._update()
+
+        numSlotframes = (
+            old_div((self.trace.stop_date - self.start_date).total_seconds(),
+            self.settings.tsch_slotDuration)
+        )
+        if self.settings.exec_numSlotframesPerRun > numSlotframes:
+            self.trace.close()
+            raise ValueError(u'exec_numSlotframesPerRun is too long')
+
+        # initialize the matrix with the first part of the trace
+        # file
+        if self.settings.conn_trace_cache:
+            assert self.trace.peek_asn() is not None
+        else:
+            assert self.trace.peek() is not None
+        self._update()
+
+    @property
+    def trace_position(self):
+        # the offset at which we stopped reading the trace
+        return self.trace.position
 
     # ======================= private =========================================
 
@@ -723,28 +1004,36 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
         assert self.asn_of_next_update >= self.engine.getAsn()
         # Read the connectivity trace and fill the connectivity
         # matrix
-        assert self.trace_position < len(self.trace)
         start_trace_position = self.trace_position
-        while True:
-            row = self.trace[self.trace_position]
+        if self.settings.conn_trace_cache:
+            while True:
+                asn = self.trace.peek_asn()
 
-            # return next update ASN
+                if (asn is None) or (asn > self.engine.asn):
+                    # we hit the bottom of the trace, or the next update
+                    asn_of_next_update = asn
+                    break
 
-            if row[u'asn'] > self.engine.asn:
-                asn_of_next_update = row[u'asn']
-                break
+                # update matrix values, all the rows of an ASN at once
+                self._set_connectivity_bulk(self.trace.pop_rows())
+        else:
+            while True:
+                row = self.trace.peek()
+
+                if row is None:
+                    # we hit the bottom of the trace
+                    asn_of_next_update = None
+                    break
 
-            # update matrix value
+                # return next update ASN
 
-            self._set_connectivity(row)
+                if row[u'asn'] > self.engine.asn:
+                    asn_of_next_update = row[u'asn']
+                    break
 
-            # increment trace_position
-            self.trace_position += 1
+                # update matrix value
 
-            if self.trace_position == len(self.trace):
-                # we hit the bottom of the trace
-                asn_of_next_update = None
-                break
+                self._set_connectivity(self.trace.pop())
 
         # update 'asn_of_next_update' with a new ASN, which can be
         # None
@@ -789,40 +1078,36 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
                     row[u'mean_rssi']
                 )
 
-    def _parse_line(self, line):
-
-        # === read and parse line
-
-        vals = line.strip().split(u',')
-        row = dict(list(zip(self.csv_header, vals)))
-
-        # === change row format
-
-        row[u'src_id'] = int(row[u'src']) if row[u'src'] else None
-        del row[u'src']
-        row[u'dst_id'] = int(row[u'dst']) if row[u'dst'] else None
-        del row[u'dst']
-        row[u'channel'] = int(row[u'channel']) if row[u'channel'] else None
-        row[u'datetime'] = dt.datetime.strptime(
-            row[u'datetime'], u'%Y-%m-%dT%H:%M:%S.%f'
+    def _set_connectivity_bulk(self, rows):
+        """Same as _set_connectivity(), for an array of rows of a
+        compiled trace (see K7Trace.K7TraceCache), keeping their order.
+        """
+        channels = np.array(d.TSCH_HOPPING_SEQUENCE[:self.num_channels])
+        all_channels = (rows[u'channel'] == K7Trace.CACHE_ALL_CHANNELS)
+
+        # one entry per row and channel it applies to
+        counts = np.where(
+            all_channels,
+            len(channels),
+            np.isin(rows[u'channel'], channels)
         )
-
-        # rssi
-
-        if row[u'mean_rssi'] == u'' or (row[u'mean_rssi'] == u'None'):
-            row[u'mean_rssi'] = self.LINK_NONE[u'rssi']
-        else:
-            row[u'mean_rssi'] = float(row[u'mean_rssi'])
-
-        # === add ASN value to row
-
-        time_delta = row[u'datetime'] - self.start_date
-        row[u'asn'] = int(
-            time_delta.total_seconds() /
-            float(self.settings.tsch_slotDuration)
+        row_indices = np.repeat(np.arange(len(rows)), counts)
+        # a copy; NumPy < 1.17 keeps the read-only flag of the cache
+        entry_channels = rows[u'channel'][row_indices].copy()
+        is_expanded = all_channels[row_indices]
+        nth_channel = (
+            np.arange(len(row_indices)) -
+            np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        entry_channels[is_expanded] = channels[nth_channel[is_expanded]]
+
+        self.set_links(
+            rows[u'src_id'][row_indices],
+            rows[u'dst_id'][row_indices],
+            entry_channels,
+            rows[u'pdr'][row_indices],
+            rows[u'mean_rssi'][row_indices]
         )
-
-        return row
 
 
 class ConnectivityMatrixRandom(ConnectivityMatrixBase):
@@ -834,12 +1119,22 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
 
     Computed PDR and RSSI are computed on the fly; they could vary at
     every transmission.
+
+    With 'conn_random_init_fast', the motes are placed by a faster algorithm
+    which gives statistically identical placements, but not the same ones as
+    the default algorithm for a given seed: tentative coordinates are scored
+    with NumPy only against the deployed motes within radio range, found with
+    a uniform grid. Links between motes out of radio range of each other,
+    which can't be heard above the noise, are left as LINK_NONE.
     """
 
     def _additional_initialization(self):
         # additional local variables
         self.coordinates = {}  # (x, y) indexed by mote_id
-        self.pister_hack = PisterHackModel(self.engine)
+        self.pister_hack = PisterHackModel(
+            self.engine,
+            self.connectivity.rssi_pdr_curve
+        )
 
         # ConnectivityRandom doesn't need the connectivity matrix. Instead, it
         # initializes coordinates of the motes. Its algorithm is:
@@ -859,12 +1154,21 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
         #                the coordinate of the mote
         #     step.2-5 otherwise, go back to step.2-1
 
+        assert (
+            self.settings.conn_random_init_min_neighbors <=
+            self.settings.exec_numMotes
+        )
+
+        if self.settings.conn_random_init_fast:
+            self._deploy_motes_fast()
+        else:
+            self._deploy_motes()
+
+    def _deploy_motes(self):
         # for quick access
         square_side        = self.settings.conn_random_square_side
         init_min_pdr       = self.settings.conn_random_init_min_pdr
-        init_min_neighbors = self.settings.conn_random_init_min_neighbors
-
-        assert init_min_neighbors <= self.settings.exec_numMotes
+        motes              = dict([(mote.id, mote) for mote in self.engine.motes])
 
         # determine coordinates of the motes
         for target_mote_id in self.mote_id_list:
@@ -883,122 +1187,177 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
                 )
 
                 # count deployed motes who have enough PDR values to this
-                # mote
+                # mote; remember the links until the coordinate is fixed
                 good_pdr_count = 0
-                base_channel = d.TSCH_HOPPING_SEQUENCE[0]
+                links = [] # (deployed_mote_id, rssi, pdr)
                 for deployed_mote_id in self.coordinates:
                     rssi = self.pister_hack.compute_rssi(
                         {
-                            u'mote'      : self._get_mote(target_mote_id),
+                            u'mote'      : motes[target_mote_id],
                             u'coordinate': coordinate
                         },
                         {
-                            u'mote'      : self._get_mote(deployed_mote_id),
+                            u'mote'      : motes[deployed_mote_id],
                             u'coordinate': self.coordinates[deployed_mote_id]
                         }
                     )
                     pdr = self.pister_hack.convert_rssi_to_pdr(rssi)
-                    # memorize the rssi and pdr values at the base channel
-                    self.set_pdr_both_directions(
-                        target_mote_id,
-                        deployed_mote_id,
-                        base_channel,
-                        pdr
-                    )
-                    self.set_rssi_both_directions(
-                        target_mote_id,
-                        deployed_mote_id,
-                        base_channel,
-                        rssi
-                    )
+                    links.append((deployed_mote_id, rssi, pdr))
 
                     if init_min_pdr <= pdr:
                         good_pdr_count += 1
 
-                # determine whether we deploy this mote or not
-                if (
-                        (
-                            (len(self.coordinates) <= init_min_neighbors)
-                            and
-                            (len(self.coordinates) == good_pdr_count)
-                        )
-                        or
-                        (
-                            (init_min_neighbors < len(self.coordinates))
-                            and
-                            (init_min_neighbors <= good_pdr_count)
-                        )
-                    ):
+                if self._is_deployable(good_pdr_count):
                     # fix the coordinate of the mote
                     self.coordinates[target_mote_id] = coordinate
-                    # copy the rssi and pdr values to other channels
-                    for deployed_mote_id in list(self.coordinates.keys()):
-                        rssi = self.get_rssi(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
-                        pdr  = self.get_pdr(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
-                        for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-                            if channel == base_channel:
-                                # do nothing
-                                pass
-                            else:
-                                self.set_pdr_both_directions(
-                                    target_mote_id,
-                                    deployed_mote_id,
-                                    channel,
-                                    pdr
-                                )
-                                self.set_rssi_both_directions(
-                                    target_mote_id,
-                                    deployed_mote_id,
-                                    channel,
-                                    rssi
-                                )
-
+                    self._set_links(target_mote_id, links)
                     mote_is_deployed = True
                 else:
-                    # remove memorized values at channel 0
-                    for deployed_mote_id in self.coordinates:
-                        self._clear_rssi(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
-                        self._clear_pdr(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
                     # try another random coordinate
                     continue
 
-    def _get_mote(self, mote_id):
-        # there must be a mote having mote_id. otherwise, the following line
-        # raises an exception.
-        return [mote for mote in self.engine.motes if mote.id == mote_id][0]
-
-    def _clear_rssi(self, mote_id_1, mote_id_2, channel):
-        self.set_rssi_both_directions(
-            mote_id_1,
-            mote_id_2,
-            channel,
-            self.LINK_NONE[u'rssi']
+    def _deploy_motes_fast(self):
+        # for quick access
+        square_side        = self.settings.conn_random_square_side
+        init_min_pdr       = self.settings.conn_random_init_min_pdr
+        motes              = dict([(mote.id, mote) for mote in self.engine.motes])
+        rssi_pdr_curve     = self.pister_hack.rssi_pdr_curve
+        half_shift         = PisterHackModel.PISTER_HACK_LOWER_SHIFT / 2
+
+        # radio range, in km: beyond it, the RSSI of a link is below both the
+        # noise and the lowest RSSI of the RSSI-PDR curve
+        max_gain = (
+            max([m.radio.txPower + m.radio.antennaGain for m in motes.values()]) +
+            max([m.radio.antennaGain for m in motes.values()])
         )
+        min_rssi = min(
+            min([m.radio.noisepower for m in motes.values()]),
+            rssi_pdr_curve.min_rssi
+        )
+        radio_range = self.pister_hack.compute_range_in_meters(
+            max_gain - min_rssi
+        ) / 1000.0
+
+        # PDR of a link out of radio range
+        far_pdr = rssi_pdr_curve.to_pdr(min_rssi - 1)
+
+        # the RSSI noise is drawn by NumPy, seeded from 'random'
+        rng = np.random.RandomState(random.randint(0, 2**32 - 1))
+
+        # deployed motes; their indices in the following arrays are kept in a
+        # uniform grid of radio_range-wide cells
+        deployed_mote_ids = []
+        deployed_x        = np.zeros(len(self.mote_id_list))
+        deployed_y        = np.zeros(len(self.mote_id_list))
+        deployed_gain     = np.zeros(len(self.mote_id_list))
+        grid              = {} # indices of deployed motes, by cell
+
+        def get_cell(coordinate):
+            return (
+                int(coordinate[0] // radio_range),
+                int(coordinate[1] // radio_range)
+            )
 
-    def _clear_pdr(self, mote_id_1, mote_id_2, channel):
-        self.set_rssi_both_directions(
-            mote_id_1,
-            mote_id_2,
-            channel,
-            self.LINK_NONE[u'pdr']
+        def deploy(mote_id, coordinate):
+            i = len(deployed_mote_ids)
+            deployed_mote_ids.append(mote_id)
+            deployed_x[i]    = coordinate[0]
+            deployed_y[i]    = coordinate[1]
+            deployed_gain[i] = motes[mote_id].radio.antennaGain
+            grid.setdefault(get_cell(coordinate), []).append(i)
+            self.coordinates[mote_id] = coordinate
+
+        # determine coordinates of the motes
+        for target_mote_id in self.mote_id_list:
+            if target_mote_id == 0:
+                deploy(target_mote_id, (0, 0))
+                continue
+
+            target_radio = motes[target_mote_id].radio
+            target_gain  = target_radio.txPower + target_radio.antennaGain
+
+            while True:
+                # select a tentative coordinate
+                coordinate = (
+                    square_side * random.random(),
+                    square_side * random.random()
+                )
+
+                # deployed motes within radio range
+                (cell_x, cell_y) = get_cell(coordinate)
+                near = np.array(
+                    [
+                        i
+                        for cell in itertools.product(
+                            [cell_x - 1, cell_x, cell_x + 1],
+                            [cell_y - 1, cell_y, cell_y + 1]
+                        )
+                        for i in grid.get(cell, [])
+                    ],
+                    dtype = int
+                )
+                distance = 1000 * np.hypot(
+                    deployed_x[near] - coordinate[0],
+                    deployed_y[near] - coordinate[1]
+                )
+                in_range = distance <= 1000 * radio_range
+                near     = near[in_range]
+                distance = distance[in_range]
+
+                # RSSI and PDR with them, at once
+                rssi = (
+                    target_gain +
+                    deployed_gain[near] +
+                    self.pister_hack.compute_path_gain_array(distance) -
+                    half_shift +
+                    rng.uniform(-half_shift, half_shift, len(near))
+                )
+                pdr = rssi_pdr_curve.to_pdr_array(rssi)
+
+                good_pdr_count = int(np.count_nonzero(init_min_pdr <= pdr))
+                if init_min_pdr <= far_pdr:
+                    good_pdr_count += len(deployed_mote_ids) - len(near)
+
+                if self._is_deployable(good_pdr_count):
+                    break
+
+            # fix the coordinate of the mote
+            links = [
+                (deployed_mote_ids[i], float(_rssi), float(_pdr))
+                for (i, _rssi, _pdr) in zip(near, rssi, pdr)
+            ]
+            deploy(target_mote_id, coordinate)
+            self._set_links(target_mote_id, links)
+
+    def _is_deployable(self, good_pdr_count):
+        # whether a mote having good_pdr_count neighbors with enough PDR
+        # among the deployed motes can be deployed
+        init_min_neighbors = self.settings.conn_random_init_min_neighbors
+        num_deployed_motes = len(self.coordinates)
+        return (
+            (
+                (num_deployed_motes <= init_min_neighbors)
+                and
+                (num_deployed_motes == good_pdr_count)
+            )
+            or
+            (
+                (init_min_neighbors < num_deployed_motes)
+                and
+                (init_min_neighbors <= good_pdr_count)
+            )
         )
 
+    def _set_links(self, target_mote_id, links):
+        # the same rssi and pdr values are used on all the channels
+        for (deployed_mote_id, rssi, pdr) in links:
+            self.set_link_both_directions(
+                target_mote_id,
+                deployed_mote_id,
+                pdr,
+                rssi
+            )
+
 
 class PisterHackModel(object):
 
@@ -1006,37 +1365,19 @@ class PisterHackModel(object):
     TWO_DOT_FOUR_GHZ         = 2400000000 # Hz
     SPEED_OF_LIGHT           =  299792458 # m/s
 
-    # RSSI and PDR relationship obtained by experiment; dataset was available
-    # at the link shown below:
-    # http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
-    RSSI_PDR_TABLE = {
-        -97:    0.0000,  # this value is not from experiment
-        -96:    0.1494,
-        -95:    0.2340,
-        -94:    0.4071,
-        # <-- 50% PDR is here, at RSSI=-93.6
-        -93:    0.6359,
-        -92:    0.6866,
-        -91:    0.7476,
-        -90:    0.8603,
-        -89:    0.8702,
-        -88:    0.9324,
-        -87:    0.9427,
-        -86:    0.9562,
-        -85:    0.9611,
-        -84:    0.9739,
-        -83:    0.9745,
-        -82:    0.9844,
-        -81:    0.9854,
-        -80:    0.9903,
-        -79:    1.0000,  # this value is not from experiment
-    }
-
-    def __init__(self, sim_engine):
+    # RSSI and PDR relationship obtained by experiment; see RssiPdrCurve.py
+    RSSI_PDR_TABLE = RssiPdrCurve.DEFAULT_RSSI_PDR_TABLE
+
+    def __init__(self, sim_engine, rssi_pdr_curve=None):
 
         # singleton
         self.engine   = sim_engine
 
+        # RSSI to PDR conversion
+        if rssi_pdr_curve is None:
+            rssi_pdr_curve = RssiPdrCurve.RssiPdrCurve()
+        self.rssi_pdr_curve = rssi_pdr_curve
+
         # remember what RSSI value is computed for a mote at an ASN; the same
         # RSSI value will be returned for the same motes and the ASN.
         self.rssi_cache = {} # indexed by (src_mote.id, dst_mote.id)
@@ -1067,6 +1408,29 @@ class PisterHackModel(object):
         # choosing the "mean" value
         return pr - old_div(self.PISTER_HACK_LOWER_SHIFT, 2)
 
+    def compute_path_gain_array(self, distance):
+        """
+        Vectorized 20log10(fspl) of compute_mean_rssi(), for an array of
+        distances in meters
+        """
+        return 20 * np.log10(
+            self.SPEED_OF_LIGHT /
+            (4 * math.pi * distance * self.TWO_DOT_FOUR_GHZ)
+        )
+
+    def compute_range_in_meters(self, link_budget):
+        """
+        Distance in meters beyond which the highest RSSI compute_rssi() can
+        return is lower than the transmit power and antenna gains minus
+        link_budget (dB)
+        """
+        # the highest RSSI is the free space one (mean + the half shift)
+        return (
+            self.SPEED_OF_LIGHT /
+            (4 * math.pi * self.TWO_DOT_FOUR_GHZ) *
+            math.pow(10.0, link_budget / 20.0)
+        )
+
     def compute_rssi(self, src, dst):
         """Compute RSSI between the points of a and b using Pister Hack"""
 
@@ -1089,23 +1453,7 @@ class PisterHackModel(object):
         return rssi
 
     def convert_rssi_to_pdr(self, rssi):
-        minRssi = min(self.RSSI_PDR_TABLE.keys())
-        maxRssi = max(self.RSSI_PDR_TABLE.keys())
-
-        if rssi < minRssi:
-            pdr = 0.0
-        elif rssi > maxRssi:
-            pdr = 1.0
-        else:
-            floor_rssi = int(math.floor(rssi))
-            pdr_low    = self.RSSI_PDR_TABLE[floor_rssi]
-            pdr_high   = self.RSSI_PDR_TABLE[floor_rssi + 1]
-            # linear interpolation
-            pdr = (pdr_high - pdr_low) * (rssi - float(floor_rssi)) + pdr_low
-
-        assert pdr >= 0.0
-        assert pdr <= 1.0
-        return pdr
+        return self.rssi_pdr_curve.to_pdr(rssi)
 
     @staticmethod
     def _get_distance_in_meters(a, b):
@@ -0,0 +1,531 @@
+"""
+Storage backends of the connectivity matrix.
+
+A storage holds a PDR and an RSSI value for every (source, destination,
+channel) triplet. ConnectivityMatrixBase (see Connectivity.py) creates one
+according to the "conn_storage" setting:
+
+* "dict": nested dicts, self._matrix[src_id][dst_id][channel] = {pdr, rssi}
+* "dense": two contiguous float32 NumPy arrays of shape
+  (num_motes, num_motes, num_channels), indexed by mote id and channel index
+* "sparse": per-source neighbor tables holding only the links above the
+  "conn_sparse_min_pdr"/"conn_sparse_min_rssi" floors; a value which is the
+  same on every channel is stored once. Unknown links are LINK_NONE. The
+  default RSSI floor, -97 dBm, is the lowest RSSI of the default RSSI-PDR
+  curve: the links below it have a PDR of 0, and the memory grows with the
+  number of links rather than with the square of the number of motes. A
+  transmission whose RSSI at a listener is below the floor isn't an
+  interferer there either; lower the floor (e.g. to -115 dBm, 10 dB below
+  the -105 dBm noise floor of the radios) to keep the weak interferers.
+
+Besides the scalar getters and setters, a storage provides bulk getters
+returning NumPy arrays for vectorized consumers. Those arrays may be views on
+the storage; they must not be modified.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+from builtins import range
+from builtins import zip
+from builtins import object
+import copy
+
+import numpy as np
+
+# =========================== defines =========================================
+
+CONN_STORAGE_DICT   = u'dict'
+CONN_STORAGE_DENSE  = u'dense'
+CONN_STORAGE_SPARSE = u'sparse'
+
+# =========================== body ============================================
+
+class ConnectivityStorageBase(object):
+
+    def __init__(self, mote_id_list, channels, link_none, settings):
+        # store params
+        self.mote_id_list = mote_id_list
+        self.channels     = channels
+        self.link_none    = link_none
+        self.settings     = settings
+
+    # ======================= public ==========================================
+
+    def get_pdr(self, src_id, dst_id, channel):
+        raise NotImplementedError()
+
+    def set_pdr(self, src_id, dst_id, channel, pdr):
+        raise NotImplementedError()
+
+    def get_rssi(self, src_id, dst_id, channel):
+        raise NotImplementedError()
+
+    def set_rssi(self, src_id, dst_id, channel, rssi):
+        raise NotImplementedError()
+
+    # bulk setters and getters; override them when the storage can do better
+
+    def set_link(self, src_id, dst_id, pdr, rssi):
+        """ set the same PDR and RSSI on every channel """
+        for channel in self.channels:
+            self.set_pdr(src_id, dst_id, channel, pdr)
+            self.set_rssi(src_id, dst_id, channel, rssi)
+
+    def set_links(self, src_ids, dst_ids, channels, pdr, rssi):
+        """
+        set many (src_id, dst_id, channel) entries at once, from arrays; the
+        entries are applied in order, the last one wins for a given triplet
+        """
+        for (src_id, dst_id, channel, _pdr, _rssi) in zip(
+                np.asarray(src_ids).tolist(),
+                np.asarray(dst_ids).tolist(),
+                np.asarray(channels).tolist(),
+                np.asarray(pdr).tolist(),
+                np.asarray(rssi).tolist()
+            ):
+            self.set_pdr(src_id, dst_id, channel, _pdr)
+            self.set_rssi(src_id, dst_id, channel, _rssi)
+
+    def get_pdr_row(self, src_id, channel):
+        """ PDR from src_id to every mote, indexed by destination id """
+        return np.array(
+            [
+                self.get_pdr(src_id, dst_id, channel)
+                for dst_id in self.mote_id_list
+            ],
+            dtype = np.float32
+        )
+
+    def get_rssi_row(self, src_id, channel):
+        """ RSSI from src_id to every mote, indexed by destination id """
+        return np.array(
+            [
+                self.get_rssi(src_id, dst_id, channel)
+                for dst_id in self.mote_id_list
+            ],
+            dtype = np.float32
+        )
+
+    def get_pdr_submatrix(self, src_ids, dst_ids, channel):
+        """ PDR on a channel, indexed by [index in src_ids, index in dst_ids] """
+        return np.array(
+            [
+                [self.get_pdr(src_id, dst_id, channel) for dst_id in dst_ids]
+                for src_id in src_ids
+            ],
+            dtype = float
+        )
+
+    def get_rssi_submatrix(self, src_ids, dst_ids, channel):
+        """ RSSI on a channel, indexed by [index in src_ids, index in dst_ids] """
+        return np.array(
+            [
+                [self.get_rssi(src_id, dst_id, channel) for dst_id in dst_ids]
+                for src_id in src_ids
+            ],
+            dtype = float
+        )
+
+    def get_neighbors(self, src_id, channel):
+        """
+        Return (dst_ids, pdr, rssi) arrays of the links from src_id which are
+        not LINK_NONE on the channel
+        """
+        dst_ids = np.array(self.mote_id_list)
+        pdr     = self.get_pdr_row(src_id, channel)
+        rssi    = self.get_rssi_row(src_id, channel)
+        mask    = (
+            (pdr  != self.link_none[u'pdr'])
+            |
+            (rssi != self.link_none[u'rssi'])
+        )
+        return dst_ids[mask], pdr[mask], rssi[mask]
+
+    def get_pdr_matrix(self, channel):
+        """ PDR on a channel, indexed by [source id, destination id] """
+        return np.array(
+            [self.get_pdr_row(src_id, channel) for src_id in self.mote_id_list],
+            dtype = np.float32
+        )
+
+    def get_rssi_matrix(self, channel):
+        """ RSSI on a channel, indexed by [source id, destination id] """
+        return np.array(
+            [self.get_rssi_row(src_id, channel) for src_id in self.mote_id_list],
+            dtype = np.float32
+        )
+
+
+class ConnectivityStorageDict(ConnectivityStorageBase):
+
+    def __init__(self, mote_id_list, channels, link_none, settings):
+        super(ConnectivityStorageDict, self).__init__(
+            mote_id_list,
+            channels,
+            link_none,
+            settings
+        )
+
+        # at the beginning, connectivity matrix indicates no connectivity at all
+        self._matrix = {}
+        for src_id in self.mote_id_list:
+            self._matrix[src_id] = {}
+            for dst_id in self.mote_id_list:
+                self._matrix[src_id][dst_id] = {}
+                for channel in self.channels:
+                    self._matrix[src_id][dst_id][channel] = copy.copy(
+                        self.link_none
+                    )
+
+    def get_pdr(self, src_id, dst_id, channel):
+        return self._matrix[src_id][dst_id][channel][u'pdr']
+
+    def set_pdr(self, src_id, dst_id, channel, pdr):
+        self._matrix[src_id][dst_id][channel][u'pdr'] = pdr
+
+    def get_rssi(self, src_id, dst_id, channel):
+        return self._matrix[src_id][dst_id][channel][u'rssi']
+
+    def set_rssi(self, src_id, dst_id, channel, rssi):
+        self._matrix[src_id][dst_id][channel][u'rssi'] = rssi
+
+    # bulk getters
+
+    def get_pdr_row(self, src_id, channel):
+        return np.array(
+            self._get_row(src_id, self.mote_id_list, channel, u'pdr'),
+            dtype = np.float32
+        )
+
+    def get_rssi_row(self, src_id, channel):
+        return np.array(
+            self._get_row(src_id, self.mote_id_list, channel, u'rssi'),
+            dtype = np.float32
+        )
+
+    def get_pdr_submatrix(self, src_ids, dst_ids, channel):
+        return self._get_submatrix(src_ids, dst_ids, channel, u'pdr')
+
+    def get_rssi_submatrix(self, src_ids, dst_ids, channel):
+        return self._get_submatrix(src_ids, dst_ids, channel, u'rssi')
+
+    # ======================= private =========================================
+
+    def _get_row(self, src_id, dst_ids, channel, field):
+        row = self._matrix[src_id]
+        return [row[dst_id][channel][field] for dst_id in dst_ids]
+
+    def _get_submatrix(self, src_ids, dst_ids, channel, field):
+        submatrix = np.empty((len(src_ids), len(dst_ids)), dtype=float)
+        for (i, src_id) in enumerate(src_ids):
+            submatrix[i] = self._get_row(src_id, dst_ids, channel, field)
+        return submatrix
+
+
+class ConnectivityStorageDense(ConnectivityStorageBase):
+    """
+    self.pdr[src_id, dst_id, channel_index] and
+    self.rssi[src_id, dst_id, channel_index] are float32 arrays.
+    """
+
+    DTYPE = np.float32
+
+    def __init__(self, mote_id_list, channels, link_none, settings):
+        super(ConnectivityStorageDense, self).__init__(
+            mote_id_list,
+            channels,
+            link_none,
+            settings
+        )
+
+        # mote ids are used as array indices
+        num_motes = len(self.mote_id_list)
+        assert list(self.mote_id_list) == list(range(num_motes))
+
+        # channel index by channel
+        self.channel_index = dict(
+            [(channel, i) for (i, channel) in enumerate(self.channels)]
+        )
+
+        # at the beginning, connectivity matrix indicates no connectivity at all
+        shape     = (num_motes, num_motes, len(self.channels))
+        self.pdr  = np.full(shape, self.link_none[u'pdr'],  dtype=self.DTYPE)
+        self.rssi = np.full(shape, self.link_none[u'rssi'], dtype=self.DTYPE)
+
+    def get_pdr(self, src_id, dst_id, channel):
+        return float(self.pdr[src_id, dst_id, self.channel_index[channel]])
+
+    def set_pdr(self, src_id, dst_id, channel, pdr):
+        self.pdr[src_id, dst_id, self.channel_index[channel]] = pdr
+
+    def get_rssi(self, src_id, dst_id, channel):
+        return float(self.rssi[src_id, dst_id, self.channel_index[channel]])
+
+    def set_rssi(self, src_id, dst_id, channel, rssi):
+        self.rssi[src_id, dst_id, self.channel_index[channel]] = rssi
+
+    def set_link(self, src_id, dst_id, pdr, rssi):
+        self.pdr[src_id, dst_id, :]  = pdr
+        self.rssi[src_id, dst_id, :] = rssi
+
+    def set_links(self, src_ids, dst_ids, channels, pdr, rssi):
+        channel_indices = np.array(
+            [self.channel_index[channel] for channel in np.asarray(channels).tolist()],
+            dtype=np.int64
+        )
+        flat_indices = np.ravel_multi_index(
+            (np.asarray(src_ids), np.asarray(dst_ids), channel_indices),
+            self.pdr.shape
+        )
+
+        # keep the last entry of each triplet; NumPy doesn't specify which
+        # value a repeated index gets
+        (flat_indices, last) = np.unique(flat_indices[::-1], return_index=True)
+        last = len(channel_indices) - 1 - last
+
+        self.pdr.ravel()[flat_indices]  = np.asarray(pdr)[last]
+        self.rssi.ravel()[flat_indices] = np.asarray(rssi)[last]
+
+    # bulk getters (views)
+
+    def get_pdr_row(self, src_id, channel):
+        return self.pdr[src_id, :, self.channel_index[channel]]
+
+    def get_rssi_row(self, src_id, channel):
+        return self.rssi[src_id, :, self.channel_index[channel]]
+
+    def get_pdr_matrix(self, channel):
+        return self.pdr[:, :, self.channel_index[channel]]
+
+    def get_pdr_submatrix(self, src_ids, dst_ids, channel):
+        return self.get_pdr_matrix(channel)[np.ix_(src_ids, dst_ids)].astype(float)
+
+    def get_rssi_submatrix(self, src_ids, dst_ids, channel):
+        return self.get_rssi_matrix(channel)[np.ix_(src_ids, dst_ids)].astype(float)
+
+    def get_rssi_matrix(self, channel):
+        return self.rssi[:, :, self.channel_index[channel]]
+
+
+class ConnectivityStorageSparse(ConnectivityStorageBase):
+    """
+    self._links[src_id][dst_id] is a [pdr, rssi] list. Each of the two values
+    is a number when it's the same on every channel, or a float32 array
+    indexed by channel index otherwise.
+
+    A link whose PDR and RSSI are at or below the floors on every channel is
+    not stored; its getters return LINK_NONE. A value at or below its floor
+    set on a link which isn't stored is held in self._pending until the other
+    value of the same channel is set, so that the order in which the PDR and
+    the RSSI are set doesn't matter.
+    """
+
+    _PDR  = 0
+    _RSSI = 1
+
+    DTYPE = np.float32
+
+    def __init__(self, mote_id_list, channels, link_none, settings):
+        super(ConnectivityStorageSparse, self).__init__(
+            mote_id_list,
+            channels,
+            link_none,
+            settings
+        )
+
+        # floors, by field
+        self.floors = [
+            self.settings.conn_sparse_min_pdr,
+            self.settings.conn_sparse_min_rssi
+        ]
+
+        # channel index by channel
+        self.channel_index = dict(
+            [(channel, i) for (i, channel) in enumerate(self.channels)]
+        )
+
+        # position in mote_id_list by mote id
+        self.mote_index = dict(
+            [(mote_id, i) for (i, mote_id) in enumerate(self.mote_id_list)]
+        )
+
+        # at the beginning, connectivity matrix indicates no connectivity at all
+        self._links = dict([(src_id, {}) for src_id in self.mote_id_list])
+
+        # [pdr, rssi] of the links which aren't stored, by
+        # (src_id, dst_id, channel); None is a value not set yet
+        self._pending = {}
+
+    def get_pdr(self, src_id, dst_id, channel):
+        return self._get(src_id, dst_id, channel, self._PDR)
+
+    def set_pdr(self, src_id, dst_id, channel, pdr):
+        self._set(src_id, dst_id, channel, self._PDR, pdr)
+
+    def get_rssi(self, src_id, dst_id, channel):
+        return self._get(src_id, dst_id, channel, self._RSSI)
+
+    def set_rssi(self, src_id, dst_id, channel, rssi):
+        self._set(src_id, dst_id, channel, self._RSSI, rssi)
+
+    def set_link(self, src_id, dst_id, pdr, rssi):
+        if self._pending:
+            for channel in self.channels:
+                self._pending.pop((src_id, dst_id, channel), None)
+        links = self._links[src_id]
+        if (
+                self._is_below_floor(self._PDR, pdr)
+                and
+                self._is_below_floor(self._RSSI, rssi)
+            ):
+            links.pop(dst_id, None)
+        else:
+            links[dst_id] = [pdr, rssi]
+
+    def get_num_links(self):
+        return sum([len(links) for links in self._links.values()])
+
+    # bulk getters
+
+    def get_pdr_row(self, src_id, channel):
+        return self._get_row(src_id, channel, self._PDR)
+
+    def get_rssi_row(self, src_id, channel):
+        return self._get_row(src_id, channel, self._RSSI)
+
+    def get_pdr_submatrix(self, src_ids, dst_ids, channel):
+        return self._get_submatrix(src_ids, dst_ids, channel, self._PDR)
+
+    def get_rssi_submatrix(self, src_ids, dst_ids, channel):
+        return self._get_submatrix(src_ids, dst_ids, channel, self._RSSI)
+
+    def get_neighbors(self, src_id, channel):
+        links   = self._links[src_id]
+        dst_ids = np.fromiter(links.keys(), dtype=np.int64, count=len(links))
+        pdr     = np.empty(len(links), dtype=self.DTYPE)
+        rssi    = np.empty(len(links), dtype=self.DTYPE)
+        index   = self.channel_index[channel]
+        for (i, link) in enumerate(links.values()):
+            pdr[i]  = self._get_value(link[self._PDR], index)
+            rssi[i] = self._get_value(link[self._RSSI], index)
+        return dst_ids, pdr, rssi
+
+    # ======================= private =========================================
+
+    @staticmethod
+    def _get_value(value, index):
+        if isinstance(value, np.ndarray):
+            return float(value[index])
+        else:
+            return value
+
+    def _get(self, src_id, dst_id, channel, field):
+        link = self._links[src_id].get(dst_id)
+        if link is None:
+            return self.link_none[(u'pdr', u'rssi')[field]]
+        return self._get_value(link[field], self.channel_index[channel])
+
+    def _get_row(self, src_id, channel, field):
+        none_value = self.link_none[(u'pdr', u'rssi')[field]]
+        row        = np.full(len(self.mote_id_list), none_value, dtype=self.DTYPE)
+        index      = self.channel_index[channel]
+        for (dst_id, link) in self._links[src_id].items():
+            row[self.mote_index[dst_id]] = self._get_value(link[field], index)
+        return row
+
+    def _get_submatrix(self, src_ids, dst_ids, channel, field):
+        none_value = self.link_none[(u'pdr', u'rssi')[field]]
+        submatrix  = np.full((len(src_ids), len(dst_ids)), none_value, dtype=float)
+        column     = dict([(dst_id, j) for (j, dst_id) in enumerate(dst_ids)])
+        index      = self.channel_index[channel]
+        # only visit the stored links
+        for (i, src_id) in enumerate(src_ids):
+            for (dst_id, link) in self._links[src_id].items():
+                j = column.get(dst_id)
+                if j is not None:
+                    submatrix[i, j] = self._get_value(link[field], index)
+        return submatrix
+
+    def _is_below_floor(self, field, value):
+        if isinstance(value, np.ndarray):
+            return bool((value <= self.floors[field]).all())
+        else:
+            return value <= self.floors[field]
+
+    def _set(self, src_id, dst_id, channel, field, value):
+        links = self._links[src_id]
+        link  = links.get(dst_id)
+
+        if link is None:
+            # hold the value back until we know whether the link is worth
+            # storing on that channel
+            key     = (src_id, dst_id, channel)
+            pending = self._pending.pop(key, [None, None])
+            pending[field] = value
+            if not any(
+                    (
+                        pending[_field] is not None
+                        and
+                        not self._is_below_floor(_field, pending[_field])
+                    )
+                    for _field in (self._PDR, self._RSSI)
+                ):
+                if None in pending:
+                    self._pending[key] = pending
+                return
+
+            # store the link, with the values held back on any channel
+            link = [self.link_none[u'pdr'], self.link_none[u'rssi']]
+            links[dst_id] = link
+            self._set_pending(link, channel, pending)
+            if self._pending:
+                for _channel in self.channels:
+                    _pending = self._pending.pop((src_id, dst_id, _channel), None)
+                    if _pending is not None:
+                        self._set_pending(link, _channel, _pending)
+        else:
+            self._set_field(link, channel, field, value)
+
+        # forget the link when it's not worth storing anymore
+        if (
+                self._is_below_floor(self._PDR, link[self._PDR])
+                and
+                self._is_below_floor(self._RSSI, link[self._RSSI])
+            ):
+            del links[dst_id]
+
+    def _set_pending(self, link, channel, pending):
+        for field in (self._PDR, self._RSSI):
+            if pending[field] is not None:
+                self._set_field(link, channel, field, pending[field])
+
+    def _set_field(self, link, channel, field, value):
+        current = link[field]
+        if isinstance(current, np.ndarray):
+            current[self.channel_index[channel]] = value
+            if (current == current[0]).all():
+                # same value on every channel; store it once
+                link[field] = value
+        elif current != value:
+            if len(self.channels) == 1:
+                link[field] = value
+            else:
+                # expand to per-channel values
+                current = np.full(len(self.channels), current, dtype=self.DTYPE)
+                current[self.channel_index[channel]] = value
+                link[field] = current
+
+# =========================== helpers =========================================
+
+def get_storage_class(name):
+    if   name == CONN_STORAGE_DICT:
+        return ConnectivityStorageDict
+    elif name == CONN_STORAGE_DENSE:
+        return ConnectivityStorageDense
+    elif name == CONN_STORAGE_SPARSE:
+        return ConnectivityStorageSparse
+    else:
+        raise NotImplementedError(
+            u'unsupported conn_storage: {0}'.format(name)
+        )
@@ -0,0 +1,247 @@
+"""
+\brief Per-callback profiling of the discrete-event engine.
+
+With the "exec_profile" setting, the engine runs every callback through an
+EngineProfiler, which records:
+
+* per callback (its qualified name, e.g. "Tsch._action_active_cell") and per
+  owner (the class or function defining the callback, e.g. "Tsch"): the
+  number of calls, the cumulative and the maximum wall time
+* a histogram of the number of events executed per ASN
+* a timeline of the simulated slots per second and the events per second
+
+The report is written as JSON next to the log file of the run ("profile.json"
+next to "output.dat"); the reports of the runs sharing a log file are merged
+into it. runSim.py merges the reports of its workers with merge_report_files().
+Without "exec_profile", the engine doesn't call the profiler at all.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# =========================== imports =========================================
+
+from builtins import object
+import json
+import os
+from timeit import default_timer as timer
+
+# =========================== defines =========================================
+
+# wall time between two points of the timeline, in seconds
+TIMELINE_INTERVAL_S = 1.0
+
+# =========================== body ============================================
+
+class EngineProfiler(object):
+
+    def __init__(self):
+
+        # local variables
+        self.wall_time         = 0.0  # spent in the engine
+        self.num_slots         = 0    # ASNs having events
+        self.num_events        = 0
+        self.events_per_asn    = {}   # number of ASNs by number of events
+        self.callbacks         = {}   # [owner, count, cumtime, maxtime] by name
+        self.timeline          = []
+        self._names            = {}   # callback name by code object
+        self._resumed_at       = None
+        self._last_point       = None # (wall_time, asn, num_events)
+
+    # ======================= public ==========================================
+
+    def resume(self, asn):
+        """ The engine starts executing events """
+        self._resumed_at = timer()
+        if self._last_point is None:
+            self._last_point = (0.0, asn, 0)
+
+    def pause(self):
+        """ The engine stops executing events """
+        if self._resumed_at is not None:
+            self.wall_time  += timer() - self._resumed_at
+            self._resumed_at = None
+
+    def call(self, cb):
+        start = timer()
+        cb()
+        elapsed = timer() - start
+
+        # closures and bound methods are new objects at every scheduling;
+        # their code object isn't
+        code = getattr(getattr(cb, u'__func__', cb), u'__code__', None)
+        if code is None:
+            name = self._get_name(cb)
+        elif code in self._names:
+            name = self._names[code]
+        else:
+            name = self._names[code] = self._get_name(cb)
+
+        stats = self.callbacks.get(name)
+        if stats is None:
+            self.callbacks[name] = [name.split(u'.')[0], 1, elapsed, elapsed]
+        else:
+            stats[1] += 1
+            stats[2] += elapsed
+            if elapsed > stats[3]:
+                stats[3] = elapsed
+
+    def end_slot(self, asn, num_events):
+        self.num_slots  += 1
+        self.num_events += num_events
+        self.events_per_asn[num_events] = (
+            self.events_per_asn.get(num_events, 0) + 1
+        )
+
+        # add a point to the timeline every TIMELINE_INTERVAL_S
+        wall_time = self.wall_time + timer() - self._resumed_at
+        (last_wall_time, last_asn, last_num_events) = self._last_point
+        if wall_time - last_wall_time >= TIMELINE_INTERVAL_S:
+            period = wall_time - last_wall_time
+            self.timeline.append(
+                {
+                    u'wall_time':         wall_time,
+                    u'asn':               asn,
+                    u'slots_per_second':  (asn - last_asn) / period,
+                    u'events_per_second': (
+                        (self.num_events - last_num_events) / period
+                    ),
+                }
+            )
+            self._last_point = (wall_time, asn, self.num_events)
+
+    def get_report(self, asn):
+        """ Return the report of a run which ended at asn """
+        owners = {}
+        for (owner, count, cumtime, maxtime) in self.callbacks.values():
+            if owner not in owners:
+                owners[owner] = [owner, 0, 0.0, 0.0]
+            owners[owner][1] += count
+            owners[owner][2] += cumtime
+            owners[owner][3]  = max(owners[owner][3], maxtime)
+
+        return {
+            u'num_runs':       1,
+            u'wall_time':      self.wall_time,
+            u'num_asns':       asn,
+            u'num_slots':      self.num_slots,
+            u'num_events':     self.num_events,
+            u'events_per_asn': dict(
+                [
+                    (str(num_events), count)
+                    for (num_events, count) in self.events_per_asn.items()
+                ]
+            ),
+            u'callbacks':      _stats_to_dict(self.callbacks),
+            u'owners':         _stats_to_dict(owners),
+            u'timelines':      [self.timeline],
+        }
+
+    def write_report(self, asn, log_file_path):
+        """
+        Merge the report of the run into the report next to the log file
+        """
+        report_file_path = get_report_file_path(log_file_path)
+        reports = [self.get_report(asn)]
+        if os.path.exists(report_file_path):
+            with open(report_file_path, u'r') as f:
+                reports.insert(0, json.load(f))
+        with open(report_file_path, u'w') as f:
+            json.dump(merge_reports(reports), f, indent=4, sort_keys=True)
+
+    # ======================= checkpoint ======================================
+
+    def __getstate__(self):
+        # code objects can't be pickled; their names are looked up again
+        state = self.__dict__.copy()
+        state[u'_names'] = {}
+        return state
+
+    # ======================= private =========================================
+
+    @staticmethod
+    def _get_name(cb):
+        name = getattr(cb, u'__qualname__', None)
+        if name is None:
+            if getattr(cb, u'__self__', None) is not None:
+                # a bound method, with Python 2 (no __qualname__)
+                name = u'{0}.{1}'.format(
+                    type(cb.__self__).__name__,
+                    cb.__name__
+                )
+            else:
+                # e.g. functools.partial, or a function with Python 2
+                name = getattr(cb, u'__name__', type(cb).__name__)
+        return name
+
+# =========================== helpers =========================================
+
+def get_report_file_path(log_file_path):
+    """ 'output_cpu0.dat' -> 'profile_cpu0.json' """
+    (dirname, basename) = os.path.split(log_file_path)
+    basename = os.path.splitext(basename)[0].replace(u'output', u'profile', 1)
+    return os.path.join(dirname, basename + u'.json')
+
+def merge_reports(reports):
+    """ Merge reports, of runs or of merged runs, into one """
+    merged = {
+        u'num_runs':       0,
+        u'wall_time':      0.0,
+        u'num_asns':       0,
+        u'num_slots':      0,
+        u'num_events':     0,
+        u'events_per_asn': {},
+        u'callbacks':      {},
+        u'owners':         {},
+        u'timelines':      [],
+    }
+    for report in reports:
+        for key in [
+                u'num_runs',
+                u'wall_time',
+                u'num_asns',
+                u'num_slots',
+                u'num_events'
+            ]:
+            merged[key] += report[key]
+        for (num_events, count) in report[u'events_per_asn'].items():
+            merged[u'events_per_asn'][num_events] = (
+                merged[u'events_per_asn'].get(num_events, 0) + count
+            )
+        for key in [u'callbacks', u'owners']:
+            for (name, stats) in report[key].items():
+                if name not in merged[key]:
+                    merged[key][name] = dict(stats)
+                else:
+                    merged_stats = merged[key][name]
+                    merged_stats[u'count']   += stats[u'count']
+                    merged_stats[u'cumtime'] += stats[u'cumtime']
+                    merged_stats[u'maxtime']  = max(
+                        merged_stats[u'maxtime'],
+                        stats[u'maxtime']
+                    )
+        merged[u'timelines'] += report[u'timelines']
+    return merged
+
+def merge_report_files(report_file_paths, merged_report_file_path):
+    reports = []
+    for report_file_path in report_file_paths:
+        with open(report_file_path, u'r') as f:
+            reports.append(json.load(f))
+    with open(merged_report_file_path, u'w') as f:
+        json.dump(merge_reports(reports), f, indent=4, sort_keys=True)
+
+def _stats_to_dict(stats):
+    return dict(
+        [
+            (
+                name,
+                {
+                    u'owner':   owner,
+                    u'count':   count,
+                    u'cumtime': cumtime,
+                    u'maxtime': maxtime,
+                }
+            )
+            for (name, (owner, count, cumtime, maxtime)) in stats.items()
+        ]
+    )
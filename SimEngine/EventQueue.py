@@ -0,0 +1,300 @@
+"""
+\brief Event queue backends of the discrete-event simulation engine.
+
+An event is identified by its uniqueTag and is scheduled at an ASN with an
+intraSlotOrder. Events at the same ASN are executed by ascending
+intraSlotOrder, then in order of insertion (FIFO). The insertion order is
+given by a sequence number, drawn at scheduling time; a caller may draw one
+with next_seq() and schedule the event later with it (see TimerWheel.py).
+
+Two backends are available; select one with the "exec_eventQueue" setting:
+
+* "dict": nested dicts indexed by ASN and intraSlotOrder (the original
+  implementation)
+* "heap": a binary heap keyed on (asn, intraSlotOrder, seq) with lazy
+  (tombstone-based) cancellation; the engine jumps directly to the next
+  populated ASN
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+from builtins import object
+from collections import OrderedDict
+import heapq
+import itertools
+
+# =========================== defines =========================================
+
+EVENT_QUEUE_DICT = u'dict'
+EVENT_QUEUE_HEAP = u'heap'
+
+# =========================== body ============================================
+
+class EventQueueDict(object):
+    """
+    Events are stored in self.events[asn][intraSlotOrder][uniqueTag], in
+    order of sequence number.
+    """
+
+    def __init__(self):
+        self.events            = {}
+        self.uniqueTagSchedule = {} # (asn, intraSlotOrder, seq) by uniqueTag
+        self._seq              = itertools.count()
+
+    def __len__(self):
+        return len(self.uniqueTagSchedule)
+
+    def is_empty(self):
+        return not self.events
+
+    def is_scheduled(self, uniqueTag):
+        return uniqueTag in self.uniqueTagSchedule
+
+    def get_asn_of(self, uniqueTag):
+        if uniqueTag in self.uniqueTagSchedule:
+            return self.uniqueTagSchedule[uniqueTag][0]
+        else:
+            return None
+
+    def next_seq(self):
+        return next(self._seq)
+
+    def schedule(self, asn, cb, uniqueTag, intraSlotOrder, seq=None):
+        # the caller has removed any event with the same uniqueTag
+        assert uniqueTag not in self.uniqueTagSchedule
+
+        if seq is None:
+            seq     = next(self._seq)
+            is_late = False
+        else:
+            is_late = True
+        self.uniqueTagSchedule[uniqueTag] = (asn, intraSlotOrder, seq)
+
+        if asn not in self.events:
+            self.events[asn] = {
+                intraSlotOrder: OrderedDict([(uniqueTag, cb)])
+            }
+        elif intraSlotOrder not in self.events[asn]:
+            self.events[asn][intraSlotOrder] = (
+                OrderedDict([(uniqueTag, cb)])
+            )
+        else:
+            events = self.events[asn][intraSlotOrder]
+            events[uniqueTag] = cb
+
+            if is_late:
+                # an event scheduled with an older sequence number goes
+                # before the events scheduled after it
+                later_tags = [
+                    tag for tag in events
+                    if self.uniqueTagSchedule[tag][2] > seq
+                ]
+                for tag in later_tags:
+                    # OrderedDict.move_to_end() is Python 3 only
+                    events[tag] = events.pop(tag)
+
+    def remove(self, uniqueTag):
+        """
+        Remove the event having uniqueTag; return the ASN at which the event
+        was scheduled, or None if there is no such event.
+        """
+        if uniqueTag not in self.uniqueTagSchedule:
+            return None
+
+        (asn, intraSlotOrder, _) = self.uniqueTagSchedule[uniqueTag]
+
+        # delete it
+        del self.uniqueTagSchedule[uniqueTag]
+        del self.events[asn][intraSlotOrder][uniqueTag]
+
+        # and cleanup event structure if it's empty
+        if not self.events[asn][intraSlotOrder]:
+            del self.events[asn][intraSlotOrder]
+
+        if not self.events[asn]:
+            del self.events[asn]
+
+        return asn
+
+    def peek_next_asn(self, current_asn, max_asn=None):
+        """
+        Return the first populated ASN after current_asn; None if there is
+        none up to max_asn
+        """
+        if not self.events:
+            return None
+
+        asn = current_asn + 1
+        while asn not in self.events:
+            if (max_asn is not None) and (asn >= max_asn):
+                return None
+            asn += 1
+        if (max_asn is not None) and (asn > max_asn):
+            return None
+        return asn
+
+    def pop_next(self, current_asn, max_asn=None):
+        """
+        Remove all the events of the first populated ASN after current_asn.
+        Return that ASN and its (intraSlotOrder, cb) pairs in execution
+        order; return (None, []) if that ASN is after max_asn.
+        """
+        assert self.events
+
+        asn = current_asn + 1
+        while asn not in self.events:
+            if (max_asn is not None) and (asn >= max_asn):
+                return None, []
+            asn += 1
+        if (max_asn is not None) and (asn > max_asn):
+            return None, []
+
+        intraSlotOrderKeys = list(self.events[asn].keys())
+        intraSlotOrderKeys.sort()
+
+        cbs = []
+        for intraSlotOrder in intraSlotOrderKeys:
+            for uniqueTag, cb in list(self.events[asn][intraSlotOrder].items()):
+                cbs += [(intraSlotOrder, cb)]
+                del self.uniqueTagSchedule[uniqueTag]
+        del self.events[asn]
+
+        return asn, cbs
+
+
+class EventQueueHeap(object):
+    """
+    Events are entries of a binary heap:
+
+        [asn, intraSlotOrder, seq, uniqueTag, cb]
+
+    'seq' is a monotonic counter which keeps FIFO order among events of the
+    same (asn, intraSlotOrder). A removed event is not taken out of the heap;
+    its entry is marked as removed (tombstone) and skipped when it reaches
+    the top of the heap.
+    """
+
+    # index of the fields in a heap entry
+    _ASN             = 0
+    _INTRASLOTORDER  = 1
+    _SEQ             = 2
+    _UNIQUETAG       = 3
+    _CB              = 4
+
+    _REMOVED         = object() # tombstone, replaces the callback
+
+    def __init__(self):
+        self.heap              = []
+        self.uniqueTagSchedule = {} # heap entry by uniqueTag
+        self._seq              = itertools.count()
+
+    def __len__(self):
+        return len(self.uniqueTagSchedule)
+
+    def is_empty(self):
+        return not self.uniqueTagSchedule
+
+    def is_scheduled(self, uniqueTag):
+        return uniqueTag in self.uniqueTagSchedule
+
+    def get_asn_of(self, uniqueTag):
+        if uniqueTag in self.uniqueTagSchedule:
+            return self.uniqueTagSchedule[uniqueTag][self._ASN]
+        else:
+            return None
+
+    def next_seq(self):
+        return next(self._seq)
+
+    def schedule(self, asn, cb, uniqueTag, intraSlotOrder, seq=None):
+        # the caller has removed any event with the same uniqueTag
+        assert uniqueTag not in self.uniqueTagSchedule
+
+        if seq is None:
+            seq = next(self._seq)
+        entry = [asn, intraSlotOrder, seq, uniqueTag, cb]
+        self.uniqueTagSchedule[uniqueTag] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, uniqueTag):
+        """
+        Remove the event having uniqueTag; return the ASN at which the event
+        was scheduled, or None if there is no such event.
+        """
+        entry = self.uniqueTagSchedule.pop(uniqueTag, None)
+        if entry is None:
+            return None
+
+        # leave a tombstone; the entry is discarded by pop_next()
+        entry[self._CB] = self._REMOVED
+
+        # compact the heap when it's mostly made of tombstones
+        if len(self.heap) > 2 * len(self.uniqueTagSchedule) + 64:
+            self.heap = [e for e in self.heap if e[self._CB] is not self._REMOVED]
+            heapq.heapify(self.heap)
+
+        return entry[self._ASN]
+
+    def peek_next_asn(self, current_asn, max_asn=None):
+        """
+        Return the first populated ASN after current_asn; None if there is
+        none up to max_asn
+        """
+        if not self.uniqueTagSchedule:
+            return None
+
+        heap    = self.heap
+        removed = self._REMOVED
+
+        # discard tombstones at the top of the heap
+        while heap[0][self._CB] is removed:
+            heapq.heappop(heap)
+
+        asn = heap[0][self._ASN]
+        if (max_asn is not None) and (asn > max_asn):
+            return None
+        return asn
+
+    def pop_next(self, current_asn, max_asn=None):
+        """
+        Remove all the events of the first populated ASN after current_asn.
+        Return that ASN and its (intraSlotOrder, cb) pairs in execution
+        order; return (None, []) if that ASN is after max_asn.
+        """
+        assert self.uniqueTagSchedule
+
+        heap    = self.heap
+        removed = self._REMOVED
+
+        # discard tombstones at the top of the heap
+        while heap[0][self._CB] is removed:
+            heapq.heappop(heap)
+
+        asn = heap[0][self._ASN]
+        assert asn > current_asn
+        if (max_asn is not None) and (asn > max_asn):
+            return None, []
+
+        cbs = []
+        while heap and heap[0][self._ASN] == asn:
+            entry = heapq.heappop(heap)
+            if entry[self._CB] is removed:
+                continue
+            cbs += [(entry[self._INTRASLOTORDER], entry[self._CB])]
+            del self.uniqueTagSchedule[entry[self._UNIQUETAG]]
+
+        return asn, cbs
+
+
+# =========================== helpers =========================================
+
+def create_event_queue(name):
+    if   name == EVENT_QUEUE_DICT:
+        return EventQueueDict()
+    elif name == EVENT_QUEUE_HEAP:
+        return EventQueueHeap()
+    else:
+        raise NotImplementedError(
+            u'unsupported exec_eventQueue: {0}'.format(name)
+        )
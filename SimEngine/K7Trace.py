@@ -0,0 +1,390 @@
+"""
+Readers of K7 connectivity traces.
+
+A K7 trace is a gzipped file made of a JSON header line, a CSV header line
+and one CSV row per (datetime, src, dst, channel) measurement, in
+chronological order. K7TraceReader reads the rows lazily, chunk by chunk, as
+the simulation advances; only the current chunk is kept in memory. The
+timestamps of a chunk are converted to ASNs at once, with NumPy.
+
+The rows describing the first full set of links (i.e. until a link appears
+for the second time) get ASN 0 so that they are all applied when the
+connectivity matrix is initialized.
+
+K7TraceCache is the compiled form of a trace for a slot duration: NumPy
+arrays of the rows sorted by ASN and of the row range of each ASN, saved
+next to the trace file and memory-mapped. The cache files are keyed by the
+content hash of the trace and by the slot duration; they are created the
+first time they are needed (runSim.py creates them before starting its
+workers). The mapped pages are read-only, hence shared by all the processes
+replaying the same trace. The content hash is computed once and saved next
+to the trace too, along with the size and the modification time of the
+trace; it is only computed again when one of them changes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# =========================== imports =========================================
+
+from builtins import zip
+from builtins import object
+import datetime as dt
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# =========================== defines =========================================
+
+K7_DATETIME_FORMAT = u'%Y-%m-%dT%H:%M:%S.%f'
+
+# compiled trace
+CACHE_FORMAT_VERSION = 1
+CACHE_ROW_DTYPE = np.dtype(
+    [
+        (u'asn',       np.int64),
+        (u'src_id',    np.int32),
+        (u'dst_id',    np.int32),
+        (u'channel',   np.int32), # CACHE_ALL_CHANNELS for all the channels
+        (u'pdr',       np.float64),
+        (u'mean_rssi', np.float64),
+    ]
+)
+CACHE_INDEX_DTYPE = np.dtype(
+    [
+        (u'asn',       np.int64),
+        (u'start',     np.int64), # first row of the ASN
+        (u'stop',      np.int64), # last row of the ASN + 1
+    ]
+)
+CACHE_ALL_CHANNELS = -1
+
+# os.replace() is Python 3.3+; on POSIX, os.rename() replaces the file too
+replace_file = getattr(os, u'replace', os.rename)
+
+# =========================== body ============================================
+
+class K7TraceReader(object):
+
+    CHUNK_SIZE = 10000 # rows
+
+    def __init__(self, trace_file_path, slot_duration, link_none_rssi):
+
+        # store params
+        self.trace_file_path = trace_file_path
+        self.slot_duration   = slot_duration
+        self.link_none_rssi  = link_none_rssi
+
+        # read the headers
+        self._tracefile = gzip.open(trace_file_path, u'r')
+        (self.header, self.csv_header) = _read_headers(self._tracefile)
+        (self.start_date, self.stop_date) = _get_dates(self.header)
+
+        # local variables
+        self.position            = 0    # number of rows consumed
+        self._chunk              = []   # rows of the current chunk
+        self._chunk_index        = 0    # next row in self._chunk
+        self._initialized_links  = set([])
+        self._start_date64       = np.datetime64(self.start_date, u'us')
+
+    # ======================= public ==========================================
+
+    def peek(self):
+        """
+        Return the next row, without consuming it; None when the whole trace
+        has been read
+        """
+        if self._chunk_index == len(self._chunk):
+            self._read_chunk()
+            if not self._chunk:
+                return None
+        return self._chunk[self._chunk_index]
+
+    def pop(self):
+        """ Consume and return the next row """
+        row = self.peek()
+        assert row is not None
+        self._chunk_index += 1
+        self.position     += 1
+        return row
+
+    def close(self):
+        self._tracefile.close()
+        self._chunk       = []
+        self._chunk_index = 0
+
+    # ======================= checkpoint ======================================
+
+    def __getstate__(self):
+        # the trace file is reopened and skipped to the rows not read yet
+        state = self.__dict__.copy()
+        del state[u'_tracefile']
+        if self._tracefile.closed:
+            state[u'_num_read_rows'] = None
+        else:
+            state[u'_num_read_rows'] = (
+                self.position + len(self._chunk) - self._chunk_index
+            )
+        return state
+
+    def __setstate__(self, state):
+        num_read_rows = state.pop(u'_num_read_rows')
+        self.__dict__.update(state)
+        self._tracefile = gzip.open(self.trace_file_path, u'r')
+        if num_read_rows is None:
+            self._tracefile.close()
+        else:
+            _read_headers(self._tracefile)
+            for _ in itertools.islice(self._tracefile, num_read_rows):
+                pass
+
+    # ======================= private =========================================
+
+    def _read_chunk(self):
+        self._chunk       = []
+        self._chunk_index = 0
+        if self._tracefile.closed:
+            return
+
+        lines = [
+            line.decode(u'utf-8').strip().split(u',')
+            for line in itertools.islice(self._tracefile, self.CHUNK_SIZE)
+        ]
+        if not lines:
+            # we hit the bottom of the trace
+            self._tracefile.close()
+            return
+
+        columns = dict(list(zip(self.csv_header, list(zip(*lines)))))
+
+        # convert the timestamps to ASNs
+        elapsed_us = (
+            np.array(columns[u'datetime'], dtype=u'datetime64[us]') -
+            self._start_date64
+        ).astype(np.int64)
+        asns = (
+            (elapsed_us / 1e6) / float(self.slot_duration)
+        ).astype(np.int64).tolist()
+
+        for (src, dst, channel, mean_rssi, pdr, asn) in zip(
+                columns[u'src'],
+                columns[u'dst'],
+                columns[u'channel'],
+                columns[u'mean_rssi'],
+                columns[u'pdr'],
+                asns
+            ):
+            row = {
+                u'src_id':    int(src) if src else None,
+                u'dst_id':    int(dst) if dst else None,
+                u'channel':   int(channel) if channel else None,
+                u'mean_rssi': (
+                    self.link_none_rssi
+                    if mean_rssi in [u'', u'None']
+                    else float(mean_rssi)
+                ),
+                u'pdr':       float(pdr),
+                u'asn':       asn,
+            }
+
+            if self._initialized_links is not None:
+                link = (row[u'src_id'], row[u'dst_id'], row[u'channel'])
+                if link in self._initialized_links:
+                    # we've already initialized this link; we don't need to
+                    # keep the links any more
+                    self._initialized_links = None
+                else:
+                    # this link has not been initialized. for this purpose,
+                    # set ASN 0 to this row so that this row will be used in
+                    # the initialization of the matrix
+                    row[u'asn'] = 0
+                    self._initialized_links.add(link)
+
+            self._chunk.append(row)
+
+
+class K7TraceCache(object):
+
+    def __init__(self, trace_file_path, slot_duration, link_none_rssi):
+
+        # read the headers
+        with gzip.open(trace_file_path, u'r') as tracefile:
+            (self.header, _) = _read_headers(tracefile)
+        (self.start_date, self.stop_date) = _get_dates(self.header)
+
+        # compile the trace if needed
+        content_hash = get_content_hash(trace_file_path)
+        (rows_path, index_path) = get_cache_paths(
+            trace_file_path,
+            slot_duration,
+            content_hash
+        )
+        if not (os.path.exists(rows_path) and os.path.exists(index_path)):
+            compile_trace(
+                trace_file_path,
+                slot_duration,
+                link_none_rssi,
+                content_hash
+            )
+
+        # map the compiled trace
+        self.rows_path  = rows_path
+        self.index_path = index_path
+        self._map()
+
+        # local variables
+        self.position          = 0 # number of rows consumed
+        self._index_position   = 0 # next entry in self.index
+
+    # ======================= public ==========================================
+
+    def peek_asn(self):
+        """ Return the ASN of the next rows; None at the end of the trace """
+        if self._index_position == len(self.index):
+            return None
+        return int(self.index[u'asn'][self._index_position])
+
+    def pop_rows(self):
+        """ Consume and return the rows of the next ASN, as an array """
+        (_, start, stop) = self.index[self._index_position]
+        assert start == self.position
+        self._index_position += 1
+        self.position         = int(stop)
+        return self.rows[start:stop]
+
+    def close(self):
+        pass
+
+    # ======================= checkpoint ======================================
+
+    def __getstate__(self):
+        # the compiled trace is mapped again rather than copied
+        state = self.__dict__.copy()
+        del state[u'rows']
+        del state[u'index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._map()
+
+    # ======================= private =========================================
+
+    def _map(self):
+        self.rows  = np.load(self.rows_path,  mmap_mode=u'r')
+        self.index = np.load(self.index_path, mmap_mode=u'r')
+
+# =========================== helpers =========================================
+
+def get_content_hash(trace_file_path):
+    """
+    Return the content hash of a trace, from its hash file when the trace
+    didn't change since it was written
+    """
+    hash_file_path = trace_file_path + u'.hash.json'
+    stat = os.stat(trace_file_path)
+    key  = {u'size': stat.st_size, u'mtime': stat.st_mtime}
+    try:
+        with open(hash_file_path, u'r') as f:
+            saved = json.load(f)
+        if saved[u'key'] == key:
+            return saved[u'content_hash']
+    except (EnvironmentError, ValueError, KeyError):
+        # no hash file yet, or a broken one
+        pass
+
+    content_hash = hashlib.sha256()
+    with open(trace_file_path, u'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            content_hash.update(block)
+    content_hash = content_hash.hexdigest()
+
+    # save it; concurrent writes are harmless
+    (fd, tmp_path) = tempfile.mkstemp(
+        dir=os.path.dirname(hash_file_path) or u'.'
+    )
+    with os.fdopen(fd, u'w') as f:
+        json.dump({u'key': key, u'content_hash': content_hash}, f)
+    replace_file(tmp_path, hash_file_path)
+
+    return content_hash
+
+def get_cache_paths(trace_file_path, slot_duration, content_hash=None):
+    """ Return the paths of the rows and index files of a compiled trace """
+    if content_hash is None:
+        content_hash = get_content_hash(trace_file_path)
+
+    prefix = u'{0}.{1}.v{2}.{3}us'.format(
+        trace_file_path,
+        content_hash[:16],
+        CACHE_FORMAT_VERSION,
+        int(round(slot_duration * 1e6))
+    )
+    return (prefix + u'.rows.npy', prefix + u'.index.npy')
+
+def compile_trace(
+            trace_file_path,
+            slot_duration,
+            link_none_rssi,
+            content_hash=None
+        ):
+    """ Compile a trace for a slot duration into its cache files """
+
+    # read the rows
+    reader = K7TraceReader(trace_file_path, slot_duration, link_none_rssi)
+    rows = []
+    while reader.peek() is not None:
+        row = reader.pop()
+        rows.append(
+            (
+                row[u'asn'],
+                row[u'src_id'],
+                row[u'dst_id'],
+                (
+                    CACHE_ALL_CHANNELS
+                    if row[u'channel'] is None
+                    else row[u'channel']
+                ),
+                row[u'pdr'],
+                row[u'mean_rssi'],
+            )
+        )
+    reader.close()
+    rows = np.array(rows, dtype=CACHE_ROW_DTYPE)
+
+    # sort the rows by ASN, keeping the order of the trace among the rows of
+    # an ASN
+    rows = rows[np.argsort(rows[u'asn'], kind=u'stable')]
+
+    # index the rows by ASN
+    starts = np.flatnonzero(np.diff(rows[u'asn'], prepend=-1))
+    index = np.empty(len(starts), dtype=CACHE_INDEX_DTYPE)
+    index[u'asn']   = rows[u'asn'][starts]
+    index[u'start'] = starts
+    index[u'stop']  = np.append(starts[1:], len(rows))
+
+    # save them; concurrent compilations are harmless
+    (rows_path, index_path) = get_cache_paths(
+        trace_file_path,
+        slot_duration,
+        content_hash
+    )
+    for (path, array) in [(rows_path, rows), (index_path, index)]:
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path) or u'.')
+        with os.fdopen(fd, u'wb') as f:
+            np.save(f, array)
+        replace_file(tmp_path, path)
+
+def _read_headers(tracefile):
+    header = json.loads(tracefile.readline().decode(u'utf-8'))
+    csv_header = tracefile.readline().decode(u'utf-8').strip().split(u',')
+    return header, csv_header
+
+def _get_dates(header):
+    start_date = dt.datetime.strptime(header[u'start_date'], K7_DATETIME_FORMAT)
+    stop_date  = dt.datetime.strptime(header[u'stop_date'],  K7_DATETIME_FORMAT)
+    return start_date, stop_date
@@ -0,0 +1,477 @@
+"""
+\brief The KPIs of a run, as compute_kpis.py reports them.
+
+The KPIs are computed from the logs of five types: tsch.synced,
+secjoin.joined, app.tx, app.rx and radio.stats. compute_kpis.py reads them
+from a log file; a KpiCollector gets them from SimLog as they are written,
+which is how SimEngine.run_scenario() computes the KPIs of a run without
+any log file. Both feed the same functions:
+
+* update_mote_stats() gathers the raw stats of the motes of a run, one log
+  at a time
+* compute_mote_stats() computes the per-mote stats (latencies, lifetime...)
+  from the raw stats
+* compute_network_stats() computes the KPIs of the network ("global-stats"
+  in the output of compute_kpis.py), indexed by the names in KPIS
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# =========================== imports =========================================
+
+from builtins import object
+import copy
+
+import netaddr
+import numpy as np
+
+from . import SimLog
+from .Mote import MoteDefines as d
+
+# =========================== defines =========================================
+
+DAGROOT_ID = 0  # we assume first mote is DAGRoot
+DAGROOT_IP = u'fd00::1:0'
+BATTERY_AA_CAPACITY_mAh = 2821.5
+
+# the KPIs of the network
+KPI_E2E_UPSTREAM_DELIVERY = u'e2e-upstream-delivery'
+KPI_E2E_UPSTREAM_LATENCY  = u'e2e-upstream-latency'
+KPI_CURRENT_CONSUMED      = u'current-consumed'
+KPI_NETWORK_LIFETIME      = u'network_lifetime'
+KPI_JOINING_TIME          = u'joining-time'
+KPI_APP_PACKETS_SENT      = u'app-packets-sent'
+KPI_APP_PACKETS_RECEIVED  = u'app_packets_received'
+KPI_APP_PACKETS_LOST      = u'app_packets_lost'
+KPIS                      = [
+    KPI_E2E_UPSTREAM_DELIVERY,
+    KPI_E2E_UPSTREAM_LATENCY,
+    KPI_CURRENT_CONSUMED,
+    KPI_NETWORK_LIFETIME,
+    KPI_JOINING_TIME,
+    KPI_APP_PACKETS_SENT,
+    KPI_APP_PACKETS_RECEIVED,
+    KPI_APP_PACKETS_LOST,
+]
+
+# =========================== helpers =========================================
+
+def mean(numbers):
+    return float(sum(numbers)) / max(len(numbers), 1)
+
+def check_kpis(kpis):
+    """ Raise ValueError if kpis, a list of names, has an unknown KPI """
+    for kpi in kpis or []:
+        if kpi not in KPIS:
+            raise ValueError(u'unsupported KPI: {0}'.format(kpi))
+
+def init_mote():
+    return {
+        u'upstream_num_tx': 0,
+        u'upstream_num_rx': 0,
+        u'upstream_num_lost': 0,
+        u'join_asn': None,
+        u'join_time_s': None,
+        u'sync_asn': None,
+        u'sync_time_s': None,
+        u'charge_asn': None,
+        u'upstream_pkts': {},
+        u'latencies': [],
+        u'hops': [],
+        u'charge': None,
+        u'lifetime_AA_years': None,
+        u'avg_current_uA': None,
+    }
+
+# =========================== stats ===========================================
+
+def update_mote_stats(run_stats, log_type, asn, content, slot_duration):
+    """
+    Update run_stats, the raw stats of the motes of a run indexed by mote id,
+    with a log of log_type written at asn; the motes with logs have an entry
+    (see init_mote()), the root excepted.
+    """
+
+    if   log_type == SimLog.LOG_TSCH_SYNCED[u'type']:
+        # sync'ed
+
+        # shorthands
+        mote_id    = content[u'_mote_id']
+
+        # only log non-dagRoot sync times
+        if mote_id == DAGROOT_ID:
+            return
+
+        run_stats[mote_id][u'sync_asn']    = asn
+        run_stats[mote_id][u'sync_time_s'] = asn*slot_duration
+
+    elif log_type == SimLog.LOG_SECJOIN_JOINED[u'type']:
+        # joined
+
+        # shorthands
+        mote_id    = content[u'_mote_id']
+
+        # only log non-dagRoot join times
+        if mote_id == DAGROOT_ID:
+            return
+
+        # populate
+        assert run_stats[mote_id][u'sync_asn'] is not None
+        run_stats[mote_id][u'join_asn']    = asn
+        run_stats[mote_id][u'join_time_s'] = asn*slot_duration
+
+    elif log_type == SimLog.LOG_APP_TX[u'type']:
+        # packet transmission
+
+        # shorthands
+        mote_id    = content[u'_mote_id']
+        dstIp      = content[u'packet'][u'net'][u'dstIp']
+        appcounter = content[u'packet'][u'app'][u'appcounter']
+
+        # only log upstream packets
+        if dstIp != DAGROOT_IP:
+            return
+
+        # populate
+        assert run_stats[mote_id][u'join_asn'] is not None
+        if appcounter not in run_stats[mote_id][u'upstream_pkts']:
+            run_stats[mote_id][u'upstream_pkts'][appcounter] = {
+                u'hops': 0,
+            }
+
+        run_stats[mote_id][u'upstream_pkts'][appcounter][u'tx_asn'] = asn
+
+    elif log_type == SimLog.LOG_APP_RX[u'type']:
+        # packet reception
+
+        # shorthands
+        mote_id    = netaddr.IPAddress(content[u'packet'][u'net'][u'srcIp']).words[-1]
+        dstIp      = content[u'packet'][u'net'][u'dstIp']
+        hop_limit  = content[u'packet'][u'net'][u'hop_limit']
+        appcounter = content[u'packet'][u'app'][u'appcounter']
+
+        # only log upstream packets
+        if dstIp != DAGROOT_IP:
+            return
+
+        run_stats[mote_id][u'upstream_pkts'][appcounter][u'hops']   = (
+            d.IPV6_DEFAULT_HOP_LIMIT - hop_limit + 1
+        )
+        run_stats[mote_id][u'upstream_pkts'][appcounter][u'rx_asn'] = asn
+
+    elif log_type == SimLog.LOG_RADIO_STATS[u'type']:
+        # shorthands
+        mote_id    = content[u'_mote_id']
+
+        # only log non-dagRoot charge
+        if mote_id == DAGROOT_ID:
+            return
+
+        charge =  content[u'idle_listen'] * d.CHARGE_IdleListen_uC
+        charge += content[u'tx_data_rx_ack'] * d.CHARGE_TxDataRxAck_uC
+        charge += content[u'rx_data_tx_ack'] * d.CHARGE_RxDataTxAck_uC
+        charge += content[u'tx_data'] * d.CHARGE_TxData_uC
+        charge += content[u'rx_data'] * d.CHARGE_RxData_uC
+        charge += content[u'sleep'] * d.CHARGE_Sleep_uC
+
+        run_stats[mote_id][u'charge_asn'] = asn
+        run_stats[mote_id][u'charge']     = charge
+
+def compute_mote_stats(run_stats, slot_duration):
+    """ Compute the per-mote stats of a run from its raw stats, in place """
+    for (mote_id, motestats) in list(run_stats.items()):
+        if mote_id != DAGROOT_ID:
+
+            if (motestats[u'sync_asn'] is not None) and (motestats[u'charge_asn'] is not None):
+                # avg_current, lifetime_AA
+                if (
+                        (motestats[u'charge'] <= 0)
+                        or
+                        (motestats[u'charge_asn'] <= motestats[u'sync_asn'])
+                    ):
+                    motestats[u'lifetime_AA_years'] = u'N/A'
+                else:
+                    motestats[u'avg_current_uA'] = motestats[u'charge']/float((motestats[u'charge_asn']-motestats[u'sync_asn']) * slot_duration)
+                    assert motestats[u'avg_current_uA'] > 0
+                    motestats[u'lifetime_AA_years'] = (BATTERY_AA_CAPACITY_mAh*1000/float(motestats[u'avg_current_uA']))/(24.0*365)
+            if motestats[u'join_asn'] is not None:
+                # latencies, upstream_num_tx, upstream_num_rx, upstream_num_lost
+                for (appcounter, pktstats) in list(motestats[u'upstream_pkts'].items()):
+                    motestats[u'upstream_num_tx']      += 1
+                    if u'rx_asn' in pktstats:
+                        motestats[u'upstream_num_rx']  += 1
+                        thislatency = (pktstats[u'rx_asn']-pktstats[u'tx_asn'])*slot_duration
+                        motestats[u'latencies']  += [thislatency]
+                        motestats[u'hops']       += [pktstats[u'hops']]
+                    else:
+                        motestats[u'upstream_num_lost'] += 1
+                if (motestats[u'upstream_num_rx'] > 0) and (motestats[u'upstream_num_tx'] > 0):
+                    motestats[u'latency_min_s'] = min(motestats[u'latencies'])
+                    motestats[u'latency_avg_s'] = sum(motestats[u'latencies'])/float(len(motestats[u'latencies']))
+                    motestats[u'latency_max_s'] = max(motestats[u'latencies'])
+                    motestats[u'upstream_reliability'] = motestats[u'upstream_num_rx']/float(motestats[u'upstream_num_tx'])
+                    motestats[u'avg_hops'] = sum(motestats[u'hops'])/float(len(motestats[u'hops']))
+
+def compute_network_stats(run_stats, slot_duration):
+    """
+    Return the KPIs of the network, indexed by the names in KPIS, from the
+    per-mote stats of a run (see compute_mote_stats())
+    """
+
+    #-- define stats
+
+    app_packets_sent = 0
+    app_packets_received = 0
+    app_packets_lost = 0
+    joining_times = []
+    us_latencies = []
+    current_consumed = []
+    lifetimes = []
+
+    #-- compute stats
+
+    for (mote_id, motestats) in list(run_stats.items()):
+        if mote_id == DAGROOT_ID:
+            continue
+
+        # counters
+
+        app_packets_sent += motestats[u'upstream_num_tx']
+        app_packets_received += motestats[u'upstream_num_rx']
+        app_packets_lost += motestats[u'upstream_num_lost']
+
+        # joining times
+
+        if motestats[u'join_asn'] is not None:
+            joining_times.append(motestats[u'join_asn'])
+
+        # latency
+
+        us_latencies += motestats[u'latencies']
+
+        # current consumed
+
+        current_consumed.append(motestats[u'charge'])
+        if motestats[u'lifetime_AA_years'] is not None:
+            lifetimes.append(motestats[u'lifetime_AA_years'])
+        current_consumed = [
+            value for value in current_consumed if value is not None
+        ]
+
+    #-- return stats
+
+    return {
+        KPI_E2E_UPSTREAM_DELIVERY: [
+            {
+                u'name': u'E2E Upstream Delivery Ratio',
+                u'unit': u'%',
+                u'value': (
+                    1 - app_packets_lost / app_packets_sent
+                    if app_packets_sent > 0 else u'N/A'
+                )
+            },
+            {
+                u'name': u'E2E Upstream Loss Rate',
+                u'unit': u'%',
+                u'value': (
+                    app_packets_lost / app_packets_sent
+                    if app_packets_sent > 0 else u'N/A'
+                )
+            }
+        ],
+        KPI_E2E_UPSTREAM_LATENCY: [
+            {
+                u'name': u'E2E Upstream Latency',
+                u'unit': u's',
+                u'mean': (
+                    mean(us_latencies)
+                    if us_latencies else u'N/A'
+                ),
+                u'min': (
+                    min(us_latencies)
+                    if us_latencies else u'N/A'
+                ),
+                u'max': (
+                    max(us_latencies)
+                    if us_latencies else u'N/A'
+                ),
+                u'99%': (
+                    np.percentile(us_latencies, 99)
+                    if us_latencies else u'N/A'
+                )
+            },
+            {
+                u'name': u'E2E Upstream Latency',
+                u'unit': u'slots',
+                u'mean': (
+                    mean(us_latencies) / slot_duration
+                    if us_latencies else u'N/A'
+                ),
+                u'min': (
+                    min(us_latencies) / slot_duration
+                    if us_latencies else u'N/A'
+                ),
+                u'max': (
+                    max(us_latencies) / slot_duration
+                    if us_latencies else u'N/A'
+                ),
+                u'99%': (
+                    np.percentile(us_latencies, 99) / slot_duration
+                    if us_latencies else u'N/A'
+                )
+            }
+        ],
+        KPI_CURRENT_CONSUMED: [
+            {
+                u'name': u'Current Consumed',
+                u'unit': u'mA',
+                u'mean': (
+                    mean(current_consumed)
+                    if current_consumed else u'N/A'
+                ),
+                u'99%': (
+                    np.percentile(current_consumed, 99)
+                    if current_consumed else u'N/A'
+                )
+            }
+        ],
+        KPI_NETWORK_LIFETIME:[
+            {
+                u'name': u'Network Lifetime',
+                u'unit': u'years',
+                u'min': (
+                    min(lifetimes)
+                    if lifetimes else u'N/A'
+                ),
+                u'total_capacity_mAh': BATTERY_AA_CAPACITY_mAh,
+            }
+        ],
+        KPI_JOINING_TIME: [
+            {
+                u'name': u'Joining Time',
+                u'unit': u'slots',
+                u'min': (
+                    min(joining_times)
+                    if joining_times else u'N/A'
+                ),
+                u'max': (
+                    max(joining_times)
+                    if joining_times else u'N/A'
+                ),
+                u'mean': (
+                    mean(joining_times)
+                    if joining_times else u'N/A'
+                ),
+                u'99%': (
+                    np.percentile(joining_times, 99)
+                    if joining_times else u'N/A'
+                )
+            }
+        ],
+        KPI_APP_PACKETS_SENT: [
+            {
+                u'name': u'Number of application packets sent',
+                u'total': app_packets_sent
+            }
+        ],
+        KPI_APP_PACKETS_RECEIVED: [
+            {
+                u'name': u'Number of application packets received',
+                u'total': app_packets_received
+            }
+        ],
+        KPI_APP_PACKETS_LOST: [
+            {
+                u'name': u'Number of application packets lost',
+                u'total': app_packets_lost
+            }
+        ]
+    }
+
+# =========================== body ============================================
+
+class KpiCollector(object):
+    """
+    Gather the raw stats of the motes from the logs, as they are written, the
+    way compute_kpis.py reads them from the log file. Create it before the
+    engine, which logs as it sets the motes up.
+    """
+
+    def __init__(self, simlog):
+
+        # store params
+        self.simlog        = simlog
+
+        # local variables
+        self.slot_duration = simlog.settings.tsch_slotDuration
+        self.run_stats     = {} # raw stats, indexed by mote id
+
+        # observe the logs
+        simlog.add_observer(SimLog.LOG_TSCH_SYNCED,    self._observe_tsch_synced)
+        simlog.add_observer(SimLog.LOG_SECJOIN_JOINED, self._observe_secjoin_joined)
+        simlog.add_observer(SimLog.LOG_APP_TX,         self._observe_app_tx)
+        simlog.add_observer(SimLog.LOG_APP_RX,         self._observe_app_rx)
+        simlog.add_observer(SimLog.LOG_RADIO_STATS,    self._observe_radio_stats)
+
+    # ======================= public ==========================================
+
+    def get_mote_stats(self):
+        """
+        Return the per-mote stats so far (see compute_mote_stats()), indexed
+        by mote id
+        """
+        # the per-mote stats are computed from a copy of the raw stats, which
+        # keep being gathered
+        run_stats = copy.deepcopy(self.run_stats)
+        compute_mote_stats(run_stats, self.slot_duration)
+        return run_stats
+
+    def get_kpis(self, kpis=None):
+        """
+        Return the KPIs of the network so far, indexed by name; kpis is a
+        list of names of KPIS, all of them by default
+        """
+        check_kpis(kpis)
+        if kpis is None:
+            kpis = KPIS
+
+        network_stats = compute_network_stats(
+            self.get_mote_stats(),
+            self.slot_duration
+        )
+        return dict([(kpi, network_stats[kpi]) for kpi in kpis])
+
+    # ======================= private =========================================
+
+    def _observe_tsch_synced(self, content):
+        self._update(SimLog.LOG_TSCH_SYNCED, content)
+
+    def _observe_secjoin_joined(self, content):
+        self._update(SimLog.LOG_SECJOIN_JOINED, content)
+
+    def _observe_app_tx(self, content):
+        self._update(SimLog.LOG_APP_TX, content)
+
+    def _observe_app_rx(self, content):
+        self._update(SimLog.LOG_APP_RX, content)
+
+    def _observe_radio_stats(self, content):
+        self._update(SimLog.LOG_RADIO_STATS, content)
+
+    def _update(self, simlog, content):
+        # the ASN SimLog logs, 0 before the engine is set
+        if self.simlog.engine is None:
+            asn = 0
+        else:
+            asn = self.simlog.engine.asn
+
+        mote_id = content[u'_mote_id']
+        if (mote_id not in self.run_stats) and (mote_id != DAGROOT_ID):
+            self.run_stats[mote_id] = init_mote()
+        update_mote_stats(
+            self.run_stats,
+            simlog[u'type'],
+            asn,
+            content,
+            self.slot_duration
+        )
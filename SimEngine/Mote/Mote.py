@@ -36,18 +36,22 @@ class Mote(object):
     IPV6_ADDR_TYPE_LINK_LOCAL = u'link-local'
     IPV6_ADDR_TYPE_GLOBAL     = u'global'
 
-    def __init__(self, id, eui64=None):
+    def __init__(self, id, eui64=None, context=None):
 
         # store params
         self.id                        = id
+        if context is None:
+            context = SimEngine.SimContext.get_current()
+        self.context                   = context
 
         # admin
         self.dataLock                  = threading.RLock()
 
-        # singletons (quicker access, instead of recreating every time)
-        self.log                       = SimEngine.SimLog.SimLog().log
-        self.engine                    = SimEngine.SimEngine.SimEngine()
-        self.settings                  = SimEngine.SimSettings.SimSettings()
+        # singletons of the simulation (quicker access); the layers get them
+        # from the mote
+        self.log                       = context.log.log
+        self.engine                    = context.engine
+        self.settings                  = context.settings
 
         # stack state
         self.dagRoot                   = False
@@ -64,6 +68,17 @@ class Mote(object):
         self.tsch                      = tsch.Tsch(self)
         self.radio                     = radio.Radio(self)
 
+    # ======================= checkpoint ======================================
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state[u'dataLock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dataLock = threading.RLock()
+
     # ======================= stack ===========================================
 
     # ===== role
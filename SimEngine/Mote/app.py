@@ -8,7 +8,6 @@ from __future__ import absolute_import
 from builtins import range
 from builtins import object
 from abc import abstractmethod
-import random
 
 # Mote sub-modules
 
@@ -26,7 +25,7 @@ def App(mote):
     """factory method for application
     """
 
-    settings = SimEngine.SimSettings.SimSettings()
+    settings = mote.settings
 
     # use mote.id to determine whether it is the root or not instead of using
     # mote.dagRoot because mote.dagRoot is not initialized when application is
@@ -45,10 +44,11 @@ class AppBase(object):
         # store params
         self.mote       = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine     = SimEngine.SimEngine.SimEngine()
-        self.settings   = SimEngine.SimSettings.SimSettings()
-        self.log        = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.engine     = mote.engine
+        self.settings   = mote.settings
+        self.log        = mote.log
+        self.rng        = self.engine.random_streams.get(u'app', mote.id)
 
         # local variables
         self.appcounter = 0
@@ -63,6 +63,14 @@ class AppBase(object):
         """
         raise NotImplementedError()  # abstractmethod
 
+    def indication_settings_changed(self):
+        """The settings changed, e.g. in a branch (see SimEngine.branch()).
+
+        The settings are read when a packet is generated; the packet which is
+        already scheduled keeps its time.
+        """
+        pass
+
     def recvPacket(self, packet):
         """Receive a packet destined to this application
         """
@@ -199,12 +207,12 @@ class AppPeriodic(AppBase):
 
         if self.sending_first_packet:
             # compute initial time within the range of [next asn, next asn+pkPeriod]
-            delay = self.settings.tsch_slotDuration + (self.settings.app_pkPeriod * random.random())
+            delay = self.settings.tsch_slotDuration + (self.settings.app_pkPeriod * self.rng.random())
             self.sending_first_packet = False
         else:
             # compute random delay
             assert self.settings.app_pkPeriodVar < 1
-            delay = self.settings.app_pkPeriod * (1 + random.uniform(-self.settings.app_pkPeriodVar, self.settings.app_pkPeriodVar))
+            delay = self.settings.app_pkPeriod * (1 + self.rng.uniform(-self.settings.app_pkPeriodVar, self.settings.app_pkPeriodVar))
 
         # schedule
         self.engine.scheduleIn(
@@ -237,24 +245,42 @@ class AppBurst(AppBase):
     #======================== public ==========================================
     def __init__(self, mote, **kwargs):
         super(AppBurst, self).__init__(mote, **kwargs)
-        self.done = False
+        self.done      = False
+        self.start_asn = None
 
     def startSendingData(self):
         if not self.done:
             # schedule app_burstNumPackets packets in app_burstTimestamp
-            self.engine.scheduleIn(
-                delay           = self.settings.app_burstTimestamp,
-                cb              = self._send_burst_packets,
-                uniqueTag       = (
-                    u'AppBurst',
-                    u'scheduled_by_{0}'.format(self.mote.id)
-                ),
-                intraSlotOrder  = d.INTRASLOTORDER_ADMINTASKS,
-            )
+            self.start_asn = self.engine.getAsn()
+            self._schedule_burst()
             self.done = True
 
+    def indication_settings_changed(self):
+        # move the burst to app_burstTimestamp after the start, unless it was
+        # sent already
+        if self.engine.is_scheduled(self._burst_tag()):
+            self._schedule_burst()
+
     #======================== private ==========================================
 
+    def _burst_tag(self):
+        return (u'AppBurst', u'scheduled_by_{0}'.format(self.mote.id))
+
+    def _schedule_burst(self):
+        asn = int(
+            self.start_asn +
+            (
+                float(self.settings.app_burstTimestamp) /
+                float(self.settings.tsch_slotDuration)
+            )
+        )
+        self.engine.scheduleAtAsn(
+            asn             = max(asn, self.engine.getAsn() + 1),
+            cb              = self._send_burst_packets,
+            uniqueTag       = self._burst_tag(),
+            intraSlotOrder  = d.INTRASLOTORDER_ADMINTASKS,
+        )
+
     def _send_burst_packets(self):
         if self.mote.rpl.dodagId == None:
             # we're not part of the network now
@@ -29,10 +29,10 @@ class Radio(object):
         # store params
         self.mote                           = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                         = SimEngine.SimEngine.SimEngine()
-        self.settings                       = SimEngine.SimSettings.SimSettings()
-        self.log                            = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.engine                         = mote.engine
+        self.settings                       = mote.settings
+        self.log                            = mote.log
 
         # local variables
         self.onGoingTransmission            = None    # ongoing transmission (used by propagate)
@@ -41,6 +41,7 @@ class Radio(object):
         self.noisepower                     = -105    # dBm
         self.state                          = d.RADIO_STATE_OFF
         self.channel                        = None
+        self.scanningSince                  = None    # see startScanning()
         self.stats = {
             u'last_updated'  : 0,
             u'idle_listen'   : 0,
@@ -77,6 +78,9 @@ class Radio(object):
             u'packet':  packet,
         }
 
+        # have the propagation model resolve this slot
+        self.engine.connectivity.register_active_radio(self.mote)
+
     def txDone(self, isACKed):
         """end of tx slot"""
         self.state = d.RADIO_STATE_OFF
@@ -111,6 +115,9 @@ class Radio(object):
         self.state = d.RADIO_STATE_RX
         self.channel = channel
 
+        # have the propagation model resolve this slot
+        self.engine.connectivity.register_active_radio(self.mote)
+
     def rxDone(self, packet):
         """end of RX radio activity"""
 
@@ -142,6 +149,65 @@ class Radio(object):
         # return whether the frame is acknowledged or not
         return is_acked
 
+    # stats
+
+    def get_stats(self):
+        """the stats, up to the current slot included; call it at the end of
+        a slot, as _log_stats()"""
+        asn = self.engine.getAsn()
+        self._update_scanning_stats(asn)
+        stats = dict(self.stats)
+
+        # the radio slept since its last update
+        stats[u'sleep']        += asn - stats[u'last_updated']
+        stats[u'last_updated']  = asn
+        return stats
+
+    # EB scanning (see Connectivity.start_scanning())
+
+    def startScanning(self):
+        # idle listen at every slot from the next one on; the stats are
+        # updated for all these slots at once
+        self.scanningSince = self.engine.getAsn() + 1
+
+    def stopScanning(self):
+        intraSlotOrder = self.engine.intraSlotOrder
+        if (
+                (intraSlotOrder is None)
+                or
+                (intraSlotOrder >= d.INTRASLOTORDER_PROPAGATE)
+            ):
+            # we listened in the current slot
+            self._update_scanning_stats(self.engine.getAsn())
+        else:
+            self._update_scanning_stats(self.engine.getAsn() - 1)
+        self.scanningSince = None
+
+    def startScanningRx(self, channel):
+        """listen in the current slot, while scanning, to a frame
+        Connectivity found on the channel; rxDone() follows"""
+        assert channel in d.TSCH_HOPPING_SEQUENCE
+        assert self.state != d.RADIO_STATE_RX
+        self._update_scanning_stats(self.engine.getAsn() - 1)
+        self.scanningSince = self.engine.getAsn() + 1
+        self.state   = d.RADIO_STATE_RX
+        self.channel = channel
+
+    def _update_scanning_stats(self, last_asn):
+        # account for idle listening at every slot from scanningSince to
+        # last_asn, as _update_stats() would slot by slot
+        if (
+                (self.scanningSince is not None)
+                and
+                (self.scanningSince <= last_asn)
+            ):
+            self.stats[u'sleep'] += (
+                self.scanningSince - self.stats[u'last_updated'] - 1
+            )
+            self.stats[u'idle_listen'] += last_asn - self.scanningSince + 1
+            self.stats[u'last_updated'] = last_asn
+            self.scanningSince = last_asn + 1
+
     def _update_stats(self, stats_type):
         self.stats[u'sleep'] += (
             self.engine.getAsn() - self.stats[u'last_updated'] - 1
@@ -159,6 +225,7 @@ class Radio(object):
         )
 
     def _log_stats(self):
+        self._update_scanning_stats(self.engine.getAsn())
         self.log(
             SimEngine.SimLog.LOG_RADIO_STATS,
             {
@@ -16,7 +16,6 @@ from __future__ import division
 from builtins import str
 from builtins import object
 from past.utils import old_div
-import random
 import math
 import sys
 
@@ -50,10 +49,14 @@ class Rpl(object):
         # store params
         self.mote                      = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                    = SimEngine.SimEngine.SimEngine()
-        self.settings                  = SimEngine.SimSettings.SimSettings()
-        self.log                       = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.engine                    = mote.engine
+        self.settings                  = mote.settings
+        self.log                       = mote.log
+        self.rng                       = self.engine.random_streams.get(
+            u'rpl',
+            mote.id
+        )
 
         # local variables
         self.dodagId                   = None
@@ -62,7 +65,9 @@ class Rpl(object):
             i_min    = pow(2, self.DEFAULT_DIO_INTERVAL_MIN),
             i_max    = self.DEFAULT_DIO_INTERVAL_DOUBLINGS,
             k        = self.DEFAULT_DIO_REDUNDANCY_CONSTANT,
-            callback = self._send_DIO
+            callback = self._send_DIO,
+            engine   = self.engine,
+            rng      = self.engine.random_streams.get(u'trickle', mote.id)
         )
         self.parentChildfromDAOs       = {}      # dictionary containing parents of each node
         self._tx_stat                  = {}      # indexed by mote_id
@@ -122,6 +127,27 @@ class Rpl(object):
         self.trickle_timer.stop()
         self.stop_dis_timer()
 
+    def set_initial_parent(self, parent_mac_addr, parent_rank, dodagId):
+        """
+        Join the DODAG through parent_mac_addr, which advertises parent_rank,
+        as if its DIO had been received, in a network which starts converged
+        (see SimEngine). Unlike a parent change, this doesn't trigger a 6P
+        transaction nor the first DAO: the caller installs the cells to the
+        parent and the source route at the root.
+        """
+        assert not self.mote.dagRoot
+        self.of.set_initial_parent(parent_mac_addr, parent_rank)
+        self.log(
+            SimEngine.SimLog.LOG_RPL_CHURN,
+            {
+                "_mote_id":        self.mote.id,
+                "rank":            self.of.rank,
+                "preferredParent": parent_mac_addr
+            }
+        )
+        self.join_dodag(dodagId)
+        self._schedule_sendDAO()
+
     def indicate_tx(self, cell, dstMac, isACKed):
         self.of.update_etx(cell, dstMac, isACKed)
 
@@ -381,7 +407,7 @@ class Rpl(object):
             asnDiff = 1
         else:
             asnDiff = int(math.ceil(
-                old_div(random.uniform(
+                old_div(self.rng.uniform(
                     0.8 * self.settings.rpl_daoPeriod,
                     1.2 * self.settings.rpl_daoPeriod
                 ), self.settings.tsch_slotDuration))
@@ -541,6 +567,10 @@ class RplOFBase(object):
     def poison_rpl_parent(self, mac_addr):
         pass
 
+    def set_initial_parent(self, mac_addr, advertised_rank):
+        # select the parent without notifying it; see Rpl.set_initial_parent()
+        raise NotImplementedError()
+
 
 class RplOFNone(RplOFBase):
     def set_rank(self, new_rank):
@@ -549,6 +579,10 @@ class RplOFNone(RplOFBase):
     def set_preferred_parent(self, new_preferred_parent):
         self.preferred_parent = new_preferred_parent
 
+    def set_initial_parent(self, mac_addr, advertised_rank):
+        self.set_preferred_parent(mac_addr)
+        self.set_rank(advertised_rank + d.RPL_MINHOPRANKINCREASE)
+
 
 class RplOF0(RplOFBase):
 
@@ -645,9 +679,15 @@ class RplOF0(RplOFBase):
             self.rank = None
             self._update_preferred_parent()
 
+    def set_initial_parent(self, mac_addr, advertised_rank):
+        neighbor = self._add_neighbor(mac_addr)
+        self._update_neighbor_rank(neighbor, advertised_rank)
+        self.preferred_parent = neighbor
+        self.rank = self._calculate_rank(neighbor)
+
     def update_etx(self, cell, mac_addr, isACKed):
         assert mac_addr != d.BROADCAST_ADDRESS
-        assert d.CELLOPTION_TX in cell.options
+        assert cell.is_tx_on()
 
         neighbor = self._find_neighbor(mac_addr)
         if neighbor is None:
@@ -922,13 +962,7 @@ class RplOFBestLinkPDR(RplOF0):
         else:
             if neighbor is None:
                 # add a new neighbor entry
-                neighbor = {
-                    u'mac_addr': src_mac,
-                    u'mote_id': self._find_mote_id(src_mac),
-                    u'rank': None,
-                    u'mean_link_pdr': 0
-                }
-                self.neighbors.append(neighbor)
+                neighbor = self._add_neighbor(src_mac)
 
             # update the advertised rank and path ETX
             neighbor[u'rank'] = dio[u'app'][u'rank']
@@ -939,6 +973,13 @@ class RplOFBestLinkPDR(RplOF0):
         # select the best neighbor the link to whom is the heighest PDR
         self._update_preferred_parent()
 
+    def set_initial_parent(self, mac_addr, advertised_rank):
+        neighbor = self._add_neighbor(mac_addr)
+        neighbor[u'rank'] = advertised_rank
+        self._update_link_quality_of_neighbors()
+        self.preferred_parent = neighbor
+        self.rank = self._calculate_rank(neighbor)
+
     def poison_rpl_parent(self, mac_addr):
         neighbor = self._find_neighbor(mac_addr)
         if neighbor is not None:
@@ -982,6 +1023,16 @@ class RplOFBestLinkPDR(RplOF0):
             rank = neighbor[u'rank'] + rank_increase
         return rank
 
+    def _add_neighbor(self, mac_addr):
+        neighbor = {
+            u'mac_addr': mac_addr,
+            u'mote_id': self._find_mote_id(mac_addr),
+            u'rank': None,
+            u'mean_link_pdr': 0
+        }
+        self.neighbors.append(neighbor)
+        return neighbor
+
     def _find_neighbor(self, mac_addr):
         ret_val = None
         for neighbor in self.neighbors:
@@ -10,7 +10,6 @@ from builtins import str
 from builtins import object
 from past.utils import old_div
 import copy
-import random
 
 # Mote sub-modules
 from . import MoteDefines as d
@@ -37,10 +36,14 @@ class SecJoin(object):
         # store params
         self.mote                           = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                         = SimEngine.SimEngine.SimEngine()
-        self.settings                       = SimEngine.SimSettings.SimSettings()
-        self.log                            = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.engine                         = mote.engine
+        self.settings                       = mote.settings
+        self.log                            = mote.log
+        self.rng                            = self.engine.random_streams.get(
+            u'secjoin',
+            mote.id
+        )
 
         # local variables
         self._isJoined                      = False
@@ -101,7 +104,7 @@ class SecJoin(object):
 
             # initialize request timeout; pick a number randomly between
             # TIMEOUT_BASE and (TIMEOUT_BASE * TIMEOUT_RANDOM_FACTOR)
-            self._request_timeout  = self.TIMEOUT_BASE * random.uniform(1, self.TIMEOUT_RANDOM_FACTOR)
+            self._request_timeout  = self.TIMEOUT_BASE * self.rng.uniform(1, self.TIMEOUT_RANDOM_FACTOR)
 
             self._send_join_request()
         else:
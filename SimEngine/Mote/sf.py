@@ -3,7 +3,7 @@ from __future__ import absolute_import
 
 from builtins import range
 from builtins import object
-import random
+import functools
 import sys
 from abc import abstractmethod
 
@@ -21,7 +21,7 @@ from . import sixp
 
 class SchedulingFunction(object):
     def __new__(cls, mote):
-        settings    = SimEngine.SimSettings.SimSettings()
+        settings    = mote.settings
         class_name  = u'SchedulingFunction{0}'.format(settings.sf_class)
         return getattr(sys.modules[__name__], class_name)(mote)
 
@@ -34,10 +34,11 @@ class SchedulingFunctionBase(object):
         # store params
         self.mote            = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings        = SimEngine.SimSettings.SimSettings()
-        self.engine          = SimEngine.SimEngine.SimEngine()
-        self.log             = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.settings        = mote.settings
+        self.engine          = mote.engine
+        self.log             = mote.log
+        self.rng             = self.engine.random_streams.get(u'sf', mote.id)
 
     # ======================= public ==========================================
 
@@ -57,6 +58,14 @@ class SchedulingFunctionBase(object):
         '''
         raise NotImplementedError() # abstractmethod
 
+    @abstractmethod
+    def set_initial_parent(self, parent_mac_addr):
+        """
+        installs the cells to the parent of a network which starts
+        converged, see Rpl.set_initial_parent()
+        """
+        raise NotImplementedError() # abstractmethod
+
     # === indications from other layers
 
     @abstractmethod
@@ -105,6 +114,9 @@ class SchedulingFunctionSFNone(SchedulingFunctionBase):
     def stop(self):
         pass # do nothing
 
+    def set_initial_parent(self, parent_mac_addr):
+        pass # do nothing
+
     def indication_neighbor_added(self, neighbor_mac_addr):
         pass # do nothing
 
@@ -193,6 +205,31 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 (self.mote.id, u'_housekeeping_collision')
             )
 
+    def set_initial_parent(self, parent_mac_addr):
+        # install the cells which the 6P ADD transaction triggered by a new
+        # parent would, at both ends: the parent selects them among the
+        # cells we propose
+        parent_sf = self.engine.get_mote_by_mac_addr(parent_mac_addr).sf
+        cell_list = self._create_available_cell_list(self.DEFAULT_CELL_LIST_LEN)
+        self._unlock_cells(cell_list)
+        parent_available_slots = parent_sf._get_available_slots()
+        candidate_cells = [
+            c for c in cell_list
+            if c[u'slotOffset'] in parent_available_slots
+        ]
+        if len(candidate_cells) > self.NUM_INITIAL_NEGOTIATED_TX_CELLS:
+            candidate_cells = self.rng.sample(
+                candidate_cells,
+                self.NUM_INITIAL_NEGOTIATED_TX_CELLS
+            )
+        self._add_cells(parent_mac_addr, candidate_cells, self.TX_CELL_OPT)
+        parent_sf._add_cells(
+            self.mote.get_mac_addr(),
+            candidate_cells,
+            self.RX_CELL_OPT
+        )
+        self.retry_count[parent_mac_addr] = -1 # done
+
     # === indications from other layers
 
     def indication_neighbor_added(self, neighbor_mac_addr):
@@ -307,18 +344,10 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             )
 
         # clear all the cells allocated for the old parent
-        def _callback(event, packet):
-            if event == d.SIXP_CALLBACK_EVENT_FAILURE:
-                # optimization which is not mentioned in 6P/MSF spec: remove
-                # the outstanding transaction because we're deleting all the
-                # cells scheduled to the peer now. The outstanding transaction
-                # should have the same transaction key as the packet we were
-                # trying to send.
-                self.mote.sixp.abort_transaction(
-                    initiator_mac_addr=packet[u'mac'][u'srcMac'],
-                    responder_mac_addr=packet[u'mac'][u'dstMac']
-                )
-            self._clear_cells(old_parent)
+        _callback = functools.partial(
+            self._old_parent_clear_callback,
+            old_parent
+        )
 
         if old_parent:
             cells = self.mote.tsch.get_cells(
@@ -335,12 +364,25 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 # do nothing
                 pass
 
+    def _old_parent_clear_callback(self, old_parent, event, packet):
+        if event == d.SIXP_CALLBACK_EVENT_FAILURE:
+            # optimization which is not mentioned in 6P/MSF spec: remove
+            # the outstanding transaction because we're deleting all the
+            # cells scheduled to the peer now. The outstanding transaction
+            # should have the same transaction key as the packet we were
+            # trying to send.
+            self.mote.sixp.abort_transaction(
+                initiator_mac_addr=packet[u'mac'][u'srcMac'],
+                responder_mac_addr=packet[u'mac'][u'dstMac']
+            )
+        self._clear_cells(old_parent)
+
     def detect_schedule_inconsistency(self, peerMac):
         # send a CLEAR request to the peer
         self.mote.sixp.send_request(
             dstMac   = peerMac,
             command  = d.SIXP_CMD_CLEAR,
-            callback = lambda event, packet: self._clear_cells(peerMac)
+            callback = functools.partial(self._clear_cells_callback, peerMac)
         )
 
     def recv_request(self, packet):
@@ -452,9 +494,9 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             autonomous_cells = [
                 cell for cell in cells
                 if (
-                        (d.CELLOPTION_TX in cell.options)
+                        cell.is_tx_on()
                         and
-                        (d.CELLOPTION_SHARED in cell.options)
+                        cell.is_shared_on()
                 )
             ]
             if autonomous_cells:
@@ -724,7 +766,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         )
         for cell in cells:
             assert neighbor == cell.mac_addr
-            assert d.CELLOPTION_SHARED not in cell.options
+            assert not cell.is_shared_on()
             self.mote.tsch.deleteCell(
                 slotOffset       = cell.slot_offset,
                 channelOffset    = cell.channel_offset,
@@ -772,11 +814,11 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             # we don't have enough available cells; no cell is selected
             selected_slots = []
         else:
-            selected_slots = random.sample(available_slots, cell_list_len)
+            selected_slots = self.rng.sample(available_slots, cell_list_len)
 
         cell_list = []
         for slot_offset in selected_slots:
-            channel_offset = random.randint(0, self.settings.phy_numChans - 1)
+            channel_offset = self.rng.randint(0, self.settings.phy_numChans - 1)
             cell_list.append(
                 {
                     'slotOffset'   : slot_offset,
@@ -803,7 +845,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         ]
 
         if cell_list_len <= len(occupied_cells):
-            cell_list = random.sample(cell_list, cell_list_len)
+            cell_list = self.rng.sample(cell_list, cell_list_len)
 
         return cell_list
 
@@ -924,7 +966,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         if len(candidate_cells) < request[u'app'][u'numCells']:
             cell_list = candidate_cells
         else:
-            cell_list = random.sample(
+            cell_list = self.rng.sample(
                 candidate_cells,
                 request[u'app'][u'numCells']
             )
@@ -934,25 +976,13 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             code = d.SIXP_RC_SUCCESS
 
             self._lock_cells(candidate_cells)
-            def callback(event, packet):
-                if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
-                    # prepare cell options for this responder
-                    if request[u'app'][u'cellOptions'] == self.TX_CELL_OPT:
-                        # invert direction
-                        cell_options = self.RX_CELL_OPT
-                    elif request[u'app'][u'cellOptions'] == self.RX_CELL_OPT:
-                        # invert direction
-                        cell_options = self.TX_CELL_OPT
-                    else:
-                        # Unsupported cell options for MSF
-                        raise Exception()
-
-                    self._add_cells(
-                        neighbor     = peerMac,
-                        cell_list    = cell_list,
-                        cell_options = cell_options
-                )
-                self._unlock_cells(candidate_cells)
+            callback = functools.partial(
+                self._add_response_callback,
+                request,
+                peerMac,
+                cell_list,
+                candidate_cells
+            )
         else:
             code      = d.SIXP_RC_ERR
             cell_list = None
@@ -966,6 +996,34 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             callback    = callback
         )
 
+    def _add_response_callback(
+            self,
+            request,
+            peerMac,
+            cell_list,
+            candidate_cells,
+            event,
+            packet
+        ):
+        if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
+            # prepare cell options for this responder
+            if request[u'app'][u'cellOptions'] == self.TX_CELL_OPT:
+                # invert direction
+                cell_options = self.RX_CELL_OPT
+            elif request[u'app'][u'cellOptions'] == self.RX_CELL_OPT:
+                # invert direction
+                cell_options = self.TX_CELL_OPT
+            else:
+                # Unsupported cell options for MSF
+                raise Exception()
+
+            self._add_cells(
+                neighbor     = peerMac,
+                cell_list    = cell_list,
+                cell_options = cell_options
+        )
+        self._unlock_cells(candidate_cells)
+
     def _create_add_request_callback(
             self,
             neighbor,
@@ -975,70 +1033,88 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             num_tx_cells,
             num_rx_cells
         ):
-        def callback(event, packet):
-            if event == d.SIXP_CALLBACK_EVENT_PACKET_RECEPTION:
-                assert packet[u'app'][u'msgType'] == d.SIXP_MSG_TYPE_RESPONSE
-                if packet[u'app'][u'code'] == d.SIXP_RC_SUCCESS:
-                    # add cells on success of the transaction
-                    self._add_cells(
-                        neighbor     = neighbor,
-                        cell_list    = packet[u'app'][u'cellList'],
-                        cell_options = cell_options
-                    )
+        return functools.partial(
+            self._add_request_callback,
+            neighbor,
+            num_cells,
+            cell_options,
+            cell_list,
+            num_tx_cells,
+            num_rx_cells
+        )
 
-                    # The received CellList could be smaller than the requested
-                    # NumCells; adjust num_{tx,rx}_cells
-                    _num_tx_cells   = num_tx_cells
-                    _num_rx_cells   = num_rx_cells
-                    remaining_cells = num_cells - len(packet[u'app'][u'cellList'])
-                    if remaining_cells > 0:
-                        if cell_options == self.TX_CELL_OPT:
-                            _num_tx_cells -= remaining_cells
-                        elif cell_options == self.RX_CELL_OPT:
-                            _num_rx_cells -= remaining_cells
-                        else:
-                            # never comes here
-                            raise Exception()
-
-                    # start another transaction
-                    self.retry_count[neighbor] = 0
-                    self._request_adding_cells(
-                        neighbor       = neighbor,
-                        num_tx_cells   = _num_tx_cells,
-                        num_rx_cells   = _num_rx_cells
-                    )
-                else:
-                    # TODO: request doesn't succeed; how should we do?
-                    self.retry_count[neighbor] = -1
-
-            elif event == d.SIXP_CALLBACK_EVENT_TIMEOUT:
-                if self.retry_count[neighbor] == self.MAX_RETRY:
-                    # give up this neighbor
-                    if neighbor == self.mote.rpl.getPreferredParent():
-                        self.mote.rpl.of.poison_rpl_parent(neighbor)
-                    self.retry_count[neighbor] = -1 # done
-                else:
-                    # retry
-                    self.retry_count[neighbor] += 1
+    def _add_request_callback(
+            self,
+            neighbor,
+            num_cells,
+            cell_options,
+            cell_list,
+            num_tx_cells,
+            num_rx_cells,
+            event,
+            packet
+        ):
+        if event == d.SIXP_CALLBACK_EVENT_PACKET_RECEPTION:
+            assert packet[u'app'][u'msgType'] == d.SIXP_MSG_TYPE_RESPONSE
+            if packet[u'app'][u'code'] == d.SIXP_RC_SUCCESS:
+                # add cells on success of the transaction
+                self._add_cells(
+                    neighbor     = neighbor,
+                    cell_list    = packet[u'app'][u'cellList'],
+                    cell_options = cell_options
+                )
+
+                # The received CellList could be smaller than the requested
+                # NumCells; adjust num_{tx,rx}_cells
+                _num_tx_cells   = num_tx_cells
+                _num_rx_cells   = num_rx_cells
+                remaining_cells = num_cells - len(packet[u'app'][u'cellList'])
+                if remaining_cells > 0:
                     if cell_options == self.TX_CELL_OPT:
-                        _num_tx_cells = num_cells + num_tx_cells
-                        _num_rx_cells = num_rx_cells
+                        _num_tx_cells -= remaining_cells
+                    elif cell_options == self.RX_CELL_OPT:
+                        _num_rx_cells -= remaining_cells
                     else:
-                        _num_tx_cells = num_tx_cells
-                        _num_rx_cells = num_cells + num_rx_cells
-                    self._request_adding_cells(
-                        neighbor       = neighbor,
-                        num_tx_cells   = _num_tx_cells,
-                        num_rx_cells   = _num_rx_cells
-                    )
+                        # never comes here
+                        raise Exception()
+
+                # start another transaction
+                self.retry_count[neighbor] = 0
+                self._request_adding_cells(
+                    neighbor       = neighbor,
+                    num_tx_cells   = _num_tx_cells,
+                    num_rx_cells   = _num_rx_cells
+                )
             else:
-                # ignore other events
-                pass
+                # TODO: request doesn't succeed; how should we do?
+                self.retry_count[neighbor] = -1
 
-            # unlock the slots used in this transaction
-            self._unlock_cells(cell_list)
+        elif event == d.SIXP_CALLBACK_EVENT_TIMEOUT:
+            if self.retry_count[neighbor] == self.MAX_RETRY:
+                # give up this neighbor
+                if neighbor == self.mote.rpl.getPreferredParent():
+                    self.mote.rpl.of.poison_rpl_parent(neighbor)
+                self.retry_count[neighbor] = -1 # done
+            else:
+                # retry
+                self.retry_count[neighbor] += 1
+                if cell_options == self.TX_CELL_OPT:
+                    _num_tx_cells = num_cells + num_tx_cells
+                    _num_rx_cells = num_rx_cells
+                else:
+                    _num_tx_cells = num_tx_cells
+                    _num_rx_cells = num_cells + num_rx_cells
+                self._request_adding_cells(
+                    neighbor       = neighbor,
+                    num_tx_cells   = _num_tx_cells,
+                    num_rx_cells   = _num_rx_cells
+                )
+        else:
+            # ignore other events
+            pass
 
-        return callback
+        # unlock the slots used in this transaction
+        self._unlock_cells(cell_list)
 
     # DELETE command related stuff
     def _request_deleting_cells(
@@ -1102,15 +1178,14 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 (num_cells <= len(candidate_cell_list))
             ):
             code = d.SIXP_RC_SUCCESS
-            cell_list = random.sample(candidate_cell_list, num_cells)
+            cell_list = self.rng.sample(candidate_cell_list, num_cells)
 
-            def callback(event, packet):
-                if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
-                    self._delete_cells(
-                        neighbor     = peerMac,
-                        cell_list    = cell_list,
-                        cell_options = our_cell_options
-                )
+            callback = functools.partial(
+                self._delete_response_callback,
+                peerMac,
+                cell_list,
+                our_cell_options
+            )
         else:
             code      = d.SIXP_RC_ERR
             cell_list = None
@@ -1124,47 +1199,74 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             callback    = callback
         )
 
+    def _delete_response_callback(
+            self,
+            peerMac,
+            cell_list,
+            our_cell_options,
+            event,
+            packet
+        ):
+        if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
+            self._delete_cells(
+                neighbor     = peerMac,
+                cell_list    = cell_list,
+                cell_options = our_cell_options
+        )
+
     def _create_delete_request_callback(
             self,
             neighbor,
             num_cells,
             cell_options
         ):
-        def callback(event, packet):
-            if (
-                    (event == d.SIXP_CALLBACK_EVENT_PACKET_RECEPTION)
-                    and
-                    (packet[u'app'][u'msgType'] == d.SIXP_MSG_TYPE_RESPONSE)
-                ):
-                self.retry_count[neighbor] = -1
-                if packet[u'app'][u'code'] == d.SIXP_RC_SUCCESS:
-                    self._delete_cells(
-                        neighbor     = neighbor,
-                        cell_list    = packet[u'app'][u'cellList'],
-                        cell_options = cell_options
-                    )
-                else:
-                    # TODO: request doesn't succeed; how should we do?
-                    pass
-            elif event == d.SIXP_CALLBACK_EVENT_TIMEOUT:
-                if self.retry_count[neighbor] == self.MAX_RETRY:
-                    # give it up
-                    self.retry_count[neighbor] = -1
-                    if neighbor == self.mote.rpl.getPreferredParent():
-                        self.mote.rpl.of.poison_rpl_parent(neighbor)
-                else:
-                    # retry
-                    self.retry_count[neighbor] += 1
-                    self._request_deleting_cells(
-                        neighbor,
-                        num_cells,
-                        cell_options
-                    )
+        return functools.partial(
+            self._delete_request_callback,
+            neighbor,
+            num_cells,
+            cell_options
+        )
+
+    def _delete_request_callback(
+            self,
+            neighbor,
+            num_cells,
+            cell_options,
+            event,
+            packet
+        ):
+        if (
+                (event == d.SIXP_CALLBACK_EVENT_PACKET_RECEPTION)
+                and
+                (packet[u'app'][u'msgType'] == d.SIXP_MSG_TYPE_RESPONSE)
+            ):
+            self.retry_count[neighbor] = -1
+            if packet[u'app'][u'code'] == d.SIXP_RC_SUCCESS:
+                self._delete_cells(
+                    neighbor     = neighbor,
+                    cell_list    = packet[u'app'][u'cellList'],
+                    cell_options = cell_options
+                )
             else:
-                # ignore other events
+                # TODO: request doesn't succeed; how should we do?
                 pass
-
-        return callback
+        elif event == d.SIXP_CALLBACK_EVENT_TIMEOUT:
+            if self.retry_count[neighbor] == self.MAX_RETRY:
+                # give it up
+                self.retry_count[neighbor] = -1
+                if neighbor == self.mote.rpl.getPreferredParent():
+                    self.mote.rpl.of.poison_rpl_parent(neighbor)
+            else:
+                # retry
+                self.retry_count[neighbor] += 1
+                self._request_deleting_cells(
+                    neighbor,
+                    num_cells,
+                    cell_options
+                )
+        else:
+            # ignore other events
+            pass
 
     # RELOCATE command related stuff
     def _request_relocating_cells(
@@ -1210,53 +1312,16 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             return
 
         # prepare callback
-        def callback(event, packet):
-            if event == d.SIXP_CALLBACK_EVENT_PACKET_RECEPTION:
-                assert packet[u'app'][u'msgType'] == d.SIXP_MSG_TYPE_RESPONSE
-                if packet[u'app'][u'code'] == d.SIXP_RC_SUCCESS:
-                    # perform relocations
-                    num_relocations = len(packet[u'app'][u'cellList'])
-                    self._relocate_cells(
-                        neighbor      = neighbor,
-                        src_cell_list = relocation_cell_list[:num_cells],
-                        dst_cell_list = packet[u'app'][u'cellList'],
-                        cell_options  = cell_options
-                    )
-
-                    # adjust num_relocating_cells and cell_list
-                    _num_relocating_cells = (
-                        num_relocating_cells + num_cells - num_relocations
-                    )
-                    _cell_list = (
-                        cell_list + relocation_cell_list[num_relocations:]
-                    )
-
-                    # start another transaction
-                    self.retry_count[neighbor] = 0
-                    self._request_relocating_cells(
-                        neighbor             = neighbor,
-                        cell_options         = cell_options,
-                        num_relocating_cells = _num_relocating_cells,
-                        cell_list            = _cell_list
-                    )
-            elif event == d.SIXP_CALLBACK_EVENT_TIMEOUT:
-                if self.retry_count[neighbor] == self.MAX_RETRY:
-                    # give up this neighbor
-                    if neighbor == self.mote.rpl.getPreferredParent():
-                        self.mote.rpl.of.poison_rpl_parent(neighbor)
-                    self.retry_count[neighbor] = -1 # done
-                else:
-                    # retry
-                    self.retry_count[neighbor] += 1
-                    self._request_relocating_cells(
-                        neighbor,
-                        cell_options,
-                        num_relocating_cells,
-                        cell_list
-                    )
-
-            # unlock the slots used in this transaction
-            self._unlock_cells(candidate_cell_list)
+        callback = functools.partial(
+            self._relocate_request_callback,
+            neighbor,
+            cell_options,
+            num_cells,
+            num_relocating_cells,
+            cell_list,
+            relocation_cell_list,
+            candidate_cell_list
+        )
 
         # send a request
         self.mote.sixp.send_request(
@@ -1269,6 +1334,65 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             callback           = callback
         )
 
+    def _relocate_request_callback(
+            self,
+            neighbor,
+            cell_options,
+            num_cells,
+            num_relocating_cells,
+            cell_list,
+            relocation_cell_list,
+            candidate_cell_list,
+            event,
+            packet
+        ):
+        if event == d.SIXP_CALLBACK_EVENT_PACKET_RECEPTION:
+            assert packet[u'app'][u'msgType'] == d.SIXP_MSG_TYPE_RESPONSE
+            if packet[u'app'][u'code'] == d.SIXP_RC_SUCCESS:
+                # perform relocations
+                num_relocations = len(packet[u'app'][u'cellList'])
+                self._relocate_cells(
+                    neighbor      = neighbor,
+                    src_cell_list = relocation_cell_list[:num_cells],
+                    dst_cell_list = packet[u'app'][u'cellList'],
+                    cell_options  = cell_options
+                )
+
+                # adjust num_relocating_cells and cell_list
+                _num_relocating_cells = (
+                    num_relocating_cells + num_cells - num_relocations
+                )
+                _cell_list = (
+                    cell_list + relocation_cell_list[num_relocations:]
+                )
+
+                # start another transaction
+                self.retry_count[neighbor] = 0
+                self._request_relocating_cells(
+                    neighbor             = neighbor,
+                    cell_options         = cell_options,
+                    num_relocating_cells = _num_relocating_cells,
+                    cell_list            = _cell_list
+                )
+        elif event == d.SIXP_CALLBACK_EVENT_TIMEOUT:
+            if self.retry_count[neighbor] == self.MAX_RETRY:
+                # give up this neighbor
+                if neighbor == self.mote.rpl.getPreferredParent():
+                    self.mote.rpl.of.poison_rpl_parent(neighbor)
+                self.retry_count[neighbor] = -1 # done
+            else:
+                # retry
+                self.retry_count[neighbor] += 1
+                self._request_relocating_cells(
+                    neighbor,
+                    cell_options,
+                    num_relocating_cells,
+                    cell_list
+                )
+
+        # unlock the slots used in this transaction
+        self._unlock_cells(candidate_cell_list)
+
     def _receive_relocate_request(self, request):
         # for quick access
         num_cells        = request[u'app'][u'numCells']
@@ -1316,7 +1440,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             cell_list = []
             if available_slots:
                 # prepare response
-                selected_slots = random.sample(available_slots, num_cells)
+                selected_slots = self.rng.sample(available_slots, num_cells)
                 for cell in candidate_cells:
                     if cell[u'slotOffset'] in selected_slots:
                         cell_list.append(cell)
@@ -1327,16 +1451,13 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 pass
 
             # prepare callback
-            def callback(event, packet):
-                if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
-                    num_relocations = len(cell_list)
-                    self._relocate_cells(
-                        neighbor      = peerMac,
-                        src_cell_list = relocating_cells[:num_relocations],
-                        dst_cell_list = cell_list,
-                        cell_options  = our_cell_options
-                    )
-                self._unlock_cells(cell_list)
+            callback = functools.partial(
+                self._relocate_response_callback,
+                peerMac,
+                relocating_cells,
+                cell_list,
+                our_cell_options
+            )
 
         else:
             code      = d.SIXP_RC_ERR
@@ -1351,15 +1472,35 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             callback    = callback
         )
 
+    def _relocate_response_callback(
+            self,
+            peerMac,
+            relocating_cells,
+            cell_list,
+            our_cell_options,
+            event,
+            packet
+        ):
+        if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
+            num_relocations = len(cell_list)
+            self._relocate_cells(
+                neighbor      = peerMac,
+                src_cell_list = relocating_cells[:num_relocations],
+                dst_cell_list = cell_list,
+                cell_options  = our_cell_options
+            )
+        self._unlock_cells(cell_list)
+
 
     # CLEAR command related stuff
     def _receive_clear_request(self, request):
 
         peerMac = request[u'mac'][u'srcMac']
 
-        def callback(event, packet):
-            # remove all the cells no matter what happens
-            self._clear_cells(peerMac)
+        callback = functools.partial(
+            self._clear_cells_callback,
+            peerMac
+        )
 
         # create CLEAR response
         self.mote.sixp.send_response(
@@ -1368,6 +1509,10 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             callback    = callback
         )
 
+    def _clear_cells_callback(self, peerMac, event, packet):
+        # remove all the cells no matter what happens
+        self._clear_cells(peerMac)
+
     # autonomous cell
     def _compute_autonomous_cell(self, mac_addr):
         slotframe = self.mote.tsch.get_slotframe(
@@ -13,7 +13,6 @@ from builtins import object
 from abc import abstractmethod
 import copy
 import math
-import random
 
 import netaddr
 
@@ -34,10 +33,10 @@ class Sixlowpan(object):
         # store params
         self.mote                 = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings             = SimEngine.SimSettings.SimSettings()
-        self.engine               = SimEngine.SimEngine.SimEngine()
-        self.log                  = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.settings             = mote.settings
+        self.engine               = mote.engine
+        self.log                  = mote.log
 
         # local variables
         self.fragmentation        = globals()[self.settings.fragmentation](self)
@@ -169,8 +168,13 @@ class Sixlowpan(object):
 
             # source routing header
             elif 'sourceRoute' in packet[u'net']:
-                packet[u'net'][u'dstIp'] = packet[u'net'][u'sourceRoute'].pop(0)
-                if len(packet[u'net'][u'sourceRoute']) == 0:
+                # the net header is shared with the transmitter: change a copy
+                packet[u'net'] = dict(packet[u'net'])
+                sourceRoute    = packet[u'net'][u'sourceRoute']
+                packet[u'net'][u'dstIp'] = sourceRoute[0]
+                if len(sourceRoute) > 1:
+                    packet[u'net'][u'sourceRoute'] = sourceRoute[1:]
+                else:
                     del packet[u'net'][u'sourceRoute']
 
         # handle packet
@@ -232,6 +236,7 @@ class Sixlowpan(object):
                         return
                     else:
                         # set Rank-Error and forward this packet
+                        packet[u'net'] = dict(packet[u'net'])
                         packet[u'net'][u'rank_error'] = True
 
                 # forward
@@ -261,15 +266,18 @@ class Sixlowpan(object):
             goOn = False
 
         # === create forwarded packet
+        # the headers of rxPacket are shared with its transmitter: the
+        # forwarded packet shares the ones it doesn't change, and gets a copy
+        # of the others
         if goOn:
             fwdPacket             = {}
             # type
-            fwdPacket[u'type']     = copy.deepcopy(rxPacket[u'type'])
+            fwdPacket[u'type']     = rxPacket[u'type']
             # app
             if 'app' in rxPacket:
-                fwdPacket[u'app']  = copy.deepcopy(rxPacket[u'app'])
+                fwdPacket[u'app']  = rxPacket[u'app']
             # net
-            fwdPacket[u'net']      = copy.deepcopy(rxPacket[u'net'])
+            fwdPacket[u'net']      = dict(rxPacket[u'net'])
             if 'hop_limit' in fwdPacket[u'net']:
                 assert fwdPacket[u'net'][u'hop_limit'] > 1
                 fwdPacket[u'net'][u'hop_limit'] -= 1
@@ -277,7 +285,7 @@ class Sixlowpan(object):
             # mac
             if fwdPacket[u'type'] == d.PKT_TYPE_FRAG:
                 # fragment already has mac header (FIXME: why?)
-                fwdPacket[u'mac']  = copy.deepcopy(rxPacket[u'mac'])
+                fwdPacket[u'mac']  = dict(rxPacket[u'mac'])
             else:
                 # find next hop
                 dstMac = self._find_nexthop_mac_addr(fwdPacket)
@@ -386,23 +394,27 @@ class Fragmentation(object):
         # store params
         self.sixlowpan            = sixlowpan
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings             = SimEngine.SimSettings.SimSettings()
-        self.engine               = SimEngine.SimEngine.SimEngine()
-        self.log                  = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.settings             = sixlowpan.mote.settings
+        self.engine               = sixlowpan.mote.engine
+        self.log                  = sixlowpan.mote.log
 
         # local variables
         self.mote                 = sixlowpan.mote
-        self.next_datagram_tag    = random.randint(0, 2**16-1)
+        self.rng                  = self.engine.random_streams.get(
+            u'fragmentation',
+            self.mote.id
+        )
+        self.next_datagram_tag    = self.rng.randint(0, 2**16-1)
         # "reassembly_buffers" has mote instances as keys. Each value is a list.
         # A list is indexed by incoming datagram_tags.
         #
-        # An element of the list a dictionary consisting of three key-values:
-        # "net", "expiration" and "fragments".
+        # An element of the list a dictionary consisting of four key-values:
+        # "net", "expiration", "offsets" and "received_length".
         #
         # - "net" has srcIp and dstIp of the packet
-        # - "fragments" holds received fragments, although only their
-        # datagram_offset and lengths are stored in the "fragments" list.
+        # - "offsets" is the set of the datagram_offsets of the received
+        # fragments, and "received_length" the sum of their lengths
         self.reassembly_buffers   = {}
 
     #======================== public ==========================================
@@ -447,6 +459,10 @@ class Fragmentation(object):
                     'original_packet_type': original_packet_type,
                 }
             }
+
+        The fragments are views of the packet: they share its app header and
+        its sourceRoute, which must not be changed, and get a small header
+        of their own.
         """
         assert packet[u'type'] in [
             d.PKT_TYPE_DATA,
@@ -466,52 +482,53 @@ class Fragmentation(object):
 
             # choose tag (same for all fragments)
             outgoing_datagram_tag = self._get_next_datagram_tag()
-            number_of_fragments   = int(math.ceil(float(packet[u'net'][u'packet_length']) / self.settings.tsch_max_payload_len))
+            datagram_size         = packet[u'net'][u'packet_length']
+            max_payload_len       = self.settings.tsch_max_payload_len
+            number_of_fragments   = int(math.ceil(float(datagram_size) / max_payload_len))
             datagram_offset       = 0
 
             for i in range(0, number_of_fragments):
 
-                # common part of fragment packet
-                fragment = {
-                    u'type':                d.PKT_TYPE_FRAG,
-                    u'net': {
-                        u'datagram_size':   packet[u'net'][u'packet_length'],
-                        u'datagram_tag':    outgoing_datagram_tag,
-                        u'datagram_offset': datagram_offset
-                    }
-                }
-
                 # put additional fields to the first and the last fragment
                 if   i == 0:
                     # first fragment
 
-                    # copy 'net' header
-                    for key, value in list(packet[u'net'].items()):
-                        fragment[u'net'][key] = value
-                    if u'sourceRoute' in packet[u'net']:
-                        fragment[u'net'][u'sourceRoute']      = copy.deepcopy(packet[u'net'][u'sourceRoute'])
+                    # copy 'net' header; sourceRoute, if any, is shared
+                    fragment_net = dict(packet[u'net'])
                 elif i == (number_of_fragments - 1):
                     # the last fragment
 
-                    # add original_packet_type and 'app' field
-                    fragment[u'app']                         = copy.deepcopy(packet[u'app'])
-                    fragment[u'net'][u'original_packet_type'] = packet[u'type']
+                    # add original_packet_type
+                    fragment_net = {
+                        u'original_packet_type': packet[u'type']
+                    }
+                else:
+                    fragment_net = {}
+
+                # common part of fragment packet
+                fragment_net[u'datagram_size']   = datagram_size
+                fragment_net[u'datagram_tag']    = outgoing_datagram_tag
+                fragment_net[u'datagram_offset'] = datagram_offset
+                fragment = {
+                    u'type':                d.PKT_TYPE_FRAG,
+                    u'net':                 fragment_net,
+                }
+                if i == (number_of_fragments - 1):
+                    # the last fragment shares the 'app' field
+                    fragment[u'app'] = packet[u'app']
 
                 # populate packet_length
-                if  (
-                        (i == 0) and
-                        ((packet[u'net'][u'packet_length'] % self.settings.tsch_max_payload_len) > 0)
-                    ):
+                if  (i == 0) and ((datagram_size % max_payload_len) > 0):
                     # slop is in the first fragment
-                    fragment[u'net'][u'packet_length'] = packet[u'net'][u'packet_length'] % self.settings.tsch_max_payload_len
+                    fragment_net[u'packet_length'] = datagram_size % max_payload_len
                 else:
-                    fragment[u'net'][u'packet_length'] = self.settings.tsch_max_payload_len
+                    fragment_net[u'packet_length'] = max_payload_len
 
                 # update datagram_offset which will be used for the next fragment
-                datagram_offset += fragment[u'net'][u'packet_length']
+                datagram_offset += fragment_net[u'packet_length']
 
-                # copy the MAC header
-                fragment[u'mac'] = copy.deepcopy(packet[u'mac'])
+                # copy the MAC header, which TSCH changes per fragment
+                fragment[u'mac'] = dict(packet[u'mac'])
 
                 # add the fragment to a returning list
                 returnVal += [fragment]
@@ -568,38 +585,38 @@ class Fragmentation(object):
                 self.reassembly_buffers[srcMac] = {}
             if incoming_datagram_tag not in self.reassembly_buffers[srcMac]:
                 self.reassembly_buffers[srcMac][incoming_datagram_tag] = {
-                    u'expiration': self.engine.getAsn() + buffer_lifetime,
-                    u'fragments': []
+                    u'expiration':      self.engine.getAsn() + buffer_lifetime,
+                    u'offsets':         set(),
+                    u'received_length': 0
                 }
+        reassembly_buffer = self.reassembly_buffers[srcMac][incoming_datagram_tag]
 
-        if datagram_offset not in [x[u'datagram_offset'] for x in self.reassembly_buffers[srcMac][incoming_datagram_tag][u'fragments']]:
+        if datagram_offset not in reassembly_buffer[u'offsets']:
 
-            if fragment[u'net'][u'datagram_offset'] == 0:
+            if datagram_offset == 0:
                 # store srcIp and dstIp which only the first fragment has
-                self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'] = copy.deepcopy(fragment[u'net'])
-                del self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'][u'datagram_size']
-                del self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'][u'datagram_offset']
-                del self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'][u'datagram_tag']
-
-            self.reassembly_buffers[srcMac][incoming_datagram_tag][u'fragments'].append({
-                u'datagram_offset': datagram_offset,
-                u'fragment_length': fragment[u'net'][u'packet_length']
-            })
+                reassembly_buffer[u'net'] = dict(fragment[u'net'])
+                del reassembly_buffer[u'net'][u'datagram_size']
+                del reassembly_buffer[u'net'][u'datagram_offset']
+                del reassembly_buffer[u'net'][u'datagram_tag']
+
+            reassembly_buffer[u'offsets'].add(datagram_offset)
+            reassembly_buffer[u'received_length'] += fragment[u'net'][u'packet_length']
         else:
             # it's a duplicate fragment
             return
 
         # check whether we have a full packet in the reassembly buffer
-        total_fragment_length = sum([f[u'fragment_length'] for f in self.reassembly_buffers[srcMac][incoming_datagram_tag][u'fragments']])
-        assert total_fragment_length <= datagram_size
-        if total_fragment_length < datagram_size:
+        assert reassembly_buffer[u'received_length'] <= datagram_size
+        if reassembly_buffer[u'received_length'] < datagram_size:
             # reassembly is not completed
             return
 
-        # construct an original packet
+        # construct an original packet, with the net header of the buffer,
+        # which is deleted
         packet = copy.copy(fragment)
         packet[u'type'] = fragment[u'net'][u'original_packet_type']
-        packet[u'net'] = copy.deepcopy(self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'])
+        packet[u'net'] = reassembly_buffer[u'net']
         packet[u'net'][u'packet_length'] = datagram_size
 
         # reassembly is done, delete buffer
@@ -743,10 +760,11 @@ class FragmentForwarding(Fragmentation):
 
             else:
                 # need to create a new packet in order to distinguish between the
-                # received packet and a forwarding packet.
+                # received packet and a forwarding packet; it shares the
+                # headers it doesn't change with the received fragment.
                 fwdFragment = {
-                    u'type':       copy.deepcopy(fragment[u'type']),
-                    u'net':        copy.deepcopy(fragment[u'net']),
+                    u'type':       fragment[u'type'],
+                    u'net':        dict(fragment[u'net']),
                     u'mac': {
                         u'srcMac': self.mote.get_mac_addr(),
                         u'dstMac': self.vrb_table[srcMac][incoming_datagram_tag][u'dstMac']
@@ -758,7 +776,7 @@ class FragmentForwarding(Fragmentation):
 
                 # copy app field if necessary
                 if u'app' in fragment:
-                    fwdFragment[u'app'] = copy.deepcopy(fragment[u'app'])
+                    fwdFragment[u'app'] = fragment[u'app']
 
                 ret = fwdFragment
 
@@ -36,10 +36,10 @@ class SixP(object):
         # store params
         self.mote              = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine            = SimEngine.SimEngine.SimEngine()
-        self.settings          = SimEngine.SimSettings.SimSettings()
-        self.log               = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.engine            = mote.engine
+        self.settings          = mote.settings
+        self.log               = mote.log
 
         # local variables
         self.seqnum_table      = {} # indexed by neighbor_id
@@ -644,9 +644,9 @@ class SixPTransaction(object):
 
         # keep external instances
         self.mote             = mote
-        self.engine           = SimEngine.SimEngine.SimEngine()
-        self.settings         = SimEngine.SimSettings.SimSettings()
-        self.log              = SimEngine.SimLog.SimLog().log
+        self.engine           = mote.engine
+        self.settings         = mote.settings
+        self.log              = mote.log
 
         # local variables
         self.request          = copy.deepcopy(request)
@@ -666,12 +666,7 @@ class SixPTransaction(object):
             self.peerMac      = self.responder
         else:
             self.peerMac      = self.initiator
-        self.event_unique_tag = u'{0}-{1}-{2}-{3}'.format(
-            self.mote.id,
-            self.initiator,
-            self.responder,
-            '6P-transaction-timeout'
-        )
+        self.timeout_timer    = None # created by start()
 
         # register itself to sixp
         self.mote.sixp.add_transaction(self)
@@ -720,11 +715,14 @@ class SixPTransaction(object):
             # use the default timeout value
             timeout_seconds = self._get_default_timeout_seconds()
 
-        self.engine.scheduleIn(
-            delay          = timeout_seconds,
-            cb             = self.timeout_handler,
-            uniqueTag      = self.event_unique_tag,
-            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS,
+        if self.timeout_timer is None:
+            self.timeout_timer = self.engine.timers.create(
+                cb             = self.timeout_handler,
+                intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
+            )
+        self.engine.timers.arm(
+            self.timeout_timer,
+            self.engine.getAsnIn(timeout_seconds)
         )
 
     def complete(self):
@@ -792,7 +790,9 @@ class SixPTransaction(object):
 
     def invalidate(self):
         # remove its timeout event if it exists
-        self.engine.removeFutureEvent(self.event_unique_tag)
+        if self.timeout_timer is not None:
+            self.engine.timers.delete(self.timeout_timer)
+            self.timeout_timer = None
 
         # delete the transaction from the 6P transaction table
         self.mote.sixp.delete_transaction(self)
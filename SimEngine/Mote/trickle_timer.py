@@ -8,7 +8,6 @@ from builtins import str
 from builtins import object
 from past.utils import old_div
 import math
-import random
 
 import SimEngine
 from . import MoteDefines as d
@@ -18,15 +17,21 @@ class TrickleTimer(object):
     STATE_STOPPED = u'stopped'
     STATE_RUNNING = u'running'
 
-    def __init__(self, i_min, i_max, k, callback):
+    def __init__(self, i_min, i_max, k, callback, rng=None, engine=None):
         assert isinstance(i_min, (int, int))
         assert isinstance(i_max, (int, int))
         assert isinstance(k, (int, int))
         assert callback is not None
 
-        # shorthand to singletons
-        self.engine   = SimEngine.SimEngine.SimEngine()
-        self.settings = SimEngine.SimSettings.SimSettings()
+        # singletons of the simulation of the timer, those of the current
+        # context by default
+        if engine is None:
+            engine = SimEngine.SimEngine.SimEngine()
+        self.engine   = engine
+        self.settings = engine.settings
+        if rng is None:
+            rng = self.engine.random_streams.get(u'trickle')
+        self.rng      = rng
 
         # constants of this timer instance
         # min_interval is expected to given in milliseconds
@@ -54,7 +59,7 @@ class TrickleTimer(object):
         #       Imin and less than or equal to Imax.  The algorithm then begins
         #       the first interval.
         self.state = self.STATE_RUNNING
-        self.interval = random.randint(self.min_interval, self.max_interval)
+        self.interval = self.rng.randint(self.min_interval, self.max_interval)
         self._start_next_interval()
 
     def stop(self):
@@ -110,48 +115,48 @@ class TrickleTimer(object):
         #       that is, values greater than or equal to I/2 and less than I.
         #       The interval ends at I.
         slot_len = self.settings.tsch_slotDuration * 1000 # convert to ms
-        t = old_div((1 + random.random()) * self.interval, 2)
+        t = old_div((1 + self.rng.random()) * self.interval, 2)
         asn = self.engine.getAsn() + int(math.ceil(old_div(t, slot_len)))
         if asn == self.engine.getAsn():
             # schedule the event at the next ASN since we cannot schedule it at
             # the current ASN
             asn = self.engine.getAsn() + 1
 
-        def _callback():
-            if self.counter < self.redundancy_constant:
-                #  Section 4.2:
-                #    4.  At time t, Trickle transmits if and only if the
-                #        counter c is less than the redundancy constant k.
-                self.user_callback()
-            else:
-                # do nothing
-                pass
-
         self.engine.scheduleAtAsn(
             asn            = asn,
-            cb             = _callback,
+            cb             = self._action_at_t,
             uniqueTag      = self.unique_tag_base + u'_at_t',
             intraSlotOrder = d.INTRASLOTORDER_STACKTASKS)
 
+    def _action_at_t(self):
+        if self.counter < self.redundancy_constant:
+            #  Section 4.2:
+            #    4.  At time t, Trickle transmits if and only if the
+            #        counter c is less than the redundancy constant k.
+            self.user_callback()
+        else:
+            # do nothing
+            pass
+
     def _schedule_event_at_end_of_interval(self):
         slot_len = self.settings.tsch_slotDuration * 1000 # convert to ms
         asn = self.engine.getAsn() + int(math.ceil(old_div(self.interval, slot_len)))
 
-        def _callback():
-            # doubling the interval
-            #
-            # Section 4.2:
-            #   5.  When the interval I expires, Trickle doubles the interval
-            #       length.  If this new interval length would be longer than
-            #       the time specified by Imax, Trickle sets the interval
-            #       length I to be the time specified by Imax.
-            self.interval = self.interval * 2
-            if self.max_interval < self.interval:
-                self.interval = self.max_interval
-            self._start_next_interval()
-
         self.engine.scheduleAtAsn(
             asn            = asn,
-            cb             = _callback,
+            cb             = self._action_at_end_of_interval,
             uniqueTag      = self.unique_tag_base + u'_at_i',
             intraSlotOrder = d.INTRASLOTORDER_STACKTASKS)
+
+    def _action_at_end_of_interval(self):
+        # doubling the interval
+        #
+        # Section 4.2:
+        #   5.  When the interval I expires, Trickle doubles the interval
+        #       length.  If this new interval length would be longer than
+        #       the time specified by Imax, Trickle sets the interval
+        #       length I to be the time specified by Imax.
+        self.interval = self.interval * 2
+        if self.max_interval < self.interval:
+            self.interval = self.max_interval
+        self._start_next_interval()
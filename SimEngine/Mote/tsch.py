@@ -10,9 +10,7 @@ from builtins import filter
 from builtins import range
 from builtins import object
 from past.utils import old_div
-import copy
 from itertools import chain
-import random
 
 import netaddr
 
@@ -36,24 +34,16 @@ class Tsch(object):
         # store params
         self.mote = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine   = SimEngine.SimEngine.SimEngine()
-        self.settings = SimEngine.SimSettings.SimSettings()
-        self.log      = SimEngine.SimLog.SimLog().log
+        # singletons of the simulation of the mote (quicker access)
+        self.engine   = mote.engine
+        self.settings = mote.settings
+        self.log      = mote.log
+        self.rng      = self.engine.random_streams.get(u'tsch', mote.id)
 
         # local variables
         self.slotframes       = {}
         self.txQueue          = []
-        if self.settings.tsch_tx_queue_size >= 0:
-            self.txQueueSize  = self.settings.tsch_tx_queue_size
-        elif self.settings.tsch_tx_queue_size == -1:
-            self.txQueueSize  = float('inf')
-        else:
-            raise ValueError(
-                u'unsupported tx_queue_size: {0}'.format(
-                    self.settings.tsch_tx_queue_size
-                )
-            )
+        self._set_tx_queue_size()
         if self.settings.tsch_max_tx_retries >= 0:
             self.max_tx_retries = self.settings.tsch_max_tx_retries
         elif self.settings.tsch_max_tx_retries == -1:
@@ -80,6 +70,15 @@ class Tsch(object):
         # pending bit
         self.pending_bit_enabled            = False
         self.args_for_next_pending_bit_task = None
+        # keep-alive and synchronization timers, re-armed on every ACK
+        self.keep_alive_timer         = self.engine.timers.create(
+            cb             = self._send_keep_alive_message,
+            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
+        )
+        self.synchronization_timer    = self.engine.timers.create(
+            cb             = self._desync,
+            intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
+        )
 
         assert self.settings.phy_numChans <= len(d.TSCH_HOPPING_SEQUENCE)
         self.hopping_sequence = (
@@ -94,6 +93,19 @@ class Tsch(object):
 
     #======================== public ==========================================
 
+    # admin
+
+    def indication_settings_changed(self):
+        """ The settings changed, e.g. in a branch (see SimEngine.branch()) """
+        self._set_tx_queue_size()
+
+        # drop the packets which don't fit in the queue any more
+        while len(self.txQueue) > self.txQueueSize:
+            self.mote.drop_packet(
+                packet  = self.dequeue_by_index(len(self.txQueue) - 1),
+                reason  = SimEngine.SimLog.DROPREASON_TXQUEUE_FULL
+            )
+
     # getters/setters
 
     def getIsSync(self):
@@ -124,9 +136,12 @@ class Tsch(object):
             self.mote.sf.start()
 
             # transition: listeningForEB->active
-            self.engine.removeFutureEvent(      # remove previously scheduled listeningForEB cells
-                uniqueTag=(self.mote.id, u'_action_listeningForEB_cell')
-            )
+            if self.settings.conn_scanning_pool:
+                self.engine.connectivity.stop_scanning(self.mote)
+            else:
+                self.engine.removeFutureEvent(  # remove previously scheduled listeningForEB cells
+                    uniqueTag=(self.mote.id, u'_action_listeningForEB_cell')
+                )
         else:
             # log
             self.log(
@@ -214,7 +229,8 @@ class Tsch(object):
         self.slotframes[slotframe_handle] = SlotFrame(
             mote_id          = self.mote.id,
             slotframe_handle = slotframe_handle,
-            num_slots        = length
+            num_slots        = length,
+            log              = self.log
         )
         self.log(
             SimEngine.SimLog.LOG_TSCH_ADD_SLOTFRAME,
@@ -249,13 +265,30 @@ class Tsch(object):
 
         assert not self.getIsSync()
 
-        # schedule at next ASN
-        self.engine.scheduleAtAsn(
-            asn              = self.engine.getAsn()+1,
-            cb               = self._action_listeningForEB_cell,
-            uniqueTag        = (self.mote.id, u'_action_listeningForEB_cell'),
-            intraSlotOrder   = d.INTRASLOTORDER_STARTSLOT,
-        )
+        if self.settings.conn_scanning_pool:
+            # Connectivity has us listen when we can receive an EB
+            self.engine.connectivity.start_scanning(self.mote)
+        else:
+            # schedule at next ASN
+            self.engine.scheduleAtAsn(
+                asn              = self.engine.getAsn()+1,
+                cb               = self._action_listeningForEB_cell,
+                uniqueTag        = (self.mote.id, u'_action_listeningForEB_cell'),
+                intraSlotOrder   = d.INTRASLOTORDER_STARTSLOT,
+            )
+
+    def listen_for_EB(self, channel):
+        """
+        [from Connectivity] listen on channel in the current slot, where an
+        EB is sent, while in the scanning pool
+        """
+        assert not self.getIsSync()
+
+        # start listening
+        self.mote.radio.startScanningRx(channel)
+
+        # indicate that we're waiting for the RX operation to finish
+        self.waitingFor = d.WAITING_FOR_RX
 
     # minimal
 
@@ -391,8 +424,8 @@ class Tsch(object):
 
         # check that I have cell to transmit on
         if goOn:
-            shared_tx_cells = [cell for cell in self.mote.tsch.get_cells(None) if d.CELLOPTION_TX in cell.options]
-            dedicated_tx_cells = [cell for cell in self.mote.tsch.get_cells(packet[u'mac'][u'dstMac']) if d.CELLOPTION_TX in cell.options]
+            shared_tx_cells = [cell for cell in self.mote.tsch.get_cells(None) if cell.is_tx_on()]
+            dedicated_tx_cells = [cell for cell in self.mote.tsch.get_cells(packet[u'mac'][u'dstMac']) if cell.is_tx_on()]
             if (
                     (len(shared_tx_cells) == 0)
                     and
@@ -516,7 +549,7 @@ class Tsch(object):
                 for packet in self.txQueue:
                     packet_to_send = packet # tentatively
                     for _, slotframe in list(self.slotframes.items()):
-                        dedicated_tx_cells = [cell for cell in slotframe.get_cells_by_mac_addr(packet[u'mac'][u'dstMac']) if d.CELLOPTION_TX in cell.options]
+                        dedicated_tx_cells = [cell for cell in slotframe.get_cells_by_mac_addr(packet[u'mac'][u'dstMac']) if cell.is_tx_on()]
                         if len(dedicated_tx_cells) > 0:
                             packet_to_send = None
                             break # try the next packet in TX queue
@@ -630,7 +663,7 @@ class Tsch(object):
                 # update the backoff exponent
                 self._update_backoff_state(
                     isRetransmission = self._is_retransmission(self.pktToSend),
-                    isSharedLink     = d.CELLOPTION_SHARED in active_cell.options,
+                    isSharedLink     = active_cell.is_shared_on(),
                     isTXSuccess      = isACKed,
                     packet           = self.pktToSend
                 )
@@ -668,8 +701,10 @@ class Tsch(object):
             else:
                 # ... which was NOT ACKed
 
-                # decrement 'retriesLeft' counter associated with that packet
+                # decrement 'retriesLeft' counter associated with that packet;
+                # the receivers may hold the MAC header sent: change a copy
                 assert self.pktToSend[u'mac'][u'retriesLeft'] >= 0
+                self.pktToSend[u'mac'] = dict(self.pktToSend[u'mac'])
                 self.pktToSend[u'mac'][u'retriesLeft'] -= 1
 
                 # drop packet if retried too many time
@@ -704,11 +739,13 @@ class Tsch(object):
 
         self.active_cell = None
 
-        # copy the received packet to a new packet instance since the passed
-        # "packet" should be kept as it is so that Connectivity can use it
-        # after this rxDone() process.
-        new_packet = copy.deepcopy(packet)
-        packet = new_packet
+        # the passed "packet" is shared with the transmitter, the other
+        # receivers and Connectivity, which uses it after this rxDone()
+        # process: copy only its top level. Its headers are copy-on-write; a
+        # layer changing a header of a received packet replaces it with a
+        # copy first.
+        if packet:
+            packet = dict(packet)
 
         # make sure I'm in the right state
         assert self.waitingFor == d.WAITING_FOR_RX
@@ -836,6 +873,18 @@ class Tsch(object):
 
     #======================== private ==========================================
 
+    def _set_tx_queue_size(self):
+        if self.settings.tsch_tx_queue_size >= 0:
+            self.txQueueSize  = self.settings.tsch_tx_queue_size
+        elif self.settings.tsch_tx_queue_size == -1:
+            self.txQueueSize  = float('inf')
+        else:
+            raise ValueError(
+                u'unsupported tx_queue_size: {0}'.format(
+                    self.settings.tsch_tx_queue_size
+                )
+            )
+
     # listeningForEB
 
     def _action_listeningForEB_cell(self):
@@ -846,7 +895,7 @@ class Tsch(object):
         assert not self.getIsSync()
 
         # choose random channel
-        channel = random.choice(self.hopping_sequence)
+        channel = self.rng.choice(self.hopping_sequence)
 
         # start listening
         self.mote.radio.startRx(channel)
@@ -991,7 +1040,7 @@ class Tsch(object):
                 [
                     slotframe.get_num_slots_to_next_active_cell(asn)
                     for _, slotframe in list(self.slotframes.items()) if (
-                        len(slotframe.get_busy_slots()) > 0
+                        slotframe.num_busy_slots > 0
                     )
                 ]
             )
@@ -1100,9 +1149,13 @@ class Tsch(object):
                 and
                 self.pending_bit_enabled
             ):
-            pktToSend[u'mac'][u'pending_bit'] = True
+            pending_bit = True
         else:
-            pktToSend[u'mac'][u'pending_bit'] = False
+            pending_bit = False
+        if pktToSend[u'mac'].get(u'pending_bit') != pending_bit:
+            # the receivers of a previous transmission may hold the MAC header
+            pktToSend[u'mac'] = dict(pktToSend[u'mac'])
+            pktToSend[u'mac'][u'pending_bit'] = pending_bit
 
         # send packet to the radio
         self.mote.radio.startTx(channel, pktToSend)
@@ -1136,7 +1189,7 @@ class Tsch(object):
 
         # following the Bayesian broadcasting algorithm
         return (
-            (random.random() < (old_div(prob, n)))
+            (self.rng.random() < (old_div(prob, n)))
             and
             self.iAmSendingEBs
         )
@@ -1221,7 +1274,7 @@ class Tsch(object):
         # Section 6.2.5.3 of IEEE 802.15.4-2015: "The MAC sublayer shall delay
         # for a random number in the range 0 to (2**BE - 1) shared links (on
         # any slotframe) before attempting a retransmission on a shared link."
-        return random.randint(0, pow(2, self.backoff_exponent) - 1)
+        return self.rng.randint(0, pow(2, self.backoff_exponent) - 1)
 
     def _reset_backoff_state(self):
         old_be = self.backoff_exponent
@@ -1353,17 +1406,13 @@ class Tsch(object):
             #
             # the keep-alive interval should be configured in config.json with
             # "tsch_keep_alive_interval".
-            self.engine.scheduleIn(
-                delay          = self.settings.tsch_keep_alive_interval,
-                cb             = self._send_keep_alive_message,
-                uniqueTag      = self._get_event_tag(u'tsch.keep_alive_event'),
-                intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
+            self.engine.timers.arm(
+                self.keep_alive_timer,
+                self.engine.getAsnIn(self.settings.tsch_keep_alive_interval)
             )
 
     def _stop_keep_alive_timer(self):
-        self.engine.removeFutureEvent(
-            uniqueTag = self._get_event_tag(u'tsch.keep_alive_event')
-        )
+        self.engine.timers.cancel(self.keep_alive_timer)
 
     def _reset_keep_alive_timer(self):
         self._stop_keep_alive_timer()
@@ -1373,9 +1422,7 @@ class Tsch(object):
         self._reset_synchronization_timer()
 
     def _stop_synchronization_timer(self):
-        self.engine.removeFutureEvent(
-            uniqueTag = self._get_event_tag(u'tsch.synchronization_timer')
-        )
+        self.engine.timers.cancel(self.synchronization_timer)
 
     def _reset_synchronization_timer(self):
         if (
@@ -1388,18 +1435,10 @@ class Tsch(object):
         else:
             target_asn = self.engine.getAsn() + d.TSCH_DESYNCHRONIZED_TIMEOUT_SLOTS
 
-            def _desync():
-                self.setIsSync(False)
+            self.engine.timers.arm(self.synchronization_timer, target_asn)
 
-            self.engine.scheduleAtAsn(
-                asn            = target_asn,
-                cb             = _desync,
-                uniqueTag      = self._get_event_tag(u'tsch.synchronization_timer'),
-                intraSlotOrder = d.INTRASLOTORDER_STACKTASKS
-            )
-
-    def _get_event_tag(self, event_name):
-        return u'{0}-{1}'.format(self.mote.id, event_name)
+    def _desync(self):
+        self.setIsSync(False)
 
     def _get_synchronization_event_tag(self):
         return u'{0}-{1}.format()'
@@ -1483,9 +1522,10 @@ class Tsch(object):
 
 class Clock(object):
     def __init__(self, mote):
-        # singleton
-        self.engine   = SimEngine.SimEngine.SimEngine()
-        self.settings = SimEngine.SimSettings.SimSettings()
+        # singletons of the simulation of the mote
+        self.engine   = mote.engine
+        self.settings = mote.settings
+        self.rng      = self.engine.random_streams.get(u'clock', mote.id)
 
         # local variables
         self.mote = mote
@@ -1499,10 +1539,8 @@ class Clock(object):
 
         self.desync()
 
-    @staticmethod
-    def get_clock_by_mac_addr(mac_addr):
-        engine = SimEngine.SimEngine.SimEngine()
-        mote = engine.get_mote_by_mac_addr(mac_addr)
+    def get_clock_by_mac_addr(self, mac_addr):
+        mote = self.engine.get_mote_by_mac_addr(mac_addr)
         return mote.tsch.clock
 
     def desync(self):
@@ -1526,7 +1564,7 @@ class Clock(object):
             # from the clock source when 32.768 Hz oscillators are used on the
             # both sides. in addition, the clock source also off from a certain
             # amount of time from its source.
-            off_from_source = random.random() * self._clock_interval
+            off_from_source = self.rng.random() * self._clock_interval
             source_clock = self.get_clock_by_mac_addr(self.source)
             self._clock_off_on_sync = off_from_source + source_clock.get_drift()
 
@@ -1574,37 +1612,46 @@ class Clock(object):
         max_drift = (
             float(self.settings.tsch_clock_max_drift_ppm) / pow(10, 6)
         )
-        return random.uniform(-1 * max_drift * 2, max_drift * 2)
+        return self.rng.uniform(-1 * max_drift * 2, max_drift * 2)
 
 
 class SlotFrame(object):
-    def __init__(self, mote_id, slotframe_handle, num_slots):
-        self.log = SimEngine.SimLog.SimLog().log
+    def __init__(self, mote_id, slotframe_handle, num_slots, log=None):
+        # the log function of the current context by default
+        if log is None:
+            log = SimEngine.SimLog.SimLog().log
+        self.log = log
 
         self.mote_id = mote_id
         self.slotframe_handle = slotframe_handle
         self.length = num_slots
-        self.slots  = {}
+        # cells, indexed by slot offset
+        self.slots  = [[] for _ in range(num_slots)]
         # index by neighbor_mac_addr for quick access
         self.cells  = {}
+        # number of slot offsets having cells
+        self.num_busy_slots = 0
+        # number of slots from each slot offset to the next one having cells;
+        # computed when needed after the schedule changed
+        self._num_slots_to_next_busy_slot = None
 
     def __repr__(self):
         return u'slotframe(length: {0}, num_cells: {1})'.format(
             self.length,
-            len(list(chain.from_iterable(list(self.slots.values()))))
+            sum([len(cells) for cells in self.slots])
         )
 
     def add(self, cell):
         assert cell.slot_offset < self.length
-        if cell.slot_offset not in self.slots:
-            self.slots[cell.slot_offset] = [cell]
-        else:
-            self.slots[cell.slot_offset] += [cell]
+        if not self.slots[cell.slot_offset]:
+            self.num_busy_slots += 1
+            self._num_slots_to_next_busy_slot = None
+        self.slots[cell.slot_offset].append(cell)
 
         if cell.mac_addr not in self.cells:
             self.cells[cell.mac_addr] = [cell]
         else:
-            self.cells[cell.mac_addr] += [cell]
+            self.cells[cell.mac_addr].append(cell)
         cell.slotframe = self
 
         # log
@@ -1629,7 +1676,8 @@ class SlotFrame(object):
         if len(self.cells[cell.mac_addr]) == 0:
             del self.cells[cell.mac_addr]
         if len(self.slots[cell.slot_offset]) == 0:
-            del self.slots[cell.slot_offset]
+            self.num_busy_slots -= 1
+            self._num_slots_to_next_busy_slot = None
 
         # log
         self.log(
@@ -1646,10 +1694,7 @@ class SlotFrame(object):
 
     def get_cells_by_slot_offset(self, slot_offset):
         assert slot_offset < self.length
-        if slot_offset in self.slots:
-            return self.slots[slot_offset]
-        else:
-            return []
+        return self.slots[slot_offset]
 
     def get_cells_at_asn(self, asn):
         slot_offset = asn % self.length
@@ -1662,18 +1707,17 @@ class SlotFrame(object):
             return []
 
     def get_busy_slots(self):
-        busy_slots = list(self.slots.keys())
-        # busy_slots.sort()
-        return busy_slots
+        return [
+            slot_offset for slot_offset in range(self.length)
+            if self.slots[slot_offset]
+        ]
 
     def get_num_slots_to_next_active_cell(self, asn):
-        diff = 1
-        while diff <= self.length:
-            slot_offset = (asn + diff) % self.length
-            if slot_offset in self.slots:
-                return diff
-            diff += 1
-        return None
+        if self.num_busy_slots == 0:
+            return None
+        if self._num_slots_to_next_busy_slot is None:
+            self._update_num_slots_to_next_busy_slot()
+        return self._num_slots_to_next_busy_slot[asn % self.length]
 
     def get_available_slots(self):
         """
@@ -1694,7 +1738,7 @@ class SlotFrame(object):
         """
 
         if mac_addr == "":
-            target_cells = chain.from_iterable(list(self.slots.values()))
+            target_cells = chain.from_iterable(self.slots)
         elif mac_addr not in self.cells:
             target_cells = []
         else:
@@ -1715,15 +1759,56 @@ class SlotFrame(object):
 
             slot_offset = new_length
             while slot_offset < self.length:
-                if slot_offset in self.slots:
-                    for cell in self.slots[slot_offset]:
-                        self.delete(cell)
+                for cell in self.slots[slot_offset][:]:
+                    self.delete(cell)
                 slot_offset += 1
+            del self.slots[new_length:]
+        else:
+            self.slots += [[] for _ in range(new_length - self.length)]
 
         # apply the new length
         self.length = new_length
+        self._num_slots_to_next_busy_slot = None
+
+    def _update_num_slots_to_next_busy_slot(self):
+        # walk two slotframes backwards, so that the next busy slot of the
+        # last slot offsets is found in the next slotframe
+        num_slots      = [None] * self.length
+        next_busy_slot = None
+        for slot_offset in range(2 * self.length - 1, -1, -1):
+            if slot_offset < self.length:
+                num_slots[slot_offset] = next_busy_slot - slot_offset
+            if self.slots[slot_offset % self.length]:
+                next_busy_slot = slot_offset
+        self._num_slots_to_next_busy_slot = num_slots
 
 class Cell(object):
+
+    # the cell options, as bit flags
+    OPTION_FLAG_TX     = 0x01
+    OPTION_FLAG_RX     = 0x02
+    OPTION_FLAG_SHARED = 0x04
+    OPTION_FLAGS       = {
+        d.CELLOPTION_TX:     OPTION_FLAG_TX,
+        d.CELLOPTION_RX:     OPTION_FLAG_RX,
+        d.CELLOPTION_SHARED: OPTION_FLAG_SHARED,
+    }
+
+    # a mote has a cell per slot of its schedule, compared at every slot: no
+    # instance dictionary
+    __slots__ = [
+        u'slot_offset',
+        u'channel_offset',
+        u'options',
+        u'mac_addr',
+        u'link_type',
+        u'slotframe',
+        u'num_tx',
+        u'num_tx_ack',
+        u'num_rx',
+        u'_option_flags',
+    ]
+
     def __init__(
             self,
             slot_offset,
@@ -1753,6 +1838,11 @@ class Cell(object):
         self.num_tx_ack = 0
         self.num_rx     = 0
 
+        # local variables
+        self._option_flags = 0
+        for option in options:
+            self._option_flags |= self.OPTION_FLAGS[option]
+
     def __repr__(self):
 
         return u'cell({0})'.format(
@@ -1768,7 +1858,16 @@ class Cell(object):
         )
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        if self is other:
+            return True
+        elif isinstance(other, Cell):
+            return self._get_key() == other._get_key()
+        else:
+            return False
+
+    def __ne__(self, other):
+        # Python 2 doesn't derive it from __eq__()
+        return not self == other
 
     def increment_num_tx(self):
         self.num_tx += 1
@@ -1789,10 +1888,22 @@ class Cell(object):
         self.num_rx += 1
 
     def is_tx_on(self):
-        return d.CELLOPTION_TX in self.options
+        return (self._option_flags & self.OPTION_FLAG_TX) != 0
 
     def is_rx_on(self):
-        return d.CELLOPTION_RX in self.options
+        return (self._option_flags & self.OPTION_FLAG_RX) != 0
 
     def is_shared_on(self):
-        return d.CELLOPTION_SHARED in self.options
+        return (self._option_flags & self.OPTION_FLAG_SHARED) != 0
+
+    # ======================= private =========================================
+
+    def _get_key(self):
+        # what __repr__ shows: the cells equal to each other
+        return (
+            self.slot_offset,
+            self.channel_offset,
+            self.mac_addr,
+            self.options,
+            self.link_type
+        )
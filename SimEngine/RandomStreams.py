@@ -0,0 +1,183 @@
+"""
+\brief Random number streams of a simulation.
+
+The layers of the motes and Connectivity draw their random numbers from
+streams, which they get from the engine with
+engine.random_streams.get(owner, mote_id). Select how the streams are backed
+with the "exec_randomStreams" setting:
+
+* "global": every stream is a proxy to the global `random` module, seeded
+  once by the engine (the original behavior)
+* "per_mote": each (owner, mote_id) pair, e.g. (u'tsch', 3) or
+  (u'propagation', None), has its own NumPy Generator, seeded from the seed
+  of the run and the pair (a RandomState with NumPy < 1.17, which has no
+  Generator; the numbers differ then). A stream draws its uniform numbers by
+  blocks of BLOCK_SIZE and serves them from that buffer. The numbers a layer
+  of a mote draws don't depend on what the other layers and motes draw: a
+  change in one of them doesn't shift the random numbers of all the others.
+
+A stream offers the subset of the `random` API the simulator uses, plus
+random_array(), which returns n uniform numbers as a NumPy array, the ones n
+calls of random() would return. A consumer drawing its numbers at another
+point, or another number of them, still gets other numbers: the "loop" and
+"vectorized" propagations (see Connectivity.py) don't give the same logs.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# =========================== imports =========================================
+
+from builtins import object
+from builtins import range
+import random
+import zlib
+
+import numpy as np
+
+# =========================== defines =========================================
+
+RANDOM_STREAMS_GLOBAL   = u'global'
+RANDOM_STREAMS_PER_MOTE = u'per_mote'
+
+# number of uniform numbers a per-mote stream draws at once
+BLOCK_SIZE = 1024
+
+# =========================== body ============================================
+
+class RandomStreams(object):
+
+    def __init__(self, mode, seed):
+        if mode not in [RANDOM_STREAMS_GLOBAL, RANDOM_STREAMS_PER_MOTE]:
+            raise NotImplementedError(
+                u'unsupported exec_randomStreams: {0}'.format(mode)
+            )
+
+        # local variables
+        self.mode    = mode
+        self.seed    = seed
+        self.streams = {}   # indexed by (owner, mote_id)
+
+    def get(self, owner, mote_id=None):
+        """ Return the stream of owner (e.g. u'tsch') of a mote, if any """
+        key = (owner, mote_id)
+        if key not in self.streams:
+            if self.mode == RANDOM_STREAMS_GLOBAL:
+                self.streams[key] = GlobalRandomStream()
+            else:
+                self.streams[key] = RandomStream(self.seed, owner, mote_id)
+        return self.streams[key]
+
+    def reseed(self, seed):
+        """
+        Re-seed all the streams, after the global generator (see
+        SimEngine.branch())
+        """
+        self.seed = seed
+        for stream in self.streams.values():
+            stream.reseed(seed)
+
+class GlobalRandomStream(object):
+    """ Draw from the global random module """
+
+    def reseed(self, seed):
+        # the engine re-seeds the global random module itself
+        pass
+
+    def random(self):
+        return random.random()
+
+    def uniform(self, a, b):
+        return random.uniform(a, b)
+
+    def randint(self, a, b):
+        return random.randint(a, b)
+
+    def choice(self, seq):
+        return random.choice(seq)
+
+    def choices(self, population, k=1):
+        # random.choices() is Python 3.6+; draw the way it does
+        n = len(population)
+        return [population[int(random.random() * n)] for _ in range(k)]
+
+    def sample(self, population, k):
+        return random.sample(population, k)
+
+    def random_array(self, n):
+        return np.array([random.random() for _ in range(n)])
+
+class RandomStream(object):
+    """ Draw from a NumPy Generator of its own, by blocks """
+
+    def __init__(self, seed, owner, mote_id):
+        # the owner and the mote identify the stream among all the streams
+        # derived from the seed
+        self.spawn_key = (
+            # zlib.crc32() can be negative with Python 2
+            zlib.crc32(owner.encode(u'utf-8')) & 0xffffffff,
+            0 if mote_id is None else mote_id + 1
+        )
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        if hasattr(np.random, u'Generator'):
+            generator = np.random.Generator(
+                np.random.PCG64(
+                    np.random.SeedSequence(seed, spawn_key=self.spawn_key)
+                )
+            )
+            self._draw = generator.random
+        else:
+            # a RandomState is seeded from 32-bit words
+            generator = np.random.RandomState(
+                [seed & 0xffffffff, seed >> 32] + list(self.spawn_key)
+            )
+            self._draw = generator.random_sample
+        self._buffer = []
+        self._index  = 0
+
+    def random(self):
+        if self._index == len(self._buffer):
+            self._refill()
+        value = self._buffer[self._index]
+        self._index += 1
+        return value
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def randint(self, a, b):
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        if not seq:
+            raise IndexError(u'cannot choose from an empty sequence')
+        return seq[int(self.random() * len(seq))]
+
+    def choices(self, population, k=1):
+        return [self.choice(population) for _ in range(k)]
+
+    def sample(self, population, k):
+        # partial Fisher-Yates shuffle
+        pool = list(population)
+        n = len(pool)
+        if not 0 <= k <= n:
+            raise ValueError(u'sample larger than population or is negative')
+        for i in range(k):
+            j = i + int(self.random() * (n - i))
+            (pool[i], pool[j]) = (pool[j], pool[i])
+        return pool[:k]
+
+    def random_array(self, n):
+        values = []
+        while len(values) < n:
+            if self._index == len(self._buffer):
+                self._refill()
+            end = min(len(self._buffer), self._index + n - len(values))
+            values += self._buffer[self._index:end]
+            self._index = end
+        return np.array(values)
+
+    def _refill(self):
+        self._buffer = self._draw(BLOCK_SIZE).tolist()
+        self._index  = 0
@@ -0,0 +1,138 @@
+"""
+RSSI to PDR conversion ("waterfall" curve).
+
+A curve is a list of (RSSI, PDR) points, linearly interpolated in between;
+the PDR is the one of the first point below the lowest RSSI, and the one of
+the last point from the highest RSSI on. The default curve comes from
+experiments; another one can be given with the "conn_rssi_pdr_curve" setting,
+as the path to a JSON file mapping RSSI values (in dBm) to PDR values:
+
+    {"-97": 0.0, "-93": 0.6359, "-79": 1.0}
+
+A curve is compiled once, at startup. to_pdr() converts one RSSI value;
+to_pdr_array() converts a NumPy array of RSSI values at once.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# =========================== imports =========================================
+
+from builtins import object
+import bisect
+import json
+import math
+
+import numpy as np
+
+# =========================== defines =========================================
+
+# RSSI and PDR relationship obtained by experiment; dataset was available
+# at the link shown below:
+# http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
+DEFAULT_RSSI_PDR_TABLE = {
+    -97:    0.0000,  # this value is not from experiment
+    -96:    0.1494,
+    -95:    0.2340,
+    -94:    0.4071,
+    # <-- 50% PDR is here, at RSSI=-93.6
+    -93:    0.6359,
+    -92:    0.6866,
+    -91:    0.7476,
+    -90:    0.8603,
+    -89:    0.8702,
+    -88:    0.9324,
+    -87:    0.9427,
+    -86:    0.9562,
+    -85:    0.9611,
+    -84:    0.9739,
+    -83:    0.9745,
+    -82:    0.9844,
+    -81:    0.9854,
+    -80:    0.9903,
+    -79:    1.0000,  # this value is not from experiment
+}
+
+# =========================== body ============================================
+
+class RssiPdrCurve(object):
+
+    def __init__(self, rssi_pdr_table=None):
+        if rssi_pdr_table is None:
+            rssi_pdr_table = DEFAULT_RSSI_PDR_TABLE
+
+        points = sorted(rssi_pdr_table.items())
+        if len(points) < 2:
+            raise ValueError(u'an RSSI-PDR curve needs at least two points')
+        for (_, pdr) in points:
+            if not (0 <= pdr <= 1.0):
+                raise ValueError(u'invalid PDR in RSSI-PDR curve: {0}'.format(pdr))
+
+        # for to_pdr()
+        self.rssi_list = [rssi for (rssi, _) in points]
+        self.pdr_list  = [pdr for (_, pdr) in points]
+        self.min_rssi  = self.rssi_list[0]
+        self.max_rssi  = self.rssi_list[-1]
+
+        # a curve having a point at every integer RSSI value is looked up by
+        # index instead of by bisection
+        self._integer_steps = (
+            float(self.min_rssi).is_integer()
+            and
+            all(
+                [
+                    rssi == self.min_rssi + i
+                    for (i, rssi) in enumerate(self.rssi_list)
+                ]
+            )
+        )
+
+        # for to_pdr_array()
+        self.rssi_array = np.array(self.rssi_list, dtype=float)
+        self.pdr_array  = np.array(self.pdr_list,  dtype=float)
+
+    def to_pdr(self, rssi):
+        if rssi < self.min_rssi:
+            return self.pdr_list[0]
+        elif rssi >= self.max_rssi:
+            return self.pdr_list[-1]
+
+        if self._integer_steps:
+            i = int(math.floor(rssi)) - int(self.min_rssi)
+        else:
+            i = bisect.bisect_right(self.rssi_list, rssi) - 1
+
+        rssi_low  = self.rssi_list[i]
+        rssi_high = self.rssi_list[i + 1]
+        pdr_low   = self.pdr_list[i]
+        pdr_high  = self.pdr_list[i + 1]
+
+        # linear interpolation
+        return (
+            (pdr_high - pdr_low) *
+            (rssi - float(rssi_low)) / (rssi_high - rssi_low) +
+            pdr_low
+        )
+
+    def to_pdr_array(self, rssi):
+        return np.interp(rssi, self.rssi_array, self.pdr_array)
+
+# =========================== helpers =========================================
+
+def load_rssi_pdr_curve(file_path=None):
+    """
+    Return the curve described in the JSON file at file_path, or the default
+    curve when file_path is None
+    """
+    if file_path is None:
+        return RssiPdrCurve()
+
+    with open(file_path, 'r') as f:
+        rssi_pdr_table = json.load(f)
+    return RssiPdrCurve(
+        dict(
+            [
+                (float(rssi), float(pdr))
+                for (rssi, pdr) in rssi_pdr_table.items()
+            ]
+        )
+    )
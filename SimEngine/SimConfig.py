@@ -126,8 +126,10 @@ class SimConfig(dict):
         config_json[u'log_directory_name'] = u'startTime'
         config_json[u'logging'] = u'all'
         config_json[u'execution'] = {
-            u'numCPUs': 1,
-            u'numRuns': 1
+            u'numCPUs':      1,
+            u'numRuns':      1,
+            u'branchAt':     None,
+            u'adaptiveRuns': None
         }
         return config_json
 
@@ -0,0 +1,141 @@
+"""
+\brief The context of a simulation: its settings, log, engine and
+connectivity.
+
+SimSettings, SimLog, SimEngine and Connectivity are singletons per context:
+SimEngine.SimEngine() returns the engine of the current context. A process
+running one simulation at a time uses the default context and doesn't need
+to know about contexts. To run several simulations in one process, create
+each of them in a context of its own:
+
+    context = SimContext.SimContext()
+    with context:
+        settings = SimSettings.SimSettings(**settings_dict)
+        settings.setLogDirectory(...)
+        ...
+        engine = SimEngine.SimEngine()
+    engine.run()
+
+The current context is a context variable: each thread, and each asyncio
+task, has its own, the default context until it enters another one. Python 2
+has no contextvars; the current context is then per thread. The
+engine keeps the context it was created in (engine.context) and enters it to
+execute its events, in run(), run_until(), step() and in its thread, so that
+engines of different contexts can be stepped alternately, or run in
+different threads. The motes get the context from the engine (mote.context)
+and their layers get the singletons from their mote.
+
+Note that with "exec_randomStreams" set to "global", the simulations of a
+process share the random module; use "per_mote" for simulations which run at
+the same time to be reproducible.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+from builtins import object
+import threading
+try:
+    import contextvars
+except ImportError:
+    # Python 2
+    contextvars = None
+
+# =========================== body ============================================
+
+class SimContext(object):
+
+    def __init__(self):
+
+        # the singletons of the simulation
+        self.settings     = None
+        self.log          = None
+        self.engine       = None
+        self.connectivity = None
+
+        # local variables
+        self.initialized  = set() # names of the initialized singletons
+
+    def __enter__(self):
+        token = _current_context.set(self)
+        _tokens.set(_tokens.get() + (token,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        tokens = _tokens.get()
+        _tokens.set(tokens[:-1])
+        _current_context.reset(tokens[-1])
+
+    # ======================= checkpoint ======================================
+
+    def __reduce__(self):
+        # the objects of a checkpoint get the context they are restored in,
+        # to which Checkpoint.restore() gives the restored singletons
+        return (get_current, ())
+
+class Singleton(type):
+    """
+    Metaclass of the classes having one instance per context; a class sets
+    CONTEXT_ATTRIBUTE, the name of its instance in the context.
+
+    cls._instance and cls._init, which the classes get and set as class
+    attributes, are those of the current context.
+    """
+
+    @property
+    def _instance(cls):
+        return getattr(get_current(), cls.CONTEXT_ATTRIBUTE)
+
+    @_instance.setter
+    def _instance(cls, instance):
+        setattr(get_current(), cls.CONTEXT_ATTRIBUTE, instance)
+
+    @property
+    def _init(cls):
+        return cls.CONTEXT_ATTRIBUTE in get_current().initialized
+
+    @_init.setter
+    def _init(cls, init):
+        if init:
+            get_current().initialized.add(cls.CONTEXT_ATTRIBUTE)
+        else:
+            get_current().initialized.discard(cls.CONTEXT_ATTRIBUTE)
+
+class ThreadLocalVar(object):
+    """
+    The subset of contextvars.ContextVar used here, with a value per thread,
+    for Python 2
+    """
+
+    def __init__(self, name, default):
+        self.name     = name
+        self._default = default
+        self._local   = threading.local()
+
+    def get(self):
+        return getattr(self._local, u'value', self._default)
+
+    def set(self, value):
+        # the token is the previous value
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+# =========================== helpers =========================================
+
+if contextvars is None:
+    ContextVar = ThreadLocalVar
+else:
+    ContextVar = contextvars.ContextVar
+
+_default_context = SimContext()
+_current_context = ContextVar(u'sim_context', default=_default_context)
+# to restore the previous contexts when exiting the entered ones
+_tokens          = ContextVar(u'sim_context_tokens', default=())
+
+def get_current():
+    """ Return the current context """
+    return _current_context.get()
@@ -1,5 +1,10 @@
 """
 \brief Discrete-event simulation engine.
+
+The engine runs either in its own thread, with start() (e.g. for the GUI,
+which pauses and resumes it from another thread), or synchronously in the
+calling thread, with run(), run_until() and step(). In synchronous mode, no
+lock is taken. Both modes execute the same events in the same order.
 """
 from __future__ import print_function
 from __future__ import absolute_import
@@ -11,8 +16,8 @@ from builtins import zip
 from builtins import str
 from builtins import range
 from past.utils import old_div
-from collections import OrderedDict
 import hashlib
+import heapq
 import platform
 import random
 import sys
@@ -21,21 +26,36 @@ import time
 import traceback
 import json
 
+import netaddr
+from future.utils import with_metaclass
+
 from . import Mote
+from . import SimContext
 from . import SimSettings
 from . import SimLog
 from . import Connectivity
 from . import SimConfig
+from . import EventQueue
+from . import EngineProfiler
+from . import Checkpoint
+from . import TimerWheel
+from . import RandomStreams
+from . import SteadyState
+from . import Kpis
 
 # =========================== defines =========================================
 
+# attributes of threading.Thread, which don't survive a checkpoint
+THREAD_ATTRIBUTES = frozenset(threading.Thread().__dict__)
+
 # =========================== body ============================================
 
-class DiscreteEventEngine(threading.Thread):
+class DiscreteEventEngine(
+        with_metaclass(SimContext.Singleton, threading.Thread)
+    ):
 
     #===== start singleton
-    _instance      = None
-    _init          = False
+    CONTEXT_ATTRIBUTE = u'engine'
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -58,16 +78,31 @@ class DiscreteEventEngine(threading.Thread):
             self.run_id                         = run_id
             self.verbose                        = verbose
 
+            # the context this engine is a singleton of, which it enters to
+            # execute its events
+            self.context                        = SimContext.get_current()
+
             # local variables
             self.dataLock                       = threading.RLock()
             self.pauseSem                       = threading.Semaphore(0)
             self.simPaused                      = False
+            self.simEnded                       = False
             self.goOn                           = True
+            self.threaded                       = False # started by start()
+            self.simStarted                     = False
             self.asn                            = 0
+            self.intraSlotOrder                 = None # of the running event
+            self.slotEvents                     = []   # events of this ASN
             self.exc                            = None
-            self.events                         = {}
-            self.uniqueTagSchedule              = {}
+            self.event_queue                    = EventQueue.EventQueueDict()
+            self.timers                         = TimerWheel.TimerWheel(self)
+            self.profiler                       = None # see EngineProfiler
+            self.checkpoint_file_path           = None # see Checkpoint
+            self.checkpoint_period              = None # in slots
+            self.checkpoint_asn                 = 0    # 0 before the first
             self.random_seed                    = None
+            self.random_streams                 = None # see RandomStreams
+            self.steady_state_monitor           = None # see SteadyState
             self._init_additional_local_variables()
 
             # initialize parent class
@@ -82,6 +117,10 @@ class DiscreteEventEngine(threading.Thread):
             raise
 
     def destroy(self):
+        with self.context:
+            self._destroy()
+
+    def _destroy(self):
         cls = type(self)
         if cls._init:
             # initialization finished without exception
@@ -103,40 +142,107 @@ class DiscreteEventEngine(threading.Thread):
 
     #======================== thread ==========================================
 
+    def start(self):
+        # from now on, other threads may call the engine while it runs
+        self.threaded = True
+        super(DiscreteEventEngine, self).start()
+
     def run(self):
-        """ loop through events """
+        """
+        loop through events, until the end of the simulation; in the thread
+        of the engine after start(), in the calling thread otherwise (where
+        pauseAtAsn() makes it return)
+        """
+        with self.context:
+            if self.threaded:
+                self._run_events()
+            elif not self.simEnded:
+                self.simPaused = False
+                self._run_events()
+
+    def run_until(self, asn):
+        """
+        Execute the events up to 'asn' (included) in the calling thread, or
+        until the simulation gets paused by pauseAtAsn(). Return False once
+        the simulation is over.
+        """
+        assert not self.threaded
+        assert asn >= self.asn
+        if not self.simEnded:
+            self.simPaused = False
+            with self.context:
+                self._run_events(max_asn=asn)
+        return not self.simEnded
+
+    def step(self, n_slots=1):
+        """
+        Execute the events of the next 'n_slots' slots in the calling thread.
+        Return False once the simulation is over.
+        """
+        return self.run_until(self.asn + n_slots)
+
+    def _run_events(self, max_asn=None):
+        ended = True
+        if self.profiler is not None:
+            self.profiler.resume(self.asn)
         try:
-            # additional routine
-            self._routine_thread_started()
+            if not self.simStarted:
+                self.simStarted = True
+
+                # additional routine
+                self._routine_thread_started()
 
             # consume events until self.goOn is False
             while self.goOn:
 
-                with self.dataLock:
+                if self.simPaused and not self.threaded:
+                    # paused by _actionPauseSim(), at the end of the slot
+                    ended = False
+                    return
 
-                    # abort simulation when no more events
-                    if not self.events:
-                        break
+                # jump to the next ASN having events, collect its callbacks
+                if self.threaded:
+                    with self.dataLock:
 
-                    # update the current ASN
-                    self.asn += 1
+                        # abort simulation when no more events
+                        if self._has_no_events():
+                            break
 
-                    if self.asn not in self.events:
-                        continue
+                        (self.asn, self.slotEvents) = self._pop_next_slot()
+                else:
 
-                    intraSlotOrderKeys = list(self.events[self.asn].keys())
-                    intraSlotOrderKeys.sort()
-
-                    cbs = []
-                    for intraSlotOrder in intraSlotOrderKeys:
-                        for uniqueTag, cb in list(self.events[self.asn][intraSlotOrder].items()):
-                            cbs += [cb]
-                            del self.uniqueTagSchedule[uniqueTag]
-                    del self.events[self.asn]
+                    # abort simulation when no more events
+                    if self._has_no_events():
+                        break
 
-                # call the callbacks (outside the dataLock)
-                for cb in cbs:
-                    cb()
+                    (asn, self.slotEvents) = self._pop_next_slot(max_asn)
+                    if asn is None:
+                        # no more events up to max_asn
+                        self.asn = max_asn
+                        ended    = False
+                        return
+                    self.asn = asn
+
+                # call the callbacks (outside the dataLock); a callback may
+                # append events to self.slotEvents
+                if self.profiler is None:
+                    i = 0
+                    while i < len(self.slotEvents):
+                        (self.intraSlotOrder, cb) = self.slotEvents[i]
+                        i += 1
+                        cb()
+                else:
+                    self._run_slot_profiled()
+                self.intraSlotOrder = None
+                self.slotEvents     = []
+
+                # take the periodic checkpoint, between two slots
+                if (
+                        (self.checkpoint_period is not None)
+                        and
+                        (self.asn >= self.checkpoint_asn + self.checkpoint_period)
+                    ):
+                    self._take_checkpoint()
 
         except Exception as e:
             # thread crashed
@@ -158,9 +264,15 @@ class DiscreteEventEngine(threading.Thread):
             output += [u'==============================']
             output += [u'']
             output += [u'The current ASN is {0}'.format(self.asn)]
-            output += [u'The log file is {0}'.format(
-                self.settings.getOutputFile()
-            )]
+            if SimLog.SimLog().log_output_file is not None:
+                output += [u'The log file is {0}'.format(
+                    self.settings.getOutputFile()
+                )]
+            if self.checkpoint_asn > 0:
+                output += [u'The last checkpoint, at ASN {0}, is {1}'.format(
+                    self.checkpoint_asn,
+                    self.checkpoint_file_path
+                )]
             output += [u'']
             output += [u'==============================']
             output += [u'config.json to reproduce:']
@@ -181,6 +293,10 @@ class DiscreteEventEngine(threading.Thread):
             # flush all the buffered log data
             SimLog.SimLog().flush()
 
+            if not self.threaded:
+                # the caller gets the exception, as from join()
+                raise
+
         else:
             # thread ended (gracefully)
 
@@ -192,16 +308,43 @@ class DiscreteEventEngine(threading.Thread):
 
         finally:
 
-            # destroy this singleton
-            cls = type(self)
-            cls._instance                      = None
-            cls._init                          = False
+            if self.profiler is not None:
+                self.profiler.pause()
+
+            if ended:
+                self.simEnded = True
+
+                # destroy this singleton
+                cls = type(self)
+                cls._instance                      = None
+                cls._init                          = False
 
     def join(self):
         super(DiscreteEventEngine, self).join()
         if self.exc:
             raise self.exc
 
+    #======================== checkpoint ======================================
+
+    def __getstate__(self):
+        state = dict(
+            [
+                (key, value) for (key, value) in self.__dict__.items()
+                if key not in THREAD_ATTRIBUTES
+            ]
+        )
+        del state[u'dataLock']
+        del state[u'pauseSem']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dataLock = threading.RLock()
+        self.pauseSem = threading.Semaphore(0)
+        self.threaded = False # until start()
+        threading.Thread.__init__(self)
+        self.name     = u'DiscreteEventEngine'
+
     #======================== public ==========================================
 
     # === getters/setters
@@ -209,6 +352,10 @@ class DiscreteEventEngine(threading.Thread):
     def getAsn(self):
         return self.asn
 
+    def getAsnIn(self, delay):
+        """ ASN 'delay' seconds into the future """
+        return int(self.asn + (float(delay) / float(self.settings.tsch_slotDuration)))
+
     def get_mote_by_mac_addr(self, mac_addr):
         for mote in self.motes:
             if mote.is_my_mac_addr(mac_addr):
@@ -226,28 +373,28 @@ class DiscreteEventEngine(threading.Thread):
         # make sure we are scheduling in the future
         assert asn > self.asn
 
-        # remove all events with same uniqueTag (the event will be rescheduled)
-        self.removeFutureEvent(uniqueTag)
-
-        with self.dataLock:
-
-            if asn not in self.events:
-                self.events[asn] = {
-                    intraSlotOrder: OrderedDict([(uniqueTag, cb)])
-                }
-
-            elif intraSlotOrder not in self.events[asn]:
-                self.events[asn][intraSlotOrder] = (
-                    OrderedDict([(uniqueTag, cb)])
-                )
+        if self.threaded:
+            with self.dataLock:
+                self._scheduleAtAsn(asn, cb, uniqueTag, intraSlotOrder)
+        else:
+            self._scheduleAtAsn(asn, cb, uniqueTag, intraSlotOrder)
 
-            elif uniqueTag not in self.events[asn][intraSlotOrder]:
-                self.events[asn][intraSlotOrder][uniqueTag] = cb
+    def scheduleAtCurrentAsn(self, cb, intraSlotOrder):
+        """
+        Schedule an event later in the slot being executed, after the events
+        having the same or a lower intraSlotOrder. Such an event cannot be
+        removed.
+        """
 
-            else:
-                self.events[asn][intraSlotOrder][uniqueTag] = cb
+        # make sure we are scheduling in the future
+        assert self.intraSlotOrder is not None
+        assert intraSlotOrder > self.intraSlotOrder
 
-            self.uniqueTagSchedule[uniqueTag] = (asn, intraSlotOrder)
+        if self.threaded:
+            with self.dataLock:
+                self._scheduleAtCurrentAsn(cb, intraSlotOrder)
+        else:
+            self._scheduleAtCurrentAsn(cb, intraSlotOrder)
 
     def scheduleIn(self, delay, cb, uniqueTag, intraSlotOrder):
         """
@@ -255,10 +402,11 @@ class DiscreteEventEngine(threading.Thread):
         Also removed all future events with the same uniqueTag.
         """
 
-        with self.dataLock:
-            asn = int(self.asn + (float(delay) / float(self.settings.tsch_slotDuration)))
-
-            self.scheduleAtAsn(asn, cb, uniqueTag, intraSlotOrder)
+        if self.threaded:
+            with self.dataLock:
+                self._scheduleIn(delay, cb, uniqueTag, intraSlotOrder)
+        else:
+            self._scheduleIn(delay, cb, uniqueTag, intraSlotOrder)
 
     # === play/pause
 
@@ -276,56 +424,134 @@ class DiscreteEventEngine(threading.Thread):
     # === misc
 
     def is_scheduled(self, uniqueTag):
-        with self.dataLock:
-            return uniqueTag in self.uniqueTagSchedule
+        if self.threaded:
+            with self.dataLock:
+                return self.event_queue.is_scheduled(uniqueTag)
+        else:
+            return self.event_queue.is_scheduled(uniqueTag)
 
     def removeFutureEvent(self, uniqueTag):
-        with self.dataLock:
-            if uniqueTag not in self.uniqueTagSchedule:
-                # new event, not need to delete old instances
-                return
+        if self.threaded:
+            with self.dataLock:
+                self._removeFutureEvent(uniqueTag)
+        else:
+            self._removeFutureEvent(uniqueTag)
 
-            # get old instances occurences
-            (asn, intraSlotOrder) = self.uniqueTagSchedule[uniqueTag]
+    # === event queue
 
-            # make sure it's in the future
-            assert asn >= self.asn
+    # 'events' and 'uniqueTagSchedule' are the internal structures of the
+    # event queue; 'events' is available only with the "dict" event queue.
 
-            # delete it
-            del self.uniqueTagSchedule[uniqueTag]
-            del self.events[asn][intraSlotOrder][uniqueTag]
+    @property
+    def events(self):
+        return self.event_queue.events
 
-            # and cleanup event structure if it's empty
-            if not self.events[asn][intraSlotOrder]:
-                del self.events[asn][intraSlotOrder]
+    @events.setter
+    def events(self, events):
+        self.event_queue.events = events
 
-            if not self.events[asn]:
-                del self.events[asn]
+    @property
+    def uniqueTagSchedule(self):
+        return self.event_queue.uniqueTagSchedule
 
     def terminateSimulation(self,delay):
-        with self.dataLock:
-            self.asnEndExperiment = self.asn+delay
-            self.scheduleAtAsn(
-                    asn                = self.asn+delay,
-                    cb                 = self._actionEndSim,
-                    uniqueTag          = (u'DiscreteEventEngine', u'_actionEndSim'),
-                    intraSlotOrder     = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS,
-            )
+        if self.threaded:
+            with self.dataLock:
+                self._terminateSimulation(delay)
+        else:
+            self._terminateSimulation(delay)
 
     # ======================== private ========================================
 
+    # the following methods are called with the dataLock held in threaded mode
+
+    def _has_no_events(self):
+        return self.event_queue.is_empty() and (self.timers.num_armed == 0)
+
+    def _pop_next_slot(self, max_asn=None):
+        """
+        Remove the events of the next ASN having events, up to max_asn when
+        given, including the expiring timers. Return that ASN and its
+        (intraSlotOrder, cb) pairs; (None, []) if there is no such ASN.
+        """
+        if self.timers.num_armed == 0:
+            return self.event_queue.pop_next(self.asn, max_asn)
+
+        next_asn = self.event_queue.peek_next_asn(self.asn, max_asn)
+        timer_asn = self.timers.expire(
+            self.asn,
+            max_asn if next_asn is None else next_asn
+        )
+        if timer_asn is not None:
+            next_asn = timer_asn
+        if next_asn is None:
+            return None, []
+        return self.event_queue.pop_next(next_asn - 1)
+
+    def _scheduleAtAsn(self, asn, cb, uniqueTag, intraSlotOrder):
+        # remove all events with same uniqueTag (the event will be rescheduled)
+        self._removeFutureEvent(uniqueTag)
+
+        self.event_queue.schedule(asn, cb, uniqueTag, intraSlotOrder)
+
+    def _scheduleAtCurrentAsn(self, cb, intraSlotOrder):
+        i = len(self.slotEvents)
+        while self.slotEvents[i-1][0] > intraSlotOrder:
+            i -= 1
+        self.slotEvents.insert(i, (intraSlotOrder, cb))
+
+    def _scheduleIn(self, delay, cb, uniqueTag, intraSlotOrder):
+        self.scheduleAtAsn(self.getAsnIn(delay), cb, uniqueTag, intraSlotOrder)
+
+    def _removeFutureEvent(self, uniqueTag):
+        asn = self.event_queue.remove(uniqueTag)
+
+        # make sure it was in the future
+        assert (asn is None) or (asn >= self.asn)
+
+    def _terminateSimulation(self, delay):
+        self.asnEndExperiment = self.asn+delay
+        self.scheduleAtAsn(
+                asn                = self.asn+delay,
+                cb                 = self._actionEndSim,
+                uniqueTag          = (u'DiscreteEventEngine', u'_actionEndSim'),
+                intraSlotOrder     = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS,
+        )
+
+    def _run_slot_profiled(self):
+        i = 0
+        while i < len(self.slotEvents):
+            (self.intraSlotOrder, cb) = self.slotEvents[i]
+            i += 1
+            self.profiler.call(cb)
+        self.profiler.end_slot(self.asn, i)
+
+    def _take_checkpoint(self):
+        self.checkpoint_asn = self.asn
+        if self.threaded:
+            with self.dataLock:
+                Checkpoint.save(self, self.checkpoint_file_path)
+        else:
+            Checkpoint.save(self, self.checkpoint_file_path)
+
     def _actionPauseSim(self):
         assert self.simPaused==False
         self.simPaused = True
-        self.pauseSem.acquire()
+        if self.threaded:
+            self.pauseSem.acquire()
+        # else, _run_events() returns at the end of the slot
 
     def _actionResumeSim(self):
         if self.simPaused:
             self.simPaused = False
-            self.pauseSem.release()
+            if self.threaded:
+                self.pauseSem.release()
 
     def _actionEndSim(self):
-        with self.dataLock:
+        if self.threaded:
+            with self.dataLock:
+                self.goOn = False
+        else:
             self.goOn = False
 
     def _actionEndSlotframe(self):
@@ -364,9 +590,98 @@ class SimEngine(DiscreteEventEngine):
 
     DAGROOT_ID = 0
 
+    # settings which may differ among the branches of a simulation; see
+    # branch()
+    BRANCHABLE_SETTINGS = [
+        u'exec_randomSeed', # branches are re-seeded anyway
+        u'app_pkPeriod',
+        u'app_pkPeriodVar',
+        u'app_pkLength',
+        u'app_burstTimestamp',
+        u'app_burstNumPackets',
+        u'tsch_tx_queue_size',
+    ]
+
+    # ======================== public =========================================
+
+    def is_converged(self):
+        """ Return True when all the motes are joined and have a parent """
+        for mote in self.motes:
+            if mote.dagRoot:
+                continue
+            if (
+                    (not mote.secjoin.getIsJoined())
+                    or
+                    (mote.rpl.getPreferredParent() is None)
+                ):
+                return False
+        return True
+
+    def branch(self, settings_overrides, branch_id, log_offset):
+        """
+        Turn this simulation into one of its branches, typically in a process
+        forked from it (see runSim.py): apply the settings of the branch,
+        move to its log file and re-seed the random number generators with a
+        seed derived from the current one and branch_id. log_offset is the
+        size of the log file when the simulation was forked.
+        """
+        assert set(settings_overrides).issubset(self.BRANCHABLE_SETTINGS)
+        self.settings.__dict__.update(settings_overrides)
+        SimLog.SimLog().branch(log_offset)
+        if self.checkpoint_file_path is not None:
+            self.checkpoint_file_path = Checkpoint.get_checkpoint_file_path(
+                self.settings.getOutputFile()
+            )
+
+        # re-seed
+        md5 = hashlib.md5()
+        md5.update(
+            u'{0}-{1}'.format(self.random_seed, branch_id).encode('utf-8')
+        )
+        self.random_seed = int(md5.hexdigest(), 16) % sys.maxsize
+        random.seed(a=self.random_seed)
+        self.random_streams.reseed(self.random_seed)
+        self.log(
+            SimLog.LOG_SIMULATOR_RANDOM_SEED,
+            {
+                u'value': self.random_seed
+            }
+        )
+
+        # let the layers which cached settings read them again
+        for mote in self.motes:
+            mote.tsch.indication_settings_changed()
+            mote.app.indication_settings_changed()
+
+        # the steady state of the branch is another one
+        if self.steady_state_monitor is not None:
+            self.steady_state_monitor.start()
+
+    # ======================== private ========================================
+
     def _init_additional_local_variables(self):
         self.settings                   = SimSettings.SimSettings()
 
+        # select the event queue backend before any event gets scheduled
+        assert self.event_queue.is_empty()
+        self.event_queue = EventQueue.create_event_queue(
+            self.settings.exec_eventQueue
+        )
+
+        # profile the callbacks if requested
+        if self.settings.exec_profile:
+            self.profiler = EngineProfiler.EngineProfiler()
+
+        # take periodic checkpoints if requested
+        if self.settings.exec_numSlotframesPerCheckpoint:
+            self.checkpoint_file_path = Checkpoint.get_checkpoint_file_path(
+                self.settings.getOutputFile()
+            )
+            self.checkpoint_period = (
+                self.settings.exec_numSlotframesPerCheckpoint *
+                self.settings.tsch_slotframeLength
+            )
+
         # set random seed
         if   self.settings.exec_randomSeed == u'random':
             self.random_seed = random.randint(0, sys.maxsize)
@@ -385,6 +700,10 @@ class SimEngine(DiscreteEventEngine):
             self.random_seed = self.settings.exec_randomSeed
         # apply the random seed; log the seed after self.log is initialized
         random.seed(a=self.random_seed)
+        self.random_streams = RandomStreams.RandomStreams(
+            self.settings.exec_randomStreams,
+            self.random_seed
+        )
 
         if self.settings.motes_eui64:
             eui64_table = self.settings.motes_eui64[:]
@@ -396,7 +715,7 @@ class SimEngine(DiscreteEventEngine):
             eui64_table = [None] * self.settings.exec_numMotes
 
         self.motes = [
-            Mote.Mote.Mote(id, eui64)
+            Mote.Mote.Mote(id, eui64, context=self.context)
             for id, eui64 in zip(
                     list(range(self.settings.exec_numMotes)),
                     eui64_table
@@ -412,6 +731,10 @@ class SimEngine(DiscreteEventEngine):
         self.log                        = SimLog.SimLog().log
         SimLog.SimLog().set_simengine(self)
 
+        # monitor the KPIs to end the run in steady state, if requested
+        if self.settings.exec_steadyStateMetrics:
+            self.steady_state_monitor = SteadyState.SteadyStateMonitor(self)
+
         # log the random seed
         self.log(
             SimLog.LOG_SIMULATOR_RANDOM_SEED,
@@ -432,6 +755,100 @@ class SimEngine(DiscreteEventEngine):
         for i in range(len(self.motes)):
             self.motes[i].boot()
 
+        # skip the formation of the network if requested
+        if self.settings.exec_initialState == u'converged':
+            self._install_converged_state()
+        else:
+            assert self.settings.exec_initialState == u'boot'
+
+    def _install_converged_state(self):
+        """
+        Put the motes which can reach the root in the state of a converged
+        network: synchronized, joined, with their parent in the routing tree
+        of shortest ETX, their cells to it and their source route at the
+        root. The other motes keep listening for EBs.
+        """
+        root = self.motes[self.DAGROOT_ID]
+        for (mote_id, parent_id) in self._compute_routing_tree():
+            mote            = self.motes[mote_id]
+            parent          = self.motes[parent_id]
+            parent_mac_addr = parent.get_mac_addr()
+
+            # tsch; the SF starts along
+            mote.tsch.join_proxy = netaddr.EUI(parent_mac_addr)
+            mote.tsch.clock.sync(parent_mac_addr)
+            mote.tsch.setIsSync(True)
+            mote.tsch.add_minimal_cell()
+
+            # secjoin; RPL starts along
+            mote.secjoin.setIsJoined(True)
+
+            # rpl
+            mote.rpl.set_initial_parent(
+                parent_mac_addr = parent_mac_addr,
+                parent_rank     = parent.rpl.get_rank(),
+                dodagId         = root.rpl.dodagId
+            )
+            root.rpl.addParentChildfromDAOs(
+                parent_addr = parent.get_ipv6_global_addr(),
+                child_addr  = mote.get_ipv6_global_addr()
+            )
+
+            # sf
+            mote.sf.set_initial_parent(parent_mac_addr)
+
+            # what the first DAO starts otherwise
+            mote.tsch.startSendingEBs()
+            mote.app.startSendingData()
+
+    def _compute_routing_tree(self):
+        """
+        Return the (mote_id, parent_id) pairs of the tree of the paths of
+        shortest ETX to the root, parents first. The ETX of a link is the
+        inverse of its PDR averaged over both directions and all the
+        channels; links with an ETX above the limit of RPL OF0 are ignored.
+        """
+        channels = Mote.MoteDefines.TSCH_HOPPING_SEQUENCE[
+            :self.settings.phy_numChans
+        ]
+        max_etx  = Mote.rpl.RplOF0.UPPER_LIMIT_OF_ACCEPTABLE_ETX
+
+        # Dijkstra from the root
+        tree      = []
+        path_etx  = {self.DAGROOT_ID: 0}
+        parent_of = {}
+        heap      = [(0, self.DAGROOT_ID)]
+        visited   = set()
+        while heap:
+            (etx, parent_id) = heapq.heappop(heap)
+            if parent_id in visited:
+                continue
+            visited.add(parent_id)
+            if parent_id != self.DAGROOT_ID:
+                tree.append((parent_id, parent_of[parent_id]))
+
+            for mote_id in range(len(self.motes)):
+                if mote_id in visited:
+                    continue
+                pdr = sum(
+                    [
+                        self.connectivity.get_pdr(src_id, dst_id, channel)
+                        for channel in channels
+                        for (src_id, dst_id) in [
+                            (mote_id, parent_id),
+                            (parent_id, mote_id)
+                        ]
+                    ]
+                ) / (2 * len(channels))
+                if pdr == 0 or (1 / pdr) > max_etx:
+                    continue
+                if etx + 1 / pdr < path_etx.get(mote_id, float(u'inf')):
+                    path_etx[mote_id]  = etx + 1 / pdr
+                    parent_of[mote_id] = parent_id
+                    heapq.heappush(heap, (path_etx[mote_id], mote_id))
+
+        return tree
+
     def _routine_thread_started(self):
         # log
         self.log(
@@ -458,6 +875,10 @@ class SimEngine(DiscreteEventEngine):
             intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS,
         )
 
+        # end the run once in steady state, if requested
+        if self.steady_state_monitor is not None:
+            self.steady_state_monitor.start()
+
     def _routine_thread_crashed(self):
         # log
         self.log(
@@ -469,6 +890,9 @@ class SimEngine(DiscreteEventEngine):
         )
 
     def _routine_thread_ended(self):
+        if self.steady_state_monitor is not None:
+            self.steady_state_monitor.indicate_end()
+
         # log
         self.log(
             SimLog.LOG_SIMULATOR_STATE,
@@ -477,3 +901,43 @@ class SimEngine(DiscreteEventEngine):
                 "state": "stopped"
             }
         )
+
+        # write the profiling report next to the log file
+        if self.profiler is not None:
+            self.profiler.pause()
+            self.profiler.write_report(self.asn, self.settings.getOutputFile())
+
+# =========================== in-process API ==================================
+
+# settings which make a simulation write files
+FILE_WRITING_SETTINGS = [
+    u'exec_numSlotframesPerCheckpoint',
+    u'exec_profile',
+]
+
+def run_scenario(settings, seed, kpis=None):
+    """
+    Run a simulation in the calling process, without writing any file, and
+    return its KPIs, indexed by name (see Kpis.KPIS); kpis selects some of
+    them. settings are all the settings of the simulation, e.g. the regular
+    settings of a config.json plus "exec_numMotes"; seed replaces
+    "exec_randomSeed". The KPIs are computed from the logs as they are
+    written (see Kpis.KpiCollector); the simulation has a SimContext of its
+    own, which it leaves behind.
+    """
+    scenario = dict(settings)
+    scenario[u'exec_randomSeed'] = seed
+    for name in FILE_WRITING_SETTINGS:
+        if scenario.get(name):
+            raise ValueError(
+                u'{0} writes files, which run_scenario() does not'.format(name)
+            )
+    Kpis.check_kpis(kpis)
+
+    with SimContext.SimContext():
+        sim_settings = SimSettings.SimSettings(**scenario)
+        simlog       = SimLog.SimLog(log_to_file=False)
+        collector    = Kpis.KpiCollector(simlog)
+        engine       = SimEngine()
+        engine.run()
+        return collector.get_kpis(kpis)
@@ -21,6 +21,9 @@ import copy
 import json
 import traceback
 
+from future.utils import with_metaclass
+
+from . import SimContext
 from . import SimSettings
 
 # =========================== defines =========================================
@@ -28,6 +31,7 @@ from . import SimSettings
 # === simulator
 LOG_SIMULATOR_STATE               = {u'type': u'simulator.state',           u'keys': [u'state', u'name']}
 LOG_SIMULATOR_RANDOM_SEED         = {u'type': u'simulator.random_seed',     u'keys': [u'value']}
+LOG_SIMULATOR_STOP                = {u'type': u'simulator.stop',            u'keys': [u'reason', u'metrics']}
 
 # === packet drops
 LOG_PACKET_DROPPED                = {u'type': u'packet_dropped',            u'keys': [u'_mote_id',u'packet',u'reason']}
@@ -107,11 +111,10 @@ LOG_CONN_MATRIX_K7_UPDATE         = {u'type': u'conn.matrix.update',        u'ke
 
 # ============================ SimLog =========================================
 
-class SimLog(object):
+class SimLog(with_metaclass(SimContext.Singleton, object)):
 
     # ==== start singleton
-    _instance      = None
-    _init          = False
+    CONTEXT_ATTRIBUTE = u'log'
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -119,9 +122,9 @@ class SimLog(object):
         return cls._instance
     # ==== end singleton
 
-    def __init__(self, failIfNotInit=False):
+    def __init__(self, failIfNotInit=False, log_to_file=True):
 
-        if failIfNotInit and not self._init:
+        if failIfNotInit and not type(self)._init:
             raise EnvironmentError(u'SimLog singleton not initialized.')
 
         # ==== start singleton
@@ -138,20 +141,13 @@ class SimLog(object):
 
             # local variables
             self.log_filters = []
+            self.observers   = {} # callbacks, indexed by log type
 
-            # open log file
-            self.log_output_file = open(self.settings.getOutputFile(), u'a')
-
-            # write config to log file; if a file with the same file name exists,
-            # append logs to the file. this happens if you multiple runs on the
-            # same CPU. And amend config line; config line in log file should have
-            # '_type' field. And 'run_id' type should be '_run_id'
-            config_line = copy.deepcopy(self.settings.__dict__)
-            config_line[u'_type']   = u'config'
-            config_line[u'_run_id'] = config_line[u'run_id']
-            del config_line[u'run_id']
-            json_string = json.dumps(config_line)
-            self.log_output_file.write(json_string + u'\n')
+            # open log file; without it, only the observers get the logs
+            if log_to_file:
+                self._open_log_file()
+            else:
+                self.log_output_file = None
         except:
             # destroy the singleton
             cls._instance = None
@@ -164,6 +160,15 @@ class SimLog(object):
         :param dict content:
         """
 
+        # observers see all the logs, including the filtered out ones
+        if simlog[u'type'] in self.observers:
+            for callback in self.observers[simlog[u'type']]:
+                callback(content)
+
+        # no log file
+        if self.log_output_file is None:
+            return
+
         # ignore types that are not listed in the simulation config
         if (self.log_filters != u'all') and (simlog[u'type'] not in self.log_filters):
             return
@@ -216,22 +221,102 @@ class SimLog(object):
 
     def flush(self):
         # flush the internal buffer, write data to the file
+        if self.log_output_file is None:
+            return
         assert not self.log_output_file.closed
         self.log_output_file.flush()
 
+    def branch(self, offset):
+        """
+        Move to the log file of the settings of a branch (see
+        SimEngine.branch()), starting with a copy of what this run logged
+        before the branch, i.e. up to offset. The file position isn't reliable
+        in a forked process: the processes share it.
+        """
+        if self.log_output_file.name == self.settings.getOutputFile():
+            # the settings of the branch log into the same file
+            return
+
+        prefix_file_path = self.log_output_file.name
+        prefix_start     = self.run_start_offset
+        prefix_stop      = offset
+        self.log_output_file.close()
+
+        # copy the prefix in binary mode, after the config line, then log
+        # after it in text mode
+        self._open_log_file()
+        file_path = self.log_output_file.name
+        self.log_output_file.close()
+        with open(prefix_file_path, u'rb') as prefix_file:
+            prefix_file.seek(prefix_start)
+            with open(file_path, u'ab') as f:
+                f.write(prefix_file.read(prefix_stop - prefix_start))
+        self.log_output_file = open(file_path, u'a')
+
+    def reopen(self, offset):
+        """
+        Reopen the log file of a restored simulation, dropping what was
+        logged after offset (see Checkpoint)
+        """
+        file_path = self.settings.getOutputFile()
+        with open(file_path, u'a') as f:
+            if f.tell() < offset:
+                raise ValueError(
+                    u'{0} is shorter than when the checkpoint was taken'.format(
+                        file_path
+                    )
+                )
+            f.truncate(offset)
+        self.log_output_file = open(file_path, u'a')
+
     def set_simengine(self, engine):
         self.engine = engine
 
+    def add_observer(self, simlog, callback):
+        """ Call callback with the content of every log of type simlog """
+        if simlog[u'type'] not in self.observers:
+            self.observers[simlog[u'type']] = []
+        self.observers[simlog[u'type']].append(callback)
+
     def set_log_filters(self, log_filters):
         self.log_filters = log_filters
 
     def destroy(self):
         # close log file
-        if not self.log_output_file.closed:
+        if (
+                (self.log_output_file is not None)
+                and
+                (not self.log_output_file.closed)
+            ):
             self.log_output_file.close()
 
         cls = type(self)
         cls._instance       = None
         cls._init           = False
 
+    # ============================== checkpoint ===============================
+
+    def __getstate__(self):
+        # the log file is reopened by reopen()
+        state = self.__dict__.copy()
+        del state[u'log_output_file']
+        return state
+
     # ============================== private ==================================
+
+    def _open_log_file(self):
+        self.log_output_file = open(self.settings.getOutputFile(), u'a')
+
+        # write config to log file; if a file with the same file name exists,
+        # append logs to the file. this happens if you multiple runs on the
+        # same CPU. And amend config line; config line in log file should have
+        # '_type' field. And 'run_id' type should be '_run_id'
+        config_line = copy.deepcopy(self.settings.__dict__)
+        config_line[u'_type']   = u'config'
+        config_line[u'_run_id'] = config_line[u'run_id']
+        del config_line[u'run_id']
+        json_string = json.dumps(config_line)
+        self.log_output_file.write(json_string + u'\n')
+
+        # where the logs of this run start
+        self.run_start_offset = self.log_output_file.tell()
@@ -7,6 +7,7 @@
 \author Nicola Accettura <nicola.accettura@eecs.berkeley.edu>
 \author Xavier Vilajosana <xvilajosana@eecs.berkeley.edu>
 """
+from __future__ import absolute_import
 from __future__ import division
 
 # =========================== imports =========================================
@@ -16,18 +17,21 @@ import math
 import os
 import re
 
+from future.utils import with_metaclass
+
+from . import SimContext
+
 # =========================== defines =========================================
 
 # =========================== body ============================================
 
-class SimSettings(object):
+class SimSettings(with_metaclass(SimContext.Singleton, object)):
 
     # ==== class attributes / definitions
     DEFAULT_LOG_ROOT_DIR = 'simData'
 
     # ==== start singleton
-    _instance = None
-    _init     = False
+    CONTEXT_ATTRIBUTE = 'settings'
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -44,7 +48,7 @@ class SimSettings(object):
             **kwargs
         ):
 
-        if failIfNotInit and not self._init:
+        if failIfNotInit and not type(self)._init:
             raise EnvironmentError('SimSettings singleton not initialized.')
 
         # ==== start singleton
@@ -0,0 +1,285 @@
+"""
+\brief Steady-state detection, to end a run once its KPIs are precise enough.
+
+With a non-empty "exec_steadyStateMetrics" setting, the engine runs a
+SteadyStateMonitor, which tracks some of the KPIs compute_kpis.py computes,
+with the same code (see Kpis.py), from the logs as they are written, and
+from the radio stats of the motes:
+
+* "delivery_ratio": upstream packets received by the root over upstream
+  packets sent
+* "latency": mean upstream latency, in seconds
+* "duty_cycle": ratio of the slots the radios of the motes, root excepted,
+  are on; the stats are read from the radios at the end of each batch, not
+  from the radio.stats logs, which are written at their own period
+
+The first "exec_steadyStateMinSlotframes" slotframes are a warm-up, whose
+logs are ignored. The monitor then cuts the run into batches of
+"exec_steadyStateBatchSlotframes" slotframes and computes each metric for
+each batch. After MIN_NUM_BATCHES batches, it ends the run as soon as, for
+every metric, the half-width of the confidence interval of the batch means
+is within "exec_steadyStatePrecision" of the mean. The reason the run
+stopped, and the estimate of each metric, are logged ("simulator.stop"); a
+run which doesn't reach the precision ends after "exec_numSlotframesPerRun"
+slotframes, as without the monitor.
+
+A KpiObserver counts what the metrics are computed from (KpiCounters) since
+the beginning of the run; the counters of a batch are the difference between
+the counters at its end and at its beginning. runSim.py also uses them to
+summarize each run when it adapts the number of runs to the precision of the
+KPIs (execution.adaptiveRuns).
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# =========================== imports =========================================
+
+from builtins import object
+import math
+
+import numpy as np
+import scipy.stats
+
+from . import Kpis
+from . import SimSettings
+from . import SimLog
+from .Mote import MoteDefines as d
+
+# =========================== defines =========================================
+
+METRIC_DELIVERY_RATIO = u'delivery_ratio'
+METRIC_LATENCY        = u'latency'
+METRIC_DUTY_CYCLE     = u'duty_cycle'
+METRICS               = [
+    METRIC_DELIVERY_RATIO,
+    METRIC_LATENCY,
+    METRIC_DUTY_CYCLE
+]
+
+STOP_REASON_STEADY_STATE = u'steady_state'
+STOP_REASON_MAX_DURATION = u'max_duration'
+
+CONFIDENCE_LEVEL = 0.95
+MIN_NUM_BATCHES  = 5
+
+# the radio stats counting as the radio being on
+RADIO_ON_STATS = [
+    u'idle_listen',
+    u'tx_data_rx_ack',
+    u'tx_data',
+    u'rx_data_tx_ack',
+    u'rx_data'
+]
+
+# =========================== helpers =========================================
+
+def batch_means_interval(values):
+    """
+    Return the mean of the batch means in values and the half-width of its
+    confidence interval
+    """
+    mean = float(np.mean(values))
+    if len(values) < 2:
+        return (mean, float(u'inf'))
+    t = scipy.stats.t.ppf((1 + CONFIDENCE_LEVEL) / 2, len(values) - 1)
+    half_width = t * np.std(values, ddof=1) / math.sqrt(len(values))
+    return (mean, float(half_width))
+
+def is_precise(values, precision):
+    """
+    Whether the half-width of the confidence interval of the mean of values
+    is within precision (relative) of the mean
+    """
+    (mean, half_width) = batch_means_interval(values)
+    return half_width <= precision * abs(mean)
+
+# =========================== body ============================================
+
+class KpiCounters(object):
+    """
+    What the metrics are computed from, counted over a period (a batch, a
+    run) by a KpiObserver
+    """
+
+    def __init__(self):
+        self.num_tx      = 0    # upstream packets sent
+        self.num_rx      = 0    # upstream packets received
+        self.latency     = 0.0  # of the packets received, in seconds
+        self.radio_on    = 0    # slots
+        self.radio_total = 0    # slots
+
+    def get_metric(self, metric):
+        """ Return the value of metric over the period, None without data """
+        # packets are counted when sent and when received, possibly in
+        # different periods
+        if   metric == METRIC_DELIVERY_RATIO:
+            if self.num_tx:
+                return self.num_rx / self.num_tx
+        elif metric == METRIC_LATENCY:
+            if self.num_rx:
+                return self.latency / self.num_rx
+        elif metric == METRIC_DUTY_CYCLE:
+            if self.radio_total:
+                return self.radio_on / self.radio_total
+        else:
+            raise ValueError(u'unsupported metric: {0}'.format(metric))
+        return None
+
+    def since(self, previous):
+        """
+        Return the counters of the period from previous, counters of the same
+        run taken earlier, to these
+        """
+        counters = KpiCounters()
+        counters.num_tx      = self.num_tx      - previous.num_tx
+        counters.num_rx      = self.num_rx      - previous.num_rx
+        counters.latency     = self.latency     - previous.latency
+        counters.radio_on    = self.radio_on    - previous.radio_on
+        counters.radio_total = self.radio_total - previous.radio_total
+        return counters
+
+class KpiObserver(object):
+    """
+    Count what the metrics are computed from since the beginning of the run:
+    the upstream packets from the per-mote stats of a Kpis.KpiCollector, as
+    compute_kpis.py computes them, and the radio activity from the radio
+    stats of the motes
+    """
+
+    def __init__(self, engine, collector):
+
+        # store params
+        self.engine    = engine
+        self.collector = collector
+
+    # ======================= public ==========================================
+
+    def get_counters(self):
+        """ Return the KpiCounters of the run so far """
+        counters = KpiCounters()
+
+        for motestats in self.collector.get_mote_stats().values():
+            counters.num_tx  += motestats[u'upstream_num_tx']
+            counters.num_rx  += motestats[u'upstream_num_rx']
+            counters.latency += sum(motestats[u'latencies'])
+
+        for mote in self.engine.motes:
+            if mote.id == Kpis.DAGROOT_ID:
+                continue
+            stats = mote.radio.get_stats()
+            radio_on = sum([stats[name] for name in RADIO_ON_STATS])
+            counters.radio_on    += radio_on
+            counters.radio_total += radio_on + stats[u'sleep']
+
+        return counters
+
+class SteadyStateMonitor(object):
+
+    def __init__(self, engine):
+
+        # singletons (quicker access, instead of recreating every time)
+        self.engine   = engine
+        self.settings = SimSettings.SimSettings()
+        self.log      = SimLog.SimLog().log
+
+        for metric in self.settings.exec_steadyStateMetrics:
+            if metric not in METRICS:
+                raise ValueError(
+                    u'unsupported steady-state metric: {0}'.format(metric)
+                )
+
+        # local variables
+        self.metrics        = self.settings.exec_steadyStateMetrics
+        self.precision      = self.settings.exec_steadyStatePrecision
+        self.warmup_length  = (
+            self.settings.exec_steadyStateMinSlotframes *
+            self.settings.tsch_slotframeLength
+        )
+        self.batch_length   = (
+            self.settings.exec_steadyStateBatchSlotframes *
+            self.settings.tsch_slotframeLength
+        )
+        self.kpi_observer   = KpiObserver(
+            engine,
+            Kpis.KpiCollector(SimLog.SimLog())
+        )
+        self.batch_means    = None  # lists, indexed by metric
+        self.batch_start    = None  # KpiCounters when the batch started, if any
+        self.stop_reason    = None
+
+    # ======================= public ==========================================
+
+    def start(self):
+        """ Start, or restart after the settings changed, with a warm-up """
+        self.batch_means = dict([(metric, []) for metric in self.metrics])
+        self.batch_start = None
+        self.engine.scheduleAtAsn(
+            asn            = self.engine.getAsn() + max(self.warmup_length, 1),
+            cb             = self._action_end_batch,
+            uniqueTag      = (u'SteadyStateMonitor', u'_action_end_batch'),
+            intraSlotOrder = d.INTRASLOTORDER_ADMINTASKS,
+        )
+
+    def indicate_end(self):
+        """ The run is over """
+        if self.stop_reason is None:
+            self._log_stop(STOP_REASON_MAX_DURATION)
+
+    # ======================= private =========================================
+
+    def _action_end_batch(self):
+        # the batch ending, if any, ends here and the next one starts here
+        counters = self.kpi_observer.get_counters()
+
+        if self.batch_start is not None:
+            self._close_batch(counters.since(self.batch_start))
+            if self._is_steady():
+                self._log_stop(STOP_REASON_STEADY_STATE)
+                self.engine.terminateSimulation(1)
+                return
+
+        # start the next batch
+        self.batch_start = counters
+        self.engine.scheduleAtAsn(
+            asn            = self.engine.getAsn() + self.batch_length,
+            cb             = self._action_end_batch,
+            uniqueTag      = (u'SteadyStateMonitor', u'_action_end_batch'),
+            intraSlotOrder = d.INTRASLOTORDER_ADMINTASKS,
+        )
+
+    def _close_batch(self, batch):
+        # metrics without data in the batch get no batch mean
+        for metric in self.metrics:
+            value = batch.get_metric(metric)
+            if value is not None:
+                self.batch_means[metric].append(value)
+
+    def _is_steady(self):
+        for values in self.batch_means.values():
+            if len(values) < MIN_NUM_BATCHES:
+                return False
+            if not is_precise(values, self.precision):
+                return False
+        return True
+
+    def _log_stop(self, reason):
+        self.stop_reason = reason
+        metrics = {}
+        for (metric, values) in self.batch_means.items():
+            (mean, half_width) = (None, None)
+            if values:
+                (mean, half_width) = batch_means_interval(values)
+                if math.isinf(half_width):
+                    half_width = None
+            metrics[metric] = {
+                u'mean':        mean,
+                u'half_width':  half_width,
+                u'num_batches': len(values),
+            }
+        self.log(
+            SimLog.LOG_SIMULATOR_STOP,
+            {
+                u'reason':  reason,
+                u'metrics': metrics,
+            }
+        )
@@ -0,0 +1,148 @@
+"""
+\brief Hashed timing wheel for restartable protocol timers.
+
+Protocol timers (keep-alive, desynchronization, 6P timeouts) are re-armed far
+more often than they expire. Scheduling them as regular events costs an
+event removal and insertion, a uniqueTag string and often a new closure at
+every re-arm. A timer of the wheel is created once, with its callback and
+intraSlotOrder, and is then identified by an integer handle; arming,
+re-arming and cancelling it are O(1). Only the timers which expire are moved
+to the event queue of the engine, right before the engine executes their
+ASN.
+
+A timer gets a sequence number of the event queue when it is armed, so that
+it's executed in the same order as an event scheduled at that moment would
+be.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+from builtins import range
+from builtins import object
+
+# =========================== defines =========================================
+
+# =========================== body ============================================
+
+class TimerWheel(object):
+
+    NUM_BUCKETS = 1024 # a power of two
+
+    def __init__(self, engine):
+
+        # store params
+        self.engine           = engine
+
+        # local variables
+        self.num_armed        = 0
+        self._mask            = self.NUM_BUCKETS - 1
+        self._buckets         = [{} for _ in range(self.NUM_BUCKETS)]
+        self._min_deadline    = None # no armed timer expires before
+        self._free_handles    = []
+
+        # timer attributes, indexed by handle
+        self._cbs             = []
+        self._intraSlotOrders = []
+        self._uniqueTags      = []
+        self._deadlines       = [] # None when not armed
+        self._seqs            = []
+
+    # ======================= public ==========================================
+
+    def create(self, cb, intraSlotOrder):
+        """ Create a (disarmed) timer; return its handle """
+        if self._free_handles:
+            handle = self._free_handles.pop()
+            self._cbs[handle]             = cb
+            self._intraSlotOrders[handle] = intraSlotOrder
+        else:
+            handle = len(self._cbs)
+            self._cbs.append(cb)
+            self._intraSlotOrders.append(intraSlotOrder)
+            self._uniqueTags.append((u'TimerWheel', handle))
+            self._deadlines.append(None)
+            self._seqs.append(None)
+        return handle
+
+    def delete(self, handle):
+        """ Cancel a timer and release its handle """
+        self.cancel(handle)
+        self._cbs[handle] = None
+        self._free_handles.append(handle)
+
+    def arm(self, handle, asn):
+        """ (Re)arm a timer to expire at an ASN in the future """
+
+        # make sure we are scheduling in the future
+        assert asn > self.engine.asn
+
+        deadline = self._deadlines[handle]
+        if deadline is None:
+            self.num_armed += 1
+        else:
+            del self._buckets[deadline & self._mask][handle]
+
+        self._deadlines[handle] = asn
+        self._seqs[handle]      = self.engine.event_queue.next_seq()
+        self._buckets[asn & self._mask][handle] = None
+        if (self._min_deadline is None) or (asn < self._min_deadline):
+            self._min_deadline = asn
+
+    def cancel(self, handle):
+        deadline = self._deadlines[handle]
+        if deadline is not None:
+            del self._buckets[deadline & self._mask][handle]
+            self._deadlines[handle] = None
+            self.num_armed -= 1
+
+    def is_armed(self, handle):
+        return self._deadlines[handle] is not None
+
+    def get_deadline(self, handle):
+        """ Return the ASN at which the timer expires; None if disarmed """
+        return self._deadlines[handle]
+
+    def expire(self, current_asn, max_asn=None):
+        """
+        Move the timers expiring at the first ASN after current_asn having
+        timers, up to max_asn when given, to the event queue. Return that
+        ASN, or None if no timer expires up to max_asn.
+        """
+        if self.num_armed == 0:
+            return None
+
+        asn = max(current_asn + 1, self._min_deadline)
+        while (max_asn is None) or (asn <= max_asn):
+            bucket = self._buckets[asn & self._mask]
+            if bucket:
+                handles = [
+                    handle for handle in bucket
+                    if self._deadlines[handle] == asn
+                ]
+                if handles:
+                    self._min_deadline = asn + 1
+                    for handle in handles:
+                        self._move_to_event_queue(handle)
+                    return asn
+            asn += 1
+
+        # no timer expires up to max_asn
+        self._min_deadline = max_asn + 1
+        return None
+
+    # ======================= private =========================================
+
+    def _move_to_event_queue(self, handle):
+        deadline = self._deadlines[handle]
+        del self._buckets[deadline & self._mask][handle]
+        self._deadlines[handle] = None
+        self.num_armed -= 1
+
+        self.engine.event_queue.schedule(
+            asn            = deadline,
+            cb             = self._cbs[handle],
+            uniqueTag      = self._uniqueTags[handle],
+            intraSlotOrder = self._intraSlotOrders[handle],
+            seq            = self._seqs[handle]
+        )
@@ -6,8 +6,6 @@ from __future__ import print_function
 import os
 import sys
 
-import netaddr
-
 if __name__ == '__main__':
     here = sys.path[0]
     sys.path.insert(0, os.path.join(here, '..'))
@@ -16,16 +14,12 @@ if __name__ == '__main__':
 
 import json
 import glob
-import numpy as np
 
-from SimEngine import SimLog
-import SimEngine.Mote.MoteDefines as d
+from SimEngine import Kpis
 
 # =========================== defines =========================================
 
-DAGROOT_ID = 0  # we assume first mote is DAGRoot
-DAGROOT_IP = 'fd00::1:0'
-BATTERY_AA_CAPACITY_mAh = 2821.5
+DAGROOT_ID = Kpis.DAGROOT_ID  # we assume first mote is DAGRoot
 
 # =========================== decorators ======================================
 
@@ -35,29 +29,6 @@ def openfile(func):
             return func(f)
     return inner
 
-# =========================== helpers =========================================
-
-def mean(numbers):
-    return float(sum(numbers)) / max(len(numbers), 1)
-
-def init_mote():
-    return {
-        'upstream_num_tx': 0,
-        'upstream_num_rx': 0,
-        'upstream_num_lost': 0,
-        'join_asn': None,
-        'join_time_s': None,
-        'sync_asn': None,
-        'sync_time_s': None,
-        'charge_asn': None,
-        'upstream_pkts': {},
-        'latencies': [],
-        'hops': [],
-        'charge': None,
-        'lifetime_AA_years': None,
-        'avg_current_uA': None,
-    }
-
 # =========================== KPIs ============================================
 
 @openfile
@@ -66,6 +37,7 @@ def kpis_all(inputfile):
     allstats = {} # indexed by run_id, mote_id
 
     file_settings = json.loads(inputfile.readline())  # first line contains settings
+    slot_duration = file_settings['tsch_slotDuration']
 
     # === gather raw stats
 
@@ -74,8 +46,6 @@ def kpis_all(inputfile):
 
         # shorthands
         run_id = logline['_run_id']
-        if '_asn' in logline: # TODO this should be enforced in each line
-            asn = logline['_asn']
         if '_mote_id' in logline: # TODO this should be enforced in each line
             mote_id = logline['_mote_id']
 
@@ -89,302 +59,28 @@ def kpis_all(inputfile):
                 and
                 (mote_id != DAGROOT_ID)
             ):
-            allstats[run_id][mote_id] = init_mote()
-
-        if   logline['_type'] == SimLog.LOG_TSCH_SYNCED['type']:
-            # sync'ed
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-
-            # only log non-dagRoot sync times
-            if mote_id == DAGROOT_ID:
-                continue
-
-            allstats[run_id][mote_id]['sync_asn']  = asn
-            allstats[run_id][mote_id]['sync_time_s'] = asn*file_settings['tsch_slotDuration']
-
-        elif logline['_type'] == SimLog.LOG_SECJOIN_JOINED['type']:
-            # joined
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-
-            # only log non-dagRoot join times
-            if mote_id == DAGROOT_ID:
-                continue
-
-            # populate
-            assert allstats[run_id][mote_id]['sync_asn'] is not None
-            allstats[run_id][mote_id]['join_asn']  = asn
-            allstats[run_id][mote_id]['join_time_s'] = asn*file_settings['tsch_slotDuration']
-
-        elif logline['_type'] == SimLog.LOG_APP_TX['type']:
-            # packet transmission
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-            dstIp      = logline['packet']['net']['dstIp']
-            appcounter = logline['packet']['app']['appcounter']
-
-            # only log upstream packets
-            if dstIp != DAGROOT_IP:
-                continue
-
-            # populate
-            assert allstats[run_id][mote_id]['join_asn'] is not None
-            if appcounter not in allstats[run_id][mote_id]['upstream_pkts']:
-                allstats[run_id][mote_id]['upstream_pkts'][appcounter] = {
-                    'hops': 0,
-                }
-
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['tx_asn'] = asn
+            allstats[run_id][mote_id] = Kpis.init_mote()
 
-        elif logline['_type'] == SimLog.LOG_APP_RX['type']:
-            # packet reception
-
-            # shorthands
-            mote_id    = netaddr.IPAddress(logline['packet']['net']['srcIp']).words[-1]
-            dstIp      = logline['packet']['net']['dstIp']
-            hop_limit  = logline['packet']['net']['hop_limit']
-            appcounter = logline['packet']['app']['appcounter']
-
-            # only log upstream packets
-            if dstIp != DAGROOT_IP:
-                continue
-
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['hops']   = (
-                d.IPV6_DEFAULT_HOP_LIMIT - hop_limit + 1
-            )
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['rx_asn'] = asn
-
-        elif logline['_type'] == SimLog.LOG_RADIO_STATS['type']:
-            # shorthands
-            mote_id    = logline['_mote_id']
-
-            # only log non-dagRoot charge
-            if mote_id == DAGROOT_ID:
-                continue
-
-            charge =  logline['idle_listen'] * d.CHARGE_IdleListen_uC
-            charge += logline['tx_data_rx_ack'] * d.CHARGE_TxDataRxAck_uC
-            charge += logline['rx_data_tx_ack'] * d.CHARGE_RxDataTxAck_uC
-            charge += logline['tx_data'] * d.CHARGE_TxData_uC
-            charge += logline['rx_data'] * d.CHARGE_RxData_uC
-            charge += logline['sleep'] * d.CHARGE_Sleep_uC
-
-            allstats[run_id][mote_id]['charge_asn'] = asn
-            allstats[run_id][mote_id]['charge']     = charge
+        Kpis.update_mote_stats(
+            allstats[run_id],
+            logline['_type'],
+            logline.get('_asn'),
+            logline,
+            slot_duration
+        )
 
     # === compute advanced motestats
 
     for (run_id, per_mote_stats) in list(allstats.items()):
-        for (mote_id, motestats) in list(per_mote_stats.items()):
-            if mote_id != 0:
-
-                if (motestats['sync_asn'] is not None) and (motestats['charge_asn'] is not None):
-                    # avg_current, lifetime_AA
-                    if (
-                            (motestats['charge'] <= 0)
-                            or
-                            (motestats['charge_asn'] <= motestats['sync_asn'])
-                        ):
-                        motestats['lifetime_AA_years'] = 'N/A'
-                    else:
-                        motestats['avg_current_uA'] = motestats['charge']/float((motestats['charge_asn']-motestats['sync_asn']) * file_settings['tsch_slotDuration'])
-                        assert motestats['avg_current_uA'] > 0
-                        motestats['lifetime_AA_years'] = (BATTERY_AA_CAPACITY_mAh*1000/float(motestats['avg_current_uA']))/(24.0*365)
-                if motestats['join_asn'] is not None:
-                    # latencies, upstream_num_tx, upstream_num_rx, upstream_num_lost
-                    for (appcounter, pktstats) in list(allstats[run_id][mote_id]['upstream_pkts'].items()):
-                        motestats['upstream_num_tx']      += 1
-                        if 'rx_asn' in pktstats:
-                            motestats['upstream_num_rx']  += 1
-                            thislatency = (pktstats['rx_asn']-pktstats['tx_asn'])*file_settings['tsch_slotDuration']
-                            motestats['latencies']  += [thislatency]
-                            motestats['hops']       += [pktstats['hops']]
-                        else:
-                            motestats['upstream_num_lost'] += 1
-                    if (motestats['upstream_num_rx'] > 0) and (motestats['upstream_num_tx'] > 0):
-                        motestats['latency_min_s'] = min(motestats['latencies'])
-                        motestats['latency_avg_s'] = sum(motestats['latencies'])/float(len(motestats['latencies']))
-                        motestats['latency_max_s'] = max(motestats['latencies'])
-                        motestats['upstream_reliability'] = motestats['upstream_num_rx']/float(motestats['upstream_num_tx'])
-                        motestats['avg_hops'] = sum(motestats['hops'])/float(len(motestats['hops']))
+        Kpis.compute_mote_stats(per_mote_stats, slot_duration)
 
     # === network stats
-    for (run_id, per_mote_stats) in list(allstats.items()):
-
-        #-- define stats
-
-        app_packets_sent = 0
-        app_packets_received = 0
-        app_packets_lost = 0
-        joining_times = []
-        us_latencies = []
-        current_consumed = []
-        lifetimes = []
-        slot_duration = file_settings['tsch_slotDuration']
 
-        #-- compute stats
-
-        for (mote_id, motestats) in list(per_mote_stats.items()):
-            if mote_id == DAGROOT_ID:
-                continue
-
-            # counters
-
-            app_packets_sent += motestats['upstream_num_tx']
-            app_packets_received += motestats['upstream_num_rx']
-            app_packets_lost += motestats['upstream_num_lost']
-
-            # joining times
-
-            if motestats['join_asn'] is not None:
-                joining_times.append(motestats['join_asn'])
-
-            # latency
-
-            us_latencies += motestats['latencies']
-
-            # current consumed
-
-            current_consumed.append(motestats['charge'])
-            if motestats['lifetime_AA_years'] is not None:
-                lifetimes.append(motestats['lifetime_AA_years'])
-            current_consumed = [
-                value for value in current_consumed if value is not None
-            ]
-
-        #-- save stats
-
-        allstats[run_id]['global-stats'] = {
-            'e2e-upstream-delivery': [
-                {
-                    'name': 'E2E Upstream Delivery Ratio',
-                    'unit': '%',
-                    'value': (
-                        1 - app_packets_lost / app_packets_sent
-                        if app_packets_sent > 0 else 'N/A'
-                    )
-                },
-                {
-                    'name': 'E2E Upstream Loss Rate',
-                    'unit': '%',
-                    'value': (
-                        app_packets_lost / app_packets_sent
-                        if app_packets_sent > 0 else 'N/A'
-                    )
-                }
-            ],
-            'e2e-upstream-latency': [
-                {
-                    'name': 'E2E Upstream Latency',
-                    'unit': 's',
-                    'mean': (
-                        mean(us_latencies)
-                        if us_latencies else 'N/A'
-                    ),
-                    'min': (
-                        min(us_latencies)
-                        if us_latencies else 'N/A'
-                    ),
-                    'max': (
-                        max(us_latencies)
-                        if us_latencies else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(us_latencies, 99)
-                        if us_latencies else 'N/A'
-                    )
-                },
-                {
-                    'name': 'E2E Upstream Latency',
-                    'unit': 'slots',
-                    'mean': (
-                        mean(us_latencies) / slot_duration
-                        if us_latencies else 'N/A'
-                    ),
-                    'min': (
-                        min(us_latencies) / slot_duration
-                        if us_latencies else 'N/A'
-                    ),
-                    'max': (
-                        max(us_latencies) / slot_duration
-                        if us_latencies else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(us_latencies, 99) / slot_duration
-                        if us_latencies else 'N/A'
-                    )
-                }
-            ],
-            'current-consumed': [
-                {
-                    'name': 'Current Consumed',
-                    'unit': 'mA',
-                    'mean': (
-                        mean(current_consumed)
-                        if current_consumed else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(current_consumed, 99)
-                        if current_consumed else 'N/A'
-                    )
-                }
-            ],
-            'network_lifetime':[
-                {
-                    'name': 'Network Lifetime',
-                    'unit': 'years',
-                    'min': (
-                        min(lifetimes)
-                        if lifetimes else 'N/A'
-                    ),
-                    'total_capacity_mAh': BATTERY_AA_CAPACITY_mAh,
-                }
-            ],
-            'joining-time': [
-                {
-                    'name': 'Joining Time',
-                    'unit': 'slots',
-                    'min': (
-                        min(joining_times)
-                        if joining_times else 'N/A'
-                    ),
-                    'max': (
-                        max(joining_times)
-                        if joining_times else 'N/A'
-                    ),
-                    'mean': (
-                        mean(joining_times)
-                        if joining_times else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(joining_times, 99)
-                        if joining_times else 'N/A'
-                    )
-                }
-            ],
-            'app-packets-sent': [
-                {
-                    'name': 'Number of application packets sent',
-                    'total': app_packets_sent
-                }
-            ],
-            'app_packets_received': [
-                {
-                    'name': 'Number of application packets received',
-                    'total': app_packets_received
-                }
-            ],
-            'app_packets_lost': [
-                {
-                    'name': 'Number of application packets lost',
-                    'total': app_packets_lost
-                }
-            ]
-        }
+    for (run_id, per_mote_stats) in list(allstats.items()):
+        allstats[run_id]['global-stats'] = Kpis.compute_network_stats(
+            per_mote_stats,
+            slot_duration
+        )
 
     # === remove unnecessary stats
 
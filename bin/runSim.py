@@ -30,12 +30,17 @@ import argparse
 import json
 import glob
 import shutil
+import traceback
 
 from SimEngine import SimConfig,   \
                       SimEngine,   \
                       SimLog, \
                       SimSettings, \
-                      Connectivity
+                      Kpis, \
+                      Connectivity, \
+                      K7Trace, \
+                      EngineProfiler, \
+                      SteadyState
 
 # =========================== helpers =========================================
 
@@ -66,6 +71,85 @@ def printOrLog(cpuID, pid, output, verbose):
     else:
         print(output)
 
+def getSimParams(simconfig):
+    """
+    Returns the combination keys and the simulation settings of every
+    combination.
+    """
+    combinationKeys     = list(simconfig.settings.combination.keys())
+    simParams           = []
+    for p in itertools.product(*[simconfig.settings.combination[k] for k in combinationKeys]):
+        simParam = {}
+        for (k, v) in zip(combinationKeys, p):
+            simParam[k] = v
+        for (k, v) in list(simconfig.settings.regular.items()):
+            if k not in simParam:
+                simParam[k] = v
+        simParams      += [simParam]
+    return combinationKeys, simParams
+
+def compileTraces(simconfig):
+    """
+    Compiles the K7 traces used with 'conn_trace_cache' once, before the
+    simulations start. The workers then map the same compiled trace files,
+    which the OS shares between them, instead of compiling or reading their
+    own copies.
+    """
+    (_, simParams) = getSimParams(simconfig)
+    for simParam in simParams:
+        if (
+                simParam['conn_class'] == 'K7'
+                and
+                simParam['conn_trace_cache']
+            ):
+            K7Trace.K7TraceCache(
+                simParam['conn_trace'],
+                simParam['tsch_slotDuration'],
+                Connectivity.ConnectivityMatrixBase.LINK_NONE['rssi']
+            ).close()
+
+def getBranchOverrides(simParams):
+    """
+    Returns, for every combination, the settings which differ from the first
+    combination, which the branches of a simulation apply after the prefix
+    they share. Raises ValueError if a combination changes a setting which
+    can't differ among branches.
+    """
+    overrides = []
+    for simParam in simParams:
+        override = dict(
+            [
+                (k, v) for (k, v) in simParam.items()
+                if v != simParams[0][k]
+            ]
+        )
+        unbranchable = set(override) - set(SimEngine.SimEngine.BRANCHABLE_SETTINGS)
+        if unbranchable:
+            raise ValueError(
+                'cannot branch on {0}; settings which can differ among the '
+                'combinations of a branched simulation: {1}'.format(
+                    ', '.join(sorted(unbranchable)),
+                    ', '.join(SimEngine.SimEngine.BRANCHABLE_SETTINGS)
+                )
+            )
+        overrides += [override]
+    return overrides
+
+def createSingletons(simconfig, cpuID, run_id, simParam, combinationKeys, verbose):
+    settings         = SimSettings.SimSettings(cpuID=cpuID, run_id=run_id, **simParam)
+    settings.setLogDirectory(simconfig.get_log_directory_name())
+    settings.setCombinationKeys(combinationKeys)
+    simlog           = SimLog.SimLog()
+    simlog.set_log_filters(simconfig.logging)
+    simengine        = SimEngine.SimEngine(run_id=run_id, verbose=verbose)
+    return (settings, simlog, simengine)
+
+def destroySingletons(settings, simlog, simengine):
+    simlog.destroy()
+    simengine.destroy()
+    Connectivity.Connectivity().destroy()
+    settings.destroy() # destroy last, Connectivity needs it
+
 def runSimCombinations(params):
     """
     Runs simulations for all combinations of simulation settings.
@@ -85,60 +169,398 @@ def runSimCombinations(params):
     simStartTime        = time.time()
 
     # compute all the simulation parameter combinations
-    combinationKeys     = list(simconfig.settings.combination.keys())
-    simParams           = []
-    for p in itertools.product(*[simconfig.settings.combination[k] for k in combinationKeys]):
-        simParam = {}
-        for (k, v) in zip(combinationKeys, p):
-            simParam[k] = v
-        for (k, v) in list(simconfig.settings.regular.items()):
-            if k not in simParam:
-                simParam[k] = v
-        simParams      += [simParam]
+    (combinationKeys, simParams) = getSimParams(simconfig)
+
+    branchAt = simconfig.execution.get('branchAt')
+    if (branchAt is not None) and hasattr(os, 'fork'):
+        # simulate the prefix shared by the combinations once per run
+        runBranchedSimCombinations(
+            simconfig,
+            cpuID,
+            pid,
+            numRuns,
+            first_run,
+            verbose,
+            combinationKeys,
+            simParams,
+            branchAt
+        )
 
-    # run a simulation for each set of simParams
-    for (simParamNum, simParam) in enumerate(simParams):
+        # printOrLog
+        output  = 'simulation ended after {0:.0f}s ({1} runs).'.format(
+            time.time()-simStartTime,
+            numRuns * len(simParams)
+        )
+        printOrLog(cpuID, pid, output, verbose)
+    else:
+        # run a simulation for each set of simParams
+        for (simParamNum, simParam) in enumerate(simParams):
+
+            # run the simulation runs
+            for run_id in range(first_run, first_run+numRuns):
+
+                # printOrLog
+                output  = 'parameters {0}/{1}, run {2}/{3}'.format(
+                   simParamNum+1,
+                   len(simParams),
+                   run_id+1-first_run,
+                   numRuns
+                )
+                printOrLog(cpuID, pid, output, verbose)
+
+                # create singletons
+                singletons = createSingletons(
+                    simconfig,
+                    cpuID,
+                    run_id,
+                    simParam,
+                    combinationKeys,
+                    verbose
+                )
+
+                # run the simulation in this process' thread; no other thread
+                # needs to access the engine
+                (settings, simlog, simengine) = singletons
+                simengine.run()
 
-        # run the simulation runs
-        for run_id in range(first_run, first_run+numRuns):
+                # destroy singletons
+                destroySingletons(*singletons)
 
             # printOrLog
-            output  = 'parameters {0}/{1}, run {2}/{3}'.format(
-               simParamNum+1,
-               len(simParams),
-               run_id+1-first_run,
-               numRuns
+            output  = 'simulation ended after {0:.0f}s ({1} runs).'.format(
+                time.time()-simStartTime,
+                numRuns * len(simParams)
             )
             printOrLog(cpuID, pid, output, verbose)
 
-            # create singletons
-            settings         = SimSettings.SimSettings(cpuID=cpuID, run_id=run_id, **simParam)
-            settings.setLogDirectory(simconfig.get_log_directory_name())
-            settings.setCombinationKeys(combinationKeys)
-            simlog           = SimLog.SimLog()
-            simlog.set_log_filters(simconfig.logging)
-            simengine        = SimEngine.SimEngine(run_id=run_id, verbose=verbose)
-
+def runBranchedSimCombinations(
+        simconfig,
+        cpuID,
+        pid,
+        numRuns,
+        first_run,
+        verbose,
+        combinationKeys,
+        simParams,
+        branchAt
+    ):
+    """
+    Runs the simulations of all the combinations, simulating once per run the
+    prefix they share: up to the ASN branchAt, or until the network has
+    converged when branchAt is 'converged'. A process forked at the end of
+    the prefix then simulates the rest of the run of each combination.
 
-            # start simulation run
-            simengine.start()
+    The forked processes run one after the other, so that a worker keeps
+    using a single CPU.
+    """
 
-            # wait for simulation run to end
-            simengine.join()
+    overrides = getBranchOverrides(simParams)
 
-            # destroy singletons
-            simlog.destroy()
-            simengine.destroy()
-            Connectivity.Connectivity().destroy()
-            settings.destroy() # destroy last, Connectivity needs it
+    for run_id in range(first_run, first_run+numRuns):
 
         # printOrLog
-        output  = 'simulation ended after {0:.0f}s ({1} runs).'.format(
-            time.time()-simStartTime,
-            numRuns * len(simParams)
+        output  = 'run {0}/{1}, prefix'.format(
+           run_id+1-first_run,
+           numRuns
         )
         printOrLog(cpuID, pid, output, verbose)
 
+        # simulate the prefix with the settings of the first combination
+        singletons = createSingletons(
+            simconfig,
+            cpuID,
+            run_id,
+            simParams[0],
+            combinationKeys,
+            verbose
+        )
+        (settings, simlog, simengine) = singletons
+        if branchAt == 'converged':
+            slotframeLength = settings.tsch_slotframeLength
+            while (
+                    simengine.step(slotframeLength)
+                    and
+                    (not simengine.is_converged())
+                ):
+                pass
+        else:
+            simengine.run_until(branchAt)
+
+        if simengine.simEnded:
+            # the run ended before the branch point: it's the complete run of
+            # the first combination; run the others from scratch
+            destroySingletons(*singletons)
+            for (simParamNum, simParam) in enumerate(simParams[1:], 1):
+                printOrLog(
+                    cpuID,
+                    pid,
+                    'run {0}/{1}, parameters {2}/{3}'.format(
+                        run_id+1-first_run,
+                        numRuns,
+                        simParamNum+1,
+                        len(simParams)
+                    ),
+                    verbose
+                )
+                singletons = createSingletons(
+                    simconfig,
+                    cpuID,
+                    run_id,
+                    simParam,
+                    combinationKeys,
+                    verbose
+                )
+                (settings, simlog, simengine) = singletons
+                simengine.run()
+                destroySingletons(*singletons)
+            continue
+
+        # nothing buffered may be written twice, by the forked processes
+        simlog.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        log_offset = simlog.log_output_file.tell()
+
+        for (branch_id, override) in enumerate(overrides):
+
+            # printOrLog
+            output  = 'run {0}/{1}, parameters {2}/{3}'.format(
+               run_id+1-first_run,
+               numRuns,
+               branch_id+1,
+               len(simParams)
+            )
+            printOrLog(cpuID, pid, output, verbose)
+
+            child_pid = os.fork()
+            if child_pid == 0:
+                # simulate the rest of the run with the settings of the branch
+                try:
+                    simengine.branch(override, branch_id, log_offset)
+                    simengine.run()
+                    destroySingletons(*singletons)
+                    sys.stdout.flush()
+                except:
+                    traceback.print_exc()
+                    sys.stderr.flush()
+                    os._exit(1)
+                os._exit(0)
+
+            (_, status) = os.waitpid(child_pid, 0)
+            if status != 0:
+                raise RuntimeError(
+                    'run {0}, parameters {1}/{2} failed'.format(
+                        run_id,
+                        branch_id+1,
+                        len(simParams)
+                    )
+                )
+
+        # the prefix doesn't get simulated any further
+        destroySingletons(*singletons)
+
+def runSimulation(params):
+    """
+    Runs one simulation of one combination, and returns its summary: the
+    value of each KPI of params['kpis'] over the run (see
+    SteadyState.KpiObserver). In a worker of the adaptive replication, the
+    cpuID is the one of the worker.
+    """
+
+    cpuID              = params['cpuID']
+    if cpuID is None:
+        cpuID          = workerCpuID
+    simParamNum        = params['simParamNum']
+    run_id             = params['run_id']
+    kpis               = params['kpis']
+    config_data        = params['config_data']
+
+    simconfig = SimConfig.SimConfig(configdata=config_data)
+    (combinationKeys, simParams) = getSimParams(simconfig)
+
+    # as createSingletons(), with the KPIs collected from the logs as they
+    # are written, from the setup of the motes on
+    settings         = SimSettings.SimSettings(
+        cpuID=cpuID,
+        run_id=run_id,
+        **simParams[simParamNum]
+    )
+    settings.setLogDirectory(simconfig.get_log_directory_name())
+    settings.setCombinationKeys(combinationKeys)
+    simlog           = SimLog.SimLog()
+    simlog.set_log_filters(simconfig.logging)
+    collector        = Kpis.KpiCollector(simlog)
+    simengine        = SimEngine.SimEngine(run_id=run_id, verbose=False)
+    simengine.run()
+    counters = SteadyState.KpiObserver(simengine, collector).get_counters()
+    destroySingletons(settings, simlog, simengine)
+
+    summary = dict([(kpi, counters.get_metric(kpi)) for kpi in kpis])
+    return (simParamNum, run_id, summary)
+
+workerCpuID = None
+def initAdaptiveWorker(cpuIDs):
+    # each worker writes its own log files
+    global workerCpuID
+    workerCpuID = cpuIDs.get()
+
+def getNumRunsOfWave(summaries, active, numRuns, maxRuns, numCPUs):
+    """
+    Returns the number of runs of the next wave of each active combination:
+    numRuns for the first wave, then enough to keep the CPUs busy, split
+    among the combinations which still need runs, up to maxRuns.
+    """
+    numRunsOfWave = {}
+    for simParamNum in active:
+        if summaries[simParamNum]:
+            runs = max(1, numCPUs // len(active))
+        else:
+            runs = numRuns
+        numRunsOfWave[simParamNum] = min(
+            runs,
+            maxRuns - len(summaries[simParamNum])
+        )
+    return numRunsOfWave
+
+def isPreciseEnough(summaries, kpis, precision):
+    """
+    Returns whether the confidence interval of the mean of each KPI over the
+    runs of a combination is within precision (relative) of the mean.
+    """
+    for kpi in kpis:
+        values = [
+            summary[kpi] for summary in summaries
+            if summary[kpi] is not None
+        ]
+        if (len(values) < 2) or (not SteadyState.is_precise(values, precision)):
+            return False
+    return True
+
+def runAdaptiveSimCombinations(simconfig, numCPUs):
+    """
+    Runs the simulations of all the combinations in waves, until the KPIs
+    of execution.adaptiveRuns['kpis'] of each combination are known with
+    the relative precision adaptiveRuns['precision'], or the combination
+    has had adaptiveRuns['maxRuns'] runs. The first wave runs
+    execution.numRuns runs of every combination; the next ones spread the
+    CPUs over the combinations still needing runs.
+
+    Returns the number of runs and the KPIs of every combination.
+    """
+
+    adaptiveRuns = simconfig.execution.adaptiveRuns
+    kpis         = adaptiveRuns['kpis']
+    precision    = adaptiveRuns['precision']
+    maxRuns      = adaptiveRuns['maxRuns']
+    for kpi in kpis:
+        if kpi not in SteadyState.METRICS:
+            raise ValueError('unsupported KPI: {0}'.format(kpi))
+
+    (combinationKeys, simParams) = getSimParams(simconfig)
+    summaries = [[] for _ in simParams]  # per run, indexed by simParamNum
+    active    = list(range(len(simParams)))
+
+    if numCPUs == 1:
+        pool    = None
+        cpuID   = 0
+    else:
+        cpuIDs  = multiprocessing.Queue()
+        for cpuID in range(numCPUs):
+            cpuIDs.put(cpuID)
+        pool    = multiprocessing.Pool(
+            numCPUs,
+            initializer = initAdaptiveWorker,
+            initargs    = (cpuIDs,)
+        )
+        cpuID   = None
+
+    try:
+        wave = 0
+        while active:
+            wave += 1
+
+            # list the runs of the wave
+            numRunsOfWave = getNumRunsOfWave(
+                summaries,
+                active,
+                simconfig.execution.numRuns,
+                maxRuns,
+                numCPUs
+            )
+            tasks = []
+            for simParamNum in active:
+                first_run = len(summaries[simParamNum])
+                for run_id in range(
+                        first_run,
+                        first_run + numRunsOfWave[simParamNum]
+                    ):
+                    tasks += [
+                        {
+                            'cpuID':       cpuID,
+                            'simParamNum': simParamNum,
+                            'run_id':      run_id,
+                            'kpis':        kpis,
+                            'config_data': simconfig.get_config_data(),
+                        }
+                    ]
+            print('wave {0}: {1} runs of {2} combinations'.format(
+                wave,
+                len(tasks),
+                len(active)
+            ))
+
+            # run them
+            if pool is None:
+                results = [runSimulation(task) for task in tasks]
+            else:
+                results = pool.map(runSimulation, tasks)
+            for (simParamNum, run_id, summary) in sorted(
+                    results,
+                    key=lambda result: (result[0], result[1])
+                ):
+                summaries[simParamNum] += [summary]
+
+            # keep the combinations which need more runs
+            active = [
+                simParamNum for simParamNum in active
+                if (
+                    (len(summaries[simParamNum]) < maxRuns)
+                    and
+                    (not isPreciseEnough(summaries[simParamNum], kpis, precision))
+                )
+            ]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # summarize
+    results = []
+    for (simParam, runSummaries) in zip(simParams, summaries):
+        result = {
+            'combination': dict([(k, simParam[k]) for k in combinationKeys]),
+            'numRuns':     len(runSummaries),
+            'kpis':        {},
+        }
+        for kpi in kpis:
+            values = [
+                summary[kpi] for summary in runSummaries
+                if summary[kpi] is not None
+            ]
+            (mean, half_width) = (None, None)
+            if values:
+                (mean, half_width) = SteadyState.batch_means_interval(values)
+                if math.isinf(half_width):
+                    half_width = None
+            result['kpis'][kpi] = {'mean': mean, 'half_width': half_width}
+        results += [result]
+        print('{0}: {1} runs, {2}'.format(
+            result['combination'],
+            result['numRuns'],
+            result['kpis']
+        ))
+    return results
+
 keep_printing_progress = True
 def printProgressPerCpu(cpuIDs, pid, clear_console=True):
     while keep_printing_progress:
@@ -187,6 +609,23 @@ def merge_output_files(folder_path):
                     config = json.loads(inputfile.readline())
                     outputfile.write(json.dumps(config) + "\n")
                     outputfile.write(inputfile.read())
+
+        # merge the profiling reports, if any
+        profile_path_list = sorted(
+            glob.glob(
+                os.path.join(
+                    folder_path,
+                    subfolder.replace('[', '[[]'),
+                    'profile_cpu*.json'
+                )
+            )
+        )
+        if profile_path_list:
+            EngineProfiler.merge_report_files(
+                profile_path_list,
+                os.path.join(folder_path, subfolder + ".profile.json")
+            )
+
         shutil.rmtree(os.path.join(folder_path, subfolder))
 
 # =========================== main ============================================
@@ -213,7 +652,17 @@ def main():
         numCPUs = simconfig.execution.numCPUs
     assert numCPUs <= max_numCPUs
 
-    if numCPUs == 1:
+    # compile the connectivity traces shared by the runs
+    compileTraces(simconfig)
+
+    adaptiveRunsResults = None
+    if simconfig.execution.get('adaptiveRuns') is not None:
+        # as many runs as needed, combination by combination
+        if simconfig.execution.get('branchAt') is not None:
+            raise ValueError('branchAt and adaptiveRuns are exclusive')
+        adaptiveRunsResults = runAdaptiveSimCombinations(simconfig, numCPUs)
+
+    elif numCPUs == 1:
         # run on single CPU
 
         runSimCombinations({
@@ -306,6 +755,11 @@ def main():
     with open(os.path.join(folder_path, 'config.json'), 'w') as f:
         f.write(simconfig.get_config_data())
 
+    # save the number of runs and the KPIs of each combination
+    if adaptiveRunsResults is not None:
+        with open(os.path.join(folder_path, 'adaptiveRuns.json'), 'w') as f:
+            json.dump(adaptiveRunsResults, f, indent=4)
+
     #=== post-simulation actions
 
     if simconfig.log_directory_name == 'hostname':